@@ -4,13 +4,13 @@ Datapizza Christmas AI Challenge 2025
 """
 
 import streamlit as st
+import altair as alt
+import pandas as pd
 import sys
-import json
-import re
 import uuid
+from contextlib import closing
 from pathlib import Path
-from pydantic import TypeAdapter, ValidationError
-from streamlit.runtime.scriptrunner import RerunException
+from streamlit.runtime.scriptrunner import RerunException, get_script_run_ctx
 from streamlit.runtime.scriptrunner.script_runner import StopException
 
 # Setup path per importare src
@@ -21,23 +21,134 @@ from src.config import PAGE_CONFIG, DATA_DIR, ICONS
 from src.template_manager import TEMPLATES
 from src.database import SessionManager
 from src.utils import save_uploaded_file
+from src.upload_store import get_upload_store
+from src.code_cache import get_code_cache
+from src.http_pool import get_http_pool
+from src.llm_cache import get_llm_cache
 from src.memory_manager import ConversationMemoryManager
-from src.agents.factory import create_multi_agent_system
-from src.models import Sostituzione
-from src.config import CODE_MODEL, EXPLAINER_MODEL, NARRATOR_MODEL, ORCHESTRATOR_MODEL
+from src.session_registry import get_session_registry
+from src.agents.factory import agent_system, get_agent_system_pool
+from src.agents.router import UNKNOWN, Route
+from src.config import CODE_MODEL, EXPLAINER_MODEL, NARRATOR_MODEL, ORCHESTRATOR_MODEL, UI_STREAMING_ENABLED, NARRATION_MODE, ROUTER_ENABLED
+from src.narration import template_narration
+from src.run_context import request_scope
+from src.run_events import ERROR, FINAL, STATUS, STEP, TOKEN, stream_agent_call, stream_agent_run
+from src.tracing import record_error, request_trace, span, waterfall
 
 # Configurazione pagina
 st.set_page_config(**PAGE_CONFIG)
 
-# Inizializza ID sessione univoco
+def session_id_from_url(value):
+    """ID di sessione dall'URL, solo se è un UUID valido (finisce in path e chiavi del backend)"""
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+# Inizializza ID sessione univoco (nell'URL: un reload riprende la stessa sessione dal backend)
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    st.session_state.session_id = session_id_from_url(st.query_params.get("sid")) or str(uuid.uuid4())
+    st.query_params["sid"] = st.session_state.session_id
 
 session_id = st.session_state.session_id
 
+# Budget di memoria delle sessioni: ripristina questa se era stata scaricata, scarica le inattive
+run_ctx = get_script_run_ctx()
+if run_ctx is not None:
+    get_session_registry().enter(session_id, run_ctx.session_state)
+
 # Inizializza managers
-session = SessionManager()
-memory_manager = ConversationMemoryManager()
+session = SessionManager(session_id)
+memory_manager = ConversationMemoryManager(session_id)
+
+# ========================================
+# STREAMING RISPOSTA
+# ========================================
+
+# Stato mostrato quando un agente inizia a lavorare
+AGENT_LABELS = {
+    "orchestrator": "🎅 Babbo Natale legge la richiesta...",
+    "code_generator": "🧝 Calcolo delle sostituzioni...",
+    "explainer": "🔎 Preparazione della spiegazione...",
+    "narrator": "📖 Narrazione in corso...",
+}
+
+
+def run_with_streaming(events):
+    """
+    Mostra l'avanzamento di una run (agenti, tentativi in sandbox) e il testo
+    della risposta man mano che arriva.
+
+    Args:
+        events: Eventi da `stream_agent_run` (orchestrator) o `stream_agent_call` (specialist)
+
+    Returns:
+        (StepResult finale, placeholder in cui è stata scritta la risposta)
+    """
+    status = st.status("Babbo Natale sta pensando...", expanded=False)
+    answer = st.empty()
+    texts = {}
+
+    # La run termina (e libera le sue risorse) prima di uscire, anche se
+    # l'esecuzione dello script viene interrotta da un rerun
+    with closing(events):
+        for event in events:
+            if event.kind == STEP and event.data.get("step") == 1 and event.agent in AGENT_LABELS:
+                status.update(label=AGENT_LABELS[event.agent])
+                status.write(AGENT_LABELS[event.agent])
+            elif event.kind == STATUS:
+                status.update(label=event.message)
+                status.write(f"• {event.message}")
+            elif event.kind == TOKEN:
+                # Si mostra il testo dell'ultimo agente che sta scrivendo (narrator, poi orchestrator)
+                texts[event.agent] = texts.get(event.agent, "") + event.message
+                answer.markdown(texts[event.agent] + "▌")
+            elif event.kind == ERROR:
+                status.update(label="❌ Errore durante l'elaborazione", state="error")
+                raise event.error
+            elif event.kind == FINAL:
+                status.update(label="✅ Risposta pronta", state="complete")
+                return event.result, answer
+
+
+def narrate_substitutions(system, prompt, substitutions, placeholder):
+    """
+    Storia delle sostituzioni generata dopo aver mostrato la tabella
+    (NARRATION_MODE "background" o "template"). Se il narrator fallisce
+    si usa la narrazione a modello.
+
+    Returns:
+        Testo della storia, già scritto nel placeholder
+    """
+    if NARRATION_MODE == "template":
+        story = template_narration(substitutions)
+        placeholder.markdown(story)
+        return story
+
+    narrator = system.narrator_agent
+    task = f"Crea una storia sulle sostituzioni appena calcolate. Richiesta dell'utente: {prompt}"
+    try:
+        if UI_STREAMING_ENABLED:
+            story = ""
+            with closing(stream_agent_run(narrator, narrator.with_data(task))) as events:
+                for event in events:
+                    if event.kind == TOKEN:
+                        story += event.message
+                        placeholder.markdown(story + "▌")
+                    elif event.kind == ERROR:
+                        raise event.error
+                    elif event.kind == FINAL and event.result is not None:
+                        story = event.result.text
+        else:
+            story = narrator.run(task).text
+    except Exception as e:
+        print(f"⚠️ Narrazione LLM fallita, uso quella a modello: {e}")
+        story = template_narration(substitutions)
+
+    placeholder.markdown(story)
+    return story
+
 
 # ========================================
 # STEP 1: SETUP PANEL
@@ -83,6 +194,10 @@ if not session.is_configured():
 # ========================================
 else:
     st.title("🎄 Gestione Emergenze fabbrica giocattoli Polo Nord 🧝")
+
+    # Sessione attiva (o ripresa con ?sid=): riferimento al file rinnovato a ogni rerun
+    if not get_upload_store(DATA_DIR).attach(session_id, session.get('file_path')):
+        st.warning("⚠️ Il file Excel di questa sessione non è più disponibile: usa 'Reset' e ricaricalo.")
     
     # ---------------------------------------------------------
     # SIDEBAR
@@ -94,6 +209,9 @@ else:
         if st.button("⚙️ Reset e modifica configurazione", use_container_width=True):
             session.reset()
             memory_manager.clear_all()
+            # Il file caricato resta nell'archivio finché il GC non lo reclama
+            get_upload_store(DATA_DIR).release(session_id)
+            get_session_registry().discard(session_id)
             st.rerun()
         
         st.markdown("---")
@@ -121,8 +239,45 @@ else:
             with st.expander("🧪 Session State"):
                 st.json(session.get_all())
             
+            with st.expander("⚡ Cache Codice"):
+                st.json(get_code_cache().stats())
+
+            with st.expander("🔁 Pool Agenti"):
+                st.json(get_agent_system_pool().stats())
+
+            with st.expander("🌐 Connessioni LLM"):
+                st.json(get_http_pool().stats())
+
+            if get_llm_cache().enabled:
+                with st.expander("🧠 Cache Risposte LLM"):
+                    st.json(get_llm_cache().stats())
+
+            with st.expander("🗂️ Sessioni in Memoria"):
+                st.json(get_session_registry().stats())
+
+            with st.expander("⏱️ Trace Ultima Richiesta"):
+                rows = waterfall(st.session_state.get("last_trace_id", 0))
+                if rows:
+                    df_trace = pd.DataFrame(rows)
+                    df_trace["fine_ms"] = df_trace["inizio_ms"] + df_trace["durata_ms"]
+                    # Etichette univoche: lo stesso span (es. un passo) può ripetersi
+                    df_trace["riga"] = [f"{i + 1}. {name.strip()}" for i, name in enumerate(df_trace["span"])]
+                    chart = alt.Chart(df_trace).mark_bar().encode(
+                        x=alt.X("inizio_ms", title="ms"),
+                        x2="fine_ms",
+                        y=alt.Y("riga", sort=None, title=None),
+                        color="tipo",
+                        tooltip=["span", "durata_ms", "stato", "dettagli"]
+                    )
+                    st.altair_chart(chart, use_container_width=True)
+                    st.dataframe(df_trace.drop(columns=["fine_ms", "riga"]), hide_index=True)
+                else:
+                    st.caption("Nessuna richiesta tracciata (ENABLE_TRACING=false o nessuna richiesta ancora)")
+
             with st.expander("🧠 Memory Info"):
                 st.write(f"Conversazione: {memory_manager.get_conversation_length()} turni")
+                st.write("Token (conversazione completa / vista per gli agenti):")
+                st.json(memory_manager.get_token_stats())
 
                 try:
                     # Recupera l'oggetto memory grezzo
@@ -141,16 +296,22 @@ else:
     # ---------------------------------------------------------
     # Chat UI
     # ---------------------------------------------------------
-    if st.session_state.messages == []:
+    if session.get_messages() == []:
         # Salva in chat history
         message_data = {
             "role": "assistant",
             "content": "🎄Ho! Ho! Ho! Sono Babbo Natale! Benvenuto nella mia fabbrica! Qui tra un regalo 🎁 e una pizza 🍕 c'è sempre un po' di trambusto. Dimmi pure, quale intoppo sta preoccupando i miei elfi oggi?"
         }
-        st.session_state.messages.append(message_data)
+        session.add_message(message_data)
+
+    # Messaggi più vecchi caricati solo su richiesta
+    if session.has_older_messages():
+        if st.button("⬆️ Mostra messaggi precedenti"):
+            session.load_older_messages()
+            st.rerun()
     
     # Mostra messaggi precedenti
-    for msg in st.session_state.messages:
+    for msg in session.get_messages():
         # Seleziona l'icona in base al ruolo del messaggio
         avatar_icon = ICONS.get(msg["role"]) 
         with st.chat_message(msg["role"], avatar=avatar_icon):
@@ -165,37 +326,30 @@ else:
     # Input utente
     if prompt := st.chat_input("Es: Ciao, per favore dammi le sostituzioni per martedì"):
         # Aggiungi messaggio utente
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        session.add_message({"role": "user", "content": prompt})
         
         with st.chat_message("user", avatar=ICONS["user"]):
             st.markdown(prompt)
         
         with st.chat_message("assistant", avatar=ICONS["assistant"]):
-            with st.spinner("Babbo Natale sta pensando..."):
+            # Sessione occupata per tutta la richiesta: il registro non la scarica
+            with get_session_registry().busy(session_id), st.spinner("Babbo Natale sta pensando..."), \
+                    request_trace("richiesta", session_id=session_id) as current_trace:
+                # Waterfall mostrata in debug dopo il rerun
+                st.session_state.last_trace_id = current_trace.trace_id
                 try:
                     # =========================================
-                    # CREA ORCHESTRATOR CON MEMORY
+                    # CONTESTO PER L'ORCHESTRATOR
                     # =========================================
                     from src.config import OPENAI_API_KEY
                     
-                    memory = memory_manager.get_memory()
+                    # Vista a budget di token, presa prima del messaggio corrente (già nel task dell'orchestrator)
+                    memory = memory_manager.get_context_memory()
 
                     prev_subst = ""                
                     if memory_manager.has_substitutions():
-                        prev_subst = memory_manager.get_substitutions_summary()
-
-                    orchestrator = create_multi_agent_system(
-                        api_key=OPENAI_API_KEY,
-                        code_model= CODE_MODEL,
-                        explainer_model= EXPLAINER_MODEL,
-                        narrator_model= NARRATOR_MODEL,
-                        orchestrator_model= ORCHESTRATOR_MODEL,
-                        memory=memory,
-                        file_path=session.get('file_path'),
-                        structure=session.get('struttura'),
-                        rules=session.get('regole'),
-                        prev_subst=prev_subst
-                    )
+                        # Solo le sostituzioni pertinenti a elfi, giorni e ore citati nella richiesta
+                        prev_subst = memory_manager.get_substitutions_summary(request=prompt)
                     
                     # =========================================
                     # COSTRUISCI PROMPT CON CONTEXT
@@ -216,9 +370,47 @@ RICHIESTA UTENTE:
                     memory_manager.add_user_message(prompt)
                     
                     # =========================================
-                    # CHIAMA ORCHESTRATOR
+                    # CHIAMA ORCHESTRATOR (grafo riusato dal pool)
                     # =========================================
-                    response = orchestrator.run(full_prompt)
+                    system_kwargs = dict(
+                        api_key=OPENAI_API_KEY,
+                        code_model= CODE_MODEL,
+                        explainer_model= EXPLAINER_MODEL,
+                        narrator_model= NARRATOR_MODEL,
+                        orchestrator_model= ORCHESTRATOR_MODEL,
+                        file_path=session.get('file_path'),
+                        structure=session.get('struttura'),
+                        rules=session.get('regole'),
+                        prev_subst=prev_subst,
+                        prev_substitutions=memory_manager.get_all_substitutions()
+                    )
+                    with agent_system(**system_kwargs) as system, request_scope() as outcome:
+                        # Le sostituzioni validate arrivano in outcome, non nel testo della risposta
+                        orchestrator = system.orchestrator
+                        # Router: risposte pronte e specialist diretti senza passare da gpt-4o
+                        route = Route(UNKNOWN)
+                        if ROUTER_ENABLED:
+                            with span("router", kind="router") as router_span:
+                                route = system.router.route(prompt, has_substitutions=memory_manager.has_substitutions())
+                                router_span.set_attribute("intent", route.intent)
+                                router_span.set_attribute("source", route.source)
+                        specialist = system.specialist(route.intent)
+                        if debug_mode:
+                            st.info(f"🧭 Intento: {route.intent} ({route.source}) → {'risposta pronta' if route.reply else specialist.name if specialist else 'orchestrator'}")
+
+                        response = None
+                        answer_placeholder = None
+                        if route.reply:
+                            pass
+                        elif specialist is not None:
+                            if UI_STREAMING_ENABLED:
+                                response, answer_placeholder = run_with_streaming(stream_agent_call(specialist, prompt))
+                            else:
+                                response = specialist.run(prompt)
+                        elif UI_STREAMING_ENABLED:
+                            response, answer_placeholder = run_with_streaming(stream_agent_run(orchestrator, full_prompt, memory=memory))
+                        else:
+                            response = orchestrator.run(full_prompt, memory=memory)
                     
                     if debug_mode:
                         st.write("🔍 Raw response:")
@@ -228,78 +420,78 @@ RICHIESTA UTENTE:
                     # ESTRAI RISPOSTA
                     # =========================================
                     #response_text = str(response)
-                    raw_text = response.text
-                    response_text = raw_text
-                    
-                    # Cerca JSON
-                    json_match = re.search(r'\[.*?\]', raw_text, re.DOTALL)
-
-                    # Pulisci il testo per l'utente (Rimuovi il JSON)
-                    #if json_match:
-                        # Sostituisci il blocco JSON trovato con una stringa vuota
-                    #    clean_text = raw_text.replace(json_match.group(), "").strip()
-                        
-                        # Opzionale: Rimuovi eventuali frasi di accompagnamento tipo "Ecco il JSON:"
-                        # clean_text = re.sub(r'Ecco i dati tecnici:?', '', clean_text, flags=re.IGNORECASE).strip()
-                        
-                    #    response_out = clean_text
-                    #else:
-                    #    response_out = raw_text
+                    if route.reply:
+                        response_text = route.reply
+                    elif specialist is system.code_agent:
+                        # Il riepilogo del code generator è per l'orchestrator, non per l'utente
+                        response_text = ""
+                    else:
+                        response_text = response.text if response is not None else ""
+                    validated_subs = outcome.substitutions
+
+                    # Con la narrazione fuori dal percorso critico la run termina dopo il calcolo, senza testo
+                    if not response_text.strip():
+                        if validated_subs:
+                            response_text = f"🎅 Ho Ho Ho! Ecco le {len(validated_subs)} sostituzioni calcolate:"
+                        else:
+                            response_text = (
+                                "🎅 Oh oh oh! Non sono riuscito a calcolare le sostituzioni: "
+                                "verifica il file Excel o prova a riformulare la richiesta."
+                            )
 
                     # =========================================
                     # MOSTRA RISPOSTA
                     # =========================================
-                    st.markdown(response_text)
+                    if answer_placeholder is not None:
+                        answer_placeholder.markdown(response_text)
+                    else:
+                        st.markdown(response_text)
                     
                     # =========================================
-                    # PARSING JSON SOSTITUZIONI (se presenti)
+                    # SOSTITUZIONI STRUTTURATE (fuori banda)
                     # =========================================
-                    substitutions_data = []
-                    
-                    # Cerca JSON nel formato [...]
-                    #json_match = re.search(r'\[.*?\]', response_text, re.DOTALL)
-                    if json_match:
+                    substitutions_data = [s.model_dump() for s in validated_subs]
+
+                    if substitutions_data:
                         if debug_mode:
-                            print("--- JSON TROVATO ---")
-                            print(json_match.group())
+                            print(f"--- SOSTITUZIONI RICEVUTE: {len(validated_subs)} items ---")
                         try:
-                            json_str = json_match.group()
-                            # Valida con Pydantic
-                            adapter = TypeAdapter(list[Sostituzione])
-                            validated_subs = adapter.validate_json(json_str)
-                            if debug_mode:
-                                print(f"--- VALIDAZIONE OK: {len(validated_subs)} items ---")
-                            substitutions_data = [s.model_dump() for s in validated_subs]
-                            
-                            if substitutions_data:
-                                try:
-                                    # Salva in memory manager
-                                    memory_manager.save_calculation_context(
-                                        request=prompt,
-                                        substitutions=validated_subs
-                                    )
-                                    if debug_mode:
-                                        st.success(f"💾 Salvate {len(substitutions_data)} sostituzioni in memoria")
-                                except Exception as e:
-                                    print(f"--- ERRORE Salvataggio: {e} ---") #-#
-
-                                # Mostra dettagli tecnici
-                                with st.expander("📊 Dettagli Tecnici Sostituzioni"):
-                                    st.dataframe(substitutions_data)
-                                
-                                # Metrics
-                                col1, col2, col3 = st.columns(3)
-                                with col1:
-                                    st.metric("Sostituzioni", len(substitutions_data))
-                                with col2:
-                                    st.metric("Stato", "✅ Completato")
-                                with col3:
-                                    st.metric("Template", session.get("template", "N/A"))
-                        
-                        except (json.JSONDecodeError, ValidationError) as e:
+                            # Salva in memory manager
+                            report = memory_manager.save_calculation_context(
+                                request=prompt,
+                                substitutions=validated_subs
+                            )
+                            for conflict in report.conflicts:
+                                st.warning(f"⚠️ Conflitto: {conflict}")
                             if debug_mode:
-                                st.warning(f"⚠️ JSON trovato ma non valido: {e}")
-                    
+                                st.success(
+                                    f"💾 Storico: {report.added} nuove, {report.duplicates} già presenti, "
+                                    f"{report.superseded} aggiornate"
+                                )
+                        except Exception as e:
+                            print(f"--- ERRORE Salvataggio: {e} ---") #-#
+
+                        # Mostra dettagli tecnici (aperti se la storia arriva dopo)
+                        with st.expander("📊 Dettagli Tecnici Sostituzioni", expanded=NARRATION_MODE != "inline"):
+                            st.dataframe(substitutions_data)
+
+                        # Metrics
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Sostituzioni", len(substitutions_data))
+                        with col2:
+                            st.metric("Stato", "✅ Completato")
+                        with col3:
+                            st.metric("Template", session.get("template", "N/A"))
+
+                        # Storia generata dopo la tabella: il calcolo non la aspetta
+                        if NARRATION_MODE != "inline":
+                            story_placeholder = st.empty()
+                            with agent_system(**system_kwargs) as system, request_scope(outcome):
+                                story = narrate_substitutions(system, prompt, validated_subs, story_placeholder)
+                            if story:
+                                response_text = f"{response_text}\n\n{story}"
+
                     # =========================================
                     # AGGIUNGI ASSISTANT MESSAGE A MEMORY
                     # =========================================
@@ -313,7 +505,7 @@ RICHIESTA UTENTE:
                     if substitutions_data:
                         message_data["substitutions_data"] = substitutions_data
                     
-                    st.session_state.messages.append(message_data)
+                    session.add_message(message_data)
                     
                     st.rerun()
 
@@ -321,6 +513,7 @@ RICHIESTA UTENTE:
                     raise
 
                 except Exception as e:
+                    record_error(e)
                     error_msg = f"❌ Errore sistema: {str(e)}"
                     st.error(error_msg)
                     
@@ -328,7 +521,7 @@ RICHIESTA UTENTE:
                         import traceback
                         st.code(traceback.format_exc())
                     
-                    st.session_state.messages.append({
+                    session.add_message({
                         "role": "assistant",
                         "content": error_msg
                     })
\ No newline at end of file
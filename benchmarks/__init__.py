@@ -0,0 +1 @@
+"""Benchmark offline della Fabbrica degli Elfi (vedi benchmarks/run.py)"""
@@ -0,0 +1,298 @@
+"""
+Test differenziale del codice generato contro il solver di riferimento.
+
+Per ogni dimensione genera orari sintetici (`benchmarks/synthetic.py`), li
+carica come farebbe la UI (archivio, copia colonnare, indice) e per un
+campione di richieste confronta l'output di `calcola_sostituzioni`, eseguito
+con l'esecutore configurato tramite `run_generated_code`, con quello di
+`StandardFactorySolver`. Per ogni richiesta registra:
+
+- correttezza: assenze mancanti o in più rispetto al riferimento, sostituti
+  non ammessi dalle regole (non Jolly, non in pausa pizza, non Verde dello
+  stesso reparto) o usati due volte nella stessa ora, sostituti diversi dal
+  riferimento (ammessi, ma con un'altra scelta a parità di regole);
+- tempi: solver di riferimento, esecuzione completa e sola
+  `calcola_sostituzioni` (dai `timings` del wrapper).
+
+Programmi confrontati: quello scriptato del benchmark, i file passati con
+`--code` e, con `--code-cache`, i programmi in cache generati per le regole
+del template di default.
+
+Uso (dalla radice del progetto):
+    python -m benchmarks.differential --elves 13 100 500 1000 --weeks 2
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.run import percentile
+from benchmarks.scenarios import SCRIPTED_CODE
+from benchmarks.synthetic import ScheduleGenerator
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_TEMPLATE = "Fabbrica Giocattoli Standard"
+
+
+def configure_environment(executor: str) -> None:
+    """Variabili lette da src/config.py all'import: vanno impostate prima"""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["EXECUTOR_BACKEND"] = executor
+
+
+# ========================================
+# RICHIESTE E CONFRONTO
+# ========================================
+
+def request_cases(index, rng: np.random.Generator, count: int) -> List[Dict[str, Any]]:
+    """
+    Parametri di richieste realistiche, come li estrae `normalize_request`:
+    un giorno intero, un'ora di un giorno, un elfo assente in un'ora.
+    """
+    cases = []
+    for i in range(count):
+        day = index.days[int(rng.integers(len(index.days)))]
+        hour = int(rng.integers(1, index.max_hour + 1))
+        kind = i % 3
+        if kind == 0:
+            params = {"elfi": [], "giorni": [day], "ore": []}
+        elif kind == 1:
+            params = {"elfi": [], "giorni": [day], "ore": [hour]}
+        else:
+            working = [n for n in index.names if index.state_of(n, day, hour) == "assigned"]
+            elf = working[int(rng.integers(len(working)))] if working else index.names[0]
+            params = {"elfi": [elf], "giorni": [day], "ore": [hour]}
+        params.update(sostituzioni_precedenti=[], sostituti_occupati={}, assenze_coperte={})
+        cases.append(params)
+    return cases
+
+
+def compare_output(output: Any, reference, index) -> Dict[str, int]:
+    """
+    Confronta l'output di calcola_sostituzioni con le sostituzioni di riferimento.
+
+    Args:
+        output: Lista restituita dal codice (dizionari Sostituzione)
+        reference: Sostituzioni del solver di riferimento
+        index: Indice di disponibilità con le assenze della richiesta
+
+    Returns:
+        Conteggi: expected, missing, extra, invalid, different
+    """
+    from src.solvers.standard import day_code
+
+    names = set(index.names)
+
+    def substitute(value: Any) -> Optional[str]:
+        value = str(value or "").strip()
+        return value if value in names else None
+
+    expected = {(day_code(s.giorno), int(s.ora), s.assente): substitute(s.sostituto) for s in reference}
+    counts = {"expected": len(expected), "missing": 0, "extra": 0, "invalid": 0, "different": 0}
+    if not isinstance(output, list):
+        counts["missing"] = len(expected)
+        counts["invalid"] = 1
+        return counts
+
+    found: Dict[tuple, Optional[str]] = {}
+    used: Dict[tuple, set] = defaultdict(set)
+    for item in output:
+        try:
+            key = (day_code(item["giorno"]), int(item["ora"]), str(item["assente"]).strip())
+            chosen = substitute(item.get("sostituto"))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            counts["invalid"] += 1
+            continue
+        found[key] = chosen
+        if chosen is None:
+            continue
+        day, hour, absent = key
+        department = index.department_of(absent, day, hour) if absent in names else None
+        allowed = set(index.jolly(day, hour)) | set(index.pizza_break(day, hour))
+        if department is not None and index.hats[index.names.index(absent)].lower() == "rosso":
+            allowed |= set(index.same_department(day, hour, department, "Verde"))
+        if chosen == absent or chosen not in allowed or chosen in used[(day, hour)]:
+            counts["invalid"] += 1
+        used[(day, hour)].add(chosen)
+
+    counts["missing"] = len(expected.keys() - found.keys())
+    counts["extra"] = len(found.keys() - expected.keys())
+    counts["different"] = sum(1 for k in expected.keys() & found.keys() if expected[k] != found[k])
+    return counts
+
+
+# ========================================
+# ESECUZIONE
+# ========================================
+
+def upload(df: pd.DataFrame, session_id: str) -> Path:
+    """Salva un orario come un upload della UI (con copia colonnare e indice)"""
+    from src.config import DATA_DIR
+    from src.utils import save_uploaded_file
+
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    buffer.name = "orario_sintetico.xlsx"
+    return save_uploaded_file(buffer, DATA_DIR, session_id)
+
+
+def load_candidates(code_files: List[Path], from_cache: bool) -> Dict[str, str]:
+    """Programmi da confrontare, per nome"""
+    candidates = {"scripted": SCRIPTED_CODE}
+    for path in code_files:
+        candidates[path.stem] = path.read_text(encoding="utf-8")
+    if from_cache:
+        from src.code_cache import get_code_cache, rules_fingerprint
+        from src.template_manager import TEMPLATES
+
+        template = TEMPLATES[DEFAULT_TEMPLATE]
+        rules_hash = rules_fingerprint(template["regole"], template["struttura"])
+        for program in get_code_cache().programs(rules_hash):
+            candidates[f"cache:{program['signature'] or program['key'][:8]}"] = program["code"]
+    return candidates
+
+
+def run_size(
+    elves: int,
+    departments: int,
+    args: argparse.Namespace,
+    candidates: Dict[str, str],
+    session_id: str
+) -> List[Dict[str, Any]]:
+    """Tutte le richieste di tutte le settimane per una dimensione; una riga per (programma, richiesta)"""
+    from src.solvers import extra_absences_from_params, solve_from_params
+    from src.solvers.standard import StandardFactorySolver
+    from src.tools import run_generated_code
+
+    generator = ScheduleGenerator(elves, departments, args.absence_rate, args.seed, days=args.days, hours=args.hours)
+    rows = []
+    for week, df in enumerate(generator.weeks(args.weeks), start=1):
+        path = upload(df, session_id)
+        start = time.perf_counter()
+        solver = StandardFactorySolver.from_dataframe(df)
+        build_ms = (time.perf_counter() - start) * 1000
+        rng = np.random.default_rng([args.seed, elves, week])
+
+        for params in request_cases(solver.index, rng, args.requests):
+            start = time.perf_counter()
+            reference = solve_from_params(solver, params).substitutions
+            reference_ms = (time.perf_counter() - start) * 1000
+            extras = extra_absences_from_params(solver, params)
+            index = solver.with_absences(extras).index if extras else solver.index
+
+            for name, code in candidates.items():
+                start = time.perf_counter()
+                result = json.loads(run_generated_code(code, path, params))
+                total_ms = (time.perf_counter() - start) * 1000
+                phases = (result.get("timings") or {}).get("phases") or {}
+                counts = compare_output(result.get("output"), reference, index) if result.get("success") else {
+                    "expected": len(reference), "missing": len(reference), "extra": 0, "invalid": 0, "different": 0
+                }
+                rows.append(dict(
+                    counts,
+                    program=name,
+                    elves=elves,
+                    departments=departments,
+                    week=week,
+                    params={k: params[k] for k in ("elfi", "giorni", "ore")},
+                    success=bool(result.get("success")),
+                    error=None if result.get("success") else str(result.get("error"))[:200],
+                    correct=bool(result.get("success")) and not (counts["missing"] or counts["extra"] or counts["invalid"]),
+                    exact=bool(result.get("success")) and not any(counts[k] for k in ("missing", "extra", "invalid", "different")),
+                    reference_build_ms=round(build_ms, 2),
+                    reference_ms=round(reference_ms, 2),
+                    total_ms=round(total_ms, 2),
+                    call_ms=(phases.get("calcola_sostituzioni") or {}).get("wall_ms"),
+                ))
+    return rows
+
+
+def summarize(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Una riga per (programma, dimensione): tassi di correttezza e tempi p50/max"""
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        groups[(row["program"], row["elves"], row["departments"])].append(row)
+
+    summary = []
+    for (program, elves, departments), group in groups.items():
+        calls = [r["call_ms"] for r in group if r["call_ms"] is not None]
+        summary.append({
+            "programma": program,
+            "elfi": elves,
+            "reparti": departments,
+            "richieste": len(group),
+            "assenze": sum(r["expected"] for r in group),
+            "corrette_%": round(100 * sum(r["correct"] for r in group) / len(group), 1),
+            "identiche_%": round(100 * sum(r["exact"] for r in group) / len(group), 1),
+            "mancanti": sum(r["missing"] for r in group),
+            "in_piu": sum(r["extra"] for r in group),
+            "non_ammesse": sum(r["invalid"] for r in group),
+            "diverse": sum(r["different"] for r in group),
+            "rif_p50_ms": round(percentile([r["reference_ms"] for r in group], 50), 2),
+            "codice_p50_ms": round(percentile(calls, 50), 2) if calls else None,
+            "codice_max_ms": round(max(calls), 2) if calls else None,
+            "totale_p50_ms": round(percentile([r["total_ms"] for r in group], 50), 2),
+        })
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Test differenziale del codice generato contro il solver di riferimento")
+    parser.add_argument("--elves", type=int, nargs="+", default=[13, 100, 500])
+    parser.add_argument("--departments", type=int, default=0, help="Reparti (0 = un reparto ogni 8 elfi, minimo 4)")
+    parser.add_argument("--absence-rate", type=float, default=0.05)
+    parser.add_argument("--weeks", type=int, default=1)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--hours", type=int, default=6)
+    parser.add_argument("--requests", type=int, default=6, help="Richieste per orario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--executor", default="local", help="Backend di esecuzione (local, forkserver)")
+    parser.add_argument("--code", type=Path, action="append", default=[], help="File con un calcola_sostituzioni da confrontare")
+    parser.add_argument("--code-cache", action="store_true", help="Confronta anche i programmi nella cache del codice")
+    parser.add_argument("--output", type=Path, help="File JSON con il dettaglio di ogni richiesta")
+    args = parser.parse_args(argv)
+
+    configure_environment(args.executor)
+    from src.config import DATA_DIR
+    from src.upload_store import get_upload_store
+
+    candidates = load_candidates(args.code, args.code_cache)
+    session_id = f"differential-{uuid.uuid4().hex[:8]}"
+    rows: List[Dict[str, Any]] = []
+    try:
+        for elves in args.elves:
+            departments = args.departments or max(4, elves // 8)
+            print(f"▶️ {elves} elfi, {departments} reparti, {args.weeks} settimane, {len(candidates)} programmi")
+            rows.extend(run_size(elves, departments, args, candidates, session_id))
+    finally:
+        get_upload_store(DATA_DIR).release(session_id)
+
+    summary = summarize(rows)
+    print()
+    print(pd.DataFrame(summary).to_string(index=False))
+    if args.output:
+        args.output.write_text(
+            json.dumps({"summary": summary, "requests": rows}, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+
+    failures = [r for r in rows if not r["correct"]]
+    for row in failures[:10]:
+        print(f"❌ {row['program']} ({row['elves']} elfi, settimana {row['week']}) {row['params']}: "
+              f"mancanti {row['missing']}, in più {row['extra']}, non ammesse {row['invalid']}"
+              + (f", errore: {row['error']}" if row["error"] else ""))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
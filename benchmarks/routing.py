@@ -0,0 +1,54 @@
+"""
+Controllo a tabella delle regole del router (`src/agents/router.py`).
+
+Ogni riga è un messaggio con l'intento atteso da `classify_by_rules`. La
+tabella copre i casi semplici e soprattutto le frasi miste: un'assenza con
+giorno/ora non deve mai finire in spiegazione o narrazione senza calcolo.
+
+Uso (dalla radice del progetto):
+    python -m benchmarks.routing
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# (messaggio, intento atteso)
+CASES: List[Tuple[str, str]] = [
+    ("Ciao Babbo Natale!", "greeting"),
+    ("Grazie mille, perfetto", "thanks"),
+    ("Che tempo fa domani? Piove?", "off_topic"),
+    ("Fulgor è assente martedì alla 3 ora, trova un sostituto", "compute"),
+    ("Dammi le sostituzioni per lunedì", "compute"),
+    ("Perché hai scelto proprio quell'elfo?", "explain"),
+    ("Raccontami una storia su quello che è successo", "narrate"),
+    # Frasi miste: calcolo più spiegazione/narrazione, decide l'orchestrator
+    ("Fulgor è assente lunedì perché ha l'influenza, trova un sostituto", "unknown"),
+    ("Fulgor manca mercoledì alla 3 ora, raccontalo come una fiaba", "unknown"),
+    ("Pigna è malata venerdì, spiegami chi la sostituisce", "unknown"),
+    ("Calcola le sostituzioni e raccontamele come una storia", "unknown"),
+    ("Scintilla è in ferie giovedì: narra come la fabbrica si organizza", "unknown"),
+]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("EXECUTOR_BACKEND", "local")
+    from src.agents.router import classify_by_rules
+
+    failures = 0
+    for text, expected in CASES:
+        actual = classify_by_rules(text)
+        ok = actual == expected
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {expected:<10} {actual:<10} {text}")
+    print(f"\n{len(CASES) - failures}/{len(CASES)} messaggi instradati come atteso")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
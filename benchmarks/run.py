@@ -0,0 +1,410 @@
+"""
+Benchmark end-to-end di latenza, offline.
+
+Esegue gli scenari di `benchmarks/scenarios.py` contro un LLM finto
+(`benchmarks/stub_llm.py`) e l'esecutore locale, su `app/assets/sample.xlsx`
+con il template di default. Due driver:
+
+- app: il percorso di richiesta di `app/main.py`, eseguito senza browser con
+  `streamlit.testing.v1.AppTest` (router, pool dei grafi, memoria, narrazione)
+- agents: `create_multi_agent_system` chiamato direttamente (grafo nuovo a
+  ogni richiesta, sempre tramite l'orchestrator)
+
+Le fasi vengono ricavate dagli span del tracing (`src/tracing.py`): per ogni
+scenario si riportano p50/p95/p99 per fase, token (stimati dal server finto,
+quindi stabili) e tentativi in sandbox. Con `--save-baseline` i risultati
+diventano il riferimento; altrimenti vengono confrontati col riferimento e
+ogni regressione fa terminare il processo con codice 1.
+
+Uso (dalla radice del progetto):
+    python -m benchmarks.run --iterations 20 --save-baseline
+    python -m benchmarks.run --iterations 20
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.scenarios import CUSTOM_RULES_SUFFIX, SCENARIOS, Scenario
+from benchmarks.stub_llm import StubLLMServer
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+APP_FILE = PROJECT_ROOT / "app" / "main.py"
+SAMPLE_FILE = PROJECT_ROOT / "app" / "assets" / "sample.xlsx"
+DEFAULT_TEMPLATE = "Fabbrica Giocattoli Standard"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+PERCENTILES = (50, 95, 99)
+TOTAL_PHASE = "totale"
+
+
+def configure_environment(base_url: str, executor: str) -> None:
+    """Variabili lette da src/config.py all'import: vanno impostate prima"""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["LLM_BASE_URL"] = base_url
+    os.environ["EXECUTOR_BACKEND"] = executor
+    os.environ["STATE_BACKEND"] = "memory"
+    os.environ["ENABLE_TRACING"] = "true"
+    os.environ["TRACE_EXPORTERS"] = "none"  # span solo in memoria
+    os.environ["ROUTER_MODEL"] = ""
+    os.environ["LLM_CACHE_MODE"] = "off"  # ogni iterazione deve arrivare allo stub
+
+
+# ========================================
+# METRICHE
+# ========================================
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile nearest-rank"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def phase_name(span_name: str) -> str:
+    """Nome della fase di uno span ('step code_generator#2' -> 'step code_generator')"""
+    if span_name.startswith("client."):
+        return "llm"
+    return span_name.split("#", 1)[0]
+
+
+def measure(trace_id: int, wall_ms: float) -> Dict[str, Any]:
+    """Metriche di una richiesta dagli span della sua trace"""
+    from src.tracing import request_spans
+
+    phases: Dict[str, float] = defaultdict(float)
+    sample = {"prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0, "attempts": 0}
+    for span in request_spans(trace_id):
+        name = phase_name(span.name)
+        if name == "richiesta":
+            continue
+        phases[name] += (span.end_time - span.start_time) / 1e6
+        attributes = span.attributes or {}
+        if "prompt_tokens_used" in attributes:
+            sample["llm_calls"] += 1
+            sample["prompt_tokens"] += int(attributes.get("prompt_tokens_used") or 0)
+            sample["completion_tokens"] += int(attributes.get("completion_tokens_used") or 0)
+        if span.name == "sandbox.attempt":
+            sample["attempts"] += 1
+    phases[TOTAL_PHASE] = wall_ms
+    sample["phases"] = dict(phases)
+    return sample
+
+
+def summarize(samples: List[Dict[str, Any]], errors: int) -> Dict[str, Any]:
+    """Percentili per fase e medie dei contatori di uno scenario"""
+    by_phase: Dict[str, List[float]] = defaultdict(list)
+    for sample in samples:
+        for name, value in sample["phases"].items():
+            by_phase[name].append(value)
+
+    def mean(key: str) -> float:
+        return round(sum(s[key] for s in samples) / len(samples), 2) if samples else 0.0
+
+    return {
+        "iterations": len(samples),
+        "errors": errors,
+        "phases": {
+            name: dict({f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES}, n=len(values))
+            for name, values in sorted(by_phase.items())
+        },
+        "prompt_tokens": mean("prompt_tokens"),
+        "completion_tokens": mean("completion_tokens"),
+        "llm_calls": mean("llm_calls"),
+        "attempts": mean("attempts"),
+    }
+
+
+# ========================================
+# DRIVER
+# ========================================
+
+class BenchSession:
+    """Sessione di benchmark: configurazione e stato tra i messaggi"""
+
+    def __init__(self, session_id: str, config: Dict[str, Any]):
+        self.session_id = session_id
+        self.config = config
+        self.app = None  # AppTest (driver app)
+        self.history: List[Dict[str, Any]] = []  # sostituzioni (driver agents)
+
+
+class AppDriver:
+    """Percorso di richiesta di app/main.py, eseguito con AppTest"""
+
+    name = "app"
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    def open(self, session: BenchSession) -> None:
+        from streamlit.testing.v1 import AppTest
+        from src.state_backend import get_state_backend
+
+        # La sessione riparte dal backend come dopo un reload: già configurata
+        get_state_backend().save_config(session.session_id, session.config)
+        session.app = AppTest.from_file(str(APP_FILE), default_timeout=self.timeout)
+        session.app.query_params["sid"] = session.session_id
+        session.app.run()
+        self._check(session)
+
+    def send(self, session: BenchSession, prompt: str) -> int:
+        session.app.chat_input[0].set_value(prompt).run()
+        self._check(session)
+        return session.app.session_state["last_trace_id"]
+
+    @staticmethod
+    def _check(session: BenchSession) -> None:
+        app = session.app
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        messages = app.session_state["messages"] if "messages" in app.session_state else []
+        if messages and str(messages[-1].get("content", "")).startswith("❌"):
+            raise RuntimeError(messages[-1]["content"])
+
+
+class AgentsDriver:
+    """Orchestrator di create_multi_agent_system, senza Streamlit"""
+
+    name = "agents"
+
+    def open(self, session: BenchSession) -> None:
+        pass
+
+    def send(self, session: BenchSession, prompt: str) -> int:
+        from src.agents.factory import create_multi_agent_system
+        from src.config import OPENAI_API_KEY
+        from src.run_context import request_scope
+        from src.tracing import request_trace
+
+        with request_trace("richiesta", session_id=session.session_id) as current, request_scope() as outcome:
+            orchestrator = create_multi_agent_system(
+                api_key=OPENAI_API_KEY,
+                file_path=session.config["file_path"],
+                structure=session.config["struttura"],
+                rules=session.config["regole"],
+                prev_substitutions=session.history,
+            )
+            orchestrator.run(f"\nRICHIESTA UTENTE:\n{prompt}\n")
+        session.history.extend(s.model_dump(mode="json") for s in outcome.substitutions)
+        return current.trace_id
+
+
+# ========================================
+# ESECUZIONE
+# ========================================
+
+def upload_sample(session_id: str) -> Path:
+    """Carica l'orario di esempio come farebbe il form di configurazione"""
+    from src.config import DATA_DIR
+    from src.utils import save_uploaded_file
+
+    uploaded = io.BytesIO(SAMPLE_FILE.read_bytes())
+    uploaded.name = SAMPLE_FILE.name
+    return save_uploaded_file(uploaded, DATA_DIR, session_id)
+
+
+def scenario_config(scenario: Scenario, file_path: Path) -> Dict[str, Any]:
+    from src.template_manager import TEMPLATES
+
+    template = TEMPLATES[DEFAULT_TEMPLATE]
+    rules = template["regole"] + (CUSTOM_RULES_SUFFIX if scenario.custom_rules else "")
+    return {
+        "file_path": str(file_path),
+        "file_name": SAMPLE_FILE.name,
+        "struttura": template["struttura"],
+        "regole": rules,
+        "template": DEFAULT_TEMPLATE,
+    }
+
+
+def run_scenario(
+    scenario: Scenario,
+    driver,
+    stub: StubLLMServer,
+    file_path: Path,
+    iterations: int,
+    warmup: int
+) -> Dict[str, Any]:
+    """Esegue uno scenario (ripetizioni di riscaldamento escluse dalle metriche)"""
+    from src.code_cache import get_code_cache, rules_fingerprint
+
+    config = scenario_config(scenario, file_path)
+    samples, errors = [], 0
+    for i in range(warmup + iterations):
+        session = BenchSession(str(uuid.uuid4()), config)
+        stub.llm.faults = 0
+        try:
+            driver.open(session)
+            for prompt in scenario.setup_prompts:
+                driver.send(session, prompt)
+            if scenario.cold:
+                get_code_cache().invalidate_rules(rules_fingerprint(config["regole"], config["struttura"]))
+            stub.llm.faults = scenario.faults
+
+            start = time.perf_counter()
+            trace_id = driver.send(session, scenario.prompt)
+            wall_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            errors += 1
+            print(f"⚠️ {scenario.name} #{i + 1}: {e}")
+            continue
+        if i >= warmup:
+            samples.append(measure(trace_id, wall_ms))
+    return summarize(samples, errors)
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    for name, summary in results["scenarios"].items():
+        print(f"\n=== {name} ({summary['iterations']} ripetizioni, {summary['errors']} errori) ===")
+        print(
+            f"token: {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion, "
+            f"chiamate LLM: {summary['llm_calls']}, tentativi sandbox: {summary['attempts']}"
+        )
+        print(f"{'fase':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for phase, stats in summary["phases"].items():
+            print(f"{phase:<36}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+
+
+# ========================================
+# CONFRONTO COL RIFERIMENTO
+# ========================================
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.25,
+    slack_ms: float = 20.0,
+    token_tolerance: float = 0.05
+) -> List[str]:
+    """
+    Regressioni rispetto al riferimento.
+
+    Args:
+        current: Risultati di questa esecuzione
+        baseline: Risultati di riferimento
+        tolerance: Aumento relativo ammesso del p95 di ogni fase
+        slack_ms: Aumento assoluto ammesso (evita falsi allarmi sulle fasi brevi)
+        token_tolerance: Aumento relativo ammesso dei token
+
+    Returns:
+        Descrizione di ogni regressione (vuota se nessuna)
+    """
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        summary = current["scenarios"].get(name)
+        if summary is None:
+            continue
+        if summary["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: {summary['errors']} errori (riferimento {base.get('errors', 0)})")
+        for phase, stats in base.get("phases", {}).items():
+            now = summary["phases"].get(phase)
+            if now is None:
+                continue
+            limit = stats["p95"] * (1 + tolerance) + slack_ms
+            if now["p95"] > limit:
+                regressions.append(
+                    f"{name} / {phase}: p95 {now['p95']:.1f} ms > {limit:.1f} ms "
+                    f"(riferimento {stats['p95']:.1f} ms)"
+                )
+        for key in ("prompt_tokens", "completion_tokens"):
+            limit = base.get(key, 0) * (1 + token_tolerance)
+            if summary[key] > limit:
+                regressions.append(f"{name}: {key} {summary[key]} > {limit:.0f} (riferimento {base.get(key, 0)})")
+        for key in ("llm_calls", "attempts"):
+            if summary[key] > base.get(key, 0):
+                regressions.append(f"{name}: {key} {summary[key]} (riferimento {base.get(key, 0)})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end offline della Fabbrica degli Elfi")
+    parser.add_argument("--driver", choices=("app", "agents"), default="app")
+    parser.add_argument("--scenario", action="append", help="Scenari da eseguire (default: tutti)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--executor", default="local", help="Backend di esecuzione (local, forkserver)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latenza simulata di ogni chiamata LLM")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout di un messaggio (driver app)")
+    parser.add_argument("--output", type=Path, help="File JSON in cui salvare i risultati")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Salva i risultati come riferimento")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--slack-ms", type=float, default=20.0)
+    parser.add_argument("--token-tolerance", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if not scenarios:
+        parser.error(f"Nessuno scenario tra: {', '.join(s.name for s in SCENARIOS)}")
+
+    with StubLLMServer(latency_ms=args.llm_latency_ms) as stub:
+        configure_environment(stub.base_url, args.executor)
+        from src.upload_store import get_upload_store
+        from src.config import DATA_DIR
+
+        upload_id = f"bench-{uuid.uuid4().hex[:8]}"
+        file_path = upload_sample(upload_id)
+        driver = AppDriver(args.timeout) if args.driver == "app" else AgentsDriver()
+        try:
+            results = {
+                "meta": {
+                    "driver": driver.name,
+                    "executor": args.executor,
+                    "llm_latency_ms": args.llm_latency_ms,
+                    "iterations": args.iterations,
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                },
+                "scenarios": {},
+            }
+            for scenario in scenarios:
+                print(f"▶️ {scenario.name}: {scenario.description}")
+                results["scenarios"][scenario.name] = run_scenario(
+                    scenario, driver, stub, file_path, args.iterations, args.warmup
+                )
+        finally:
+            get_upload_store(DATA_DIR).release(upload_id)
+
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n💾 Riferimento salvato in {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nℹ️ Nessun riferimento in {args.baseline}: usa --save-baseline per crearlo")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    for key in ("driver", "executor", "llm_latency_ms"):
+        if baseline.get("meta", {}).get(key) != results["meta"][key]:
+            print(f"⚠️ Riferimento con {key}={baseline.get('meta', {}).get(key)}, ora {results['meta'][key]}")
+
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms, args.token_tolerance)
+    if regressions:
+        print(f"\n❌ REGRESSIONE rispetto a {args.baseline}:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+    print(f"\n✅ Nessuna regressione rispetto a {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Scenari del benchmark e programma scriptato del Code Generator finto.
+
+Ogni scenario è una sequenza di messaggi utente sulla stessa sessione
+(configurata con `app/assets/sample.xlsx` e il template di default); solo
+l'ultimo messaggio viene misurato, i precedenti preparano lo stato (es. lo
+storico per una spiegazione).
+"""
+
+from dataclasses import dataclass, field
+from typing import List
+
+# Programma restituito dal Code Generator finto: applica le regole del
+# template di default usando l'indice di disponibilità e i parametri
+SCRIPTED_CODE = '''
+GIORNI = {"LUN": "Lunedì", "MAR": "Martedì", "MER": "Mercoledì", "GIO": "Giovedì",
+          "VEN": "Venerdì", "SAB": "Sabato", "DOM": "Domenica"}
+
+
+def calcola_sostituzioni(df, params):
+    elfi = params.get("elfi") or []
+    giorni = params.get("giorni") or []
+    ore = params.get("ore") or []
+
+    extra = []
+    for i, elfo in enumerate(elfi):
+        giorni_elfo = [giorni[i]] if len(giorni) == len(elfi) else (giorni or list(indice.days))
+        ore_elfo = [ore[i]] if len(ore) == len(elfi) else (ore or [None])
+        extra += [{"elfo": elfo, "giorno": g, "ora": o} for g in giorni_elfo for o in ore_elfo]
+    idx = indice.with_absences(extra) if extra else indice
+    filtro_ore = ore or None
+
+    occupati = {k: set(v) for k, v in (params.get("sostituti_occupati") or {}).items()}
+    coperte = params.get("assenze_coperte") or {}
+
+    risultati = []
+    for assenza in idx.absences():
+        giorno, ora, assente = assenza["giorno"], assenza["ora"], assenza["elfo"]
+        if giorni and giorno not in giorni:
+            continue
+        if filtro_ore and ora not in filtro_ore:
+            continue
+        slot = f"{giorno}-{ora}"
+        liberi = lambda nomi: [n for n in nomi if n != assente and n not in occupati.get(slot, set())]
+
+        if assente in coperte.get(slot, {}):
+            sostituto, regola = coperte[slot][assente], "Sostituzione precedente"
+        else:
+            sostituto, regola = None, "Nessuna regola applicabile"
+            candidati = [
+                ("Assistente assegnato a stesso reparto",
+                 idx.same_department(giorno, ora, assenza["reparto"], "Verde")
+                 if assenza["cappello"].lower() == "rosso" else []),
+                ("Ora Jolly", idx.jolly(giorno, ora)),
+                ("Ora Pausa pizza", idx.pizza_break(giorno, ora)),
+            ]
+            for nome_regola, nomi in candidati:
+                if liberi(nomi):
+                    sostituto, regola = liberi(nomi)[0], nome_regola
+                    break
+            if sostituto is not None:
+                occupati.setdefault(slot, set()).add(sostituto)
+
+        risultati.append({
+            "giorno": GIORNI.get(giorno, giorno),
+            "ora": ora,
+            "reparto": assenza["reparto"],
+            "assente": assente,
+            "cappello_assente": assenza["cappello"] or None,
+            "sostituto": sostituto or "Nessun sostituto disponibile",
+            "regola_applicata": regola,
+            "ragionamento": f"Regola '{regola}' applicata alla {ora}^ ora di {GIORNI.get(giorno, giorno)}.",
+        })
+    return risultati
+'''
+
+# Primo tentativo che fallisce (per misurare il costo di un retry)
+BROKEN_CODE = '''
+def calcola_sostituzioni(df, params):
+    return [riga["assente"] for riga in indice.absences(params["giorni"][0])]
+'''
+
+# Regole del template di default con un'aggiunta: nessun solver nativo le
+# riconosce, quindi il calcolo passa dal Code Generator (LLM + sandbox)
+CUSTOM_RULES_SUFFIX = "\n      REGOLA 'Benchmark': a parità di regola scegli il primo elfo in ordine di file.\n"
+
+
+@dataclass
+class Scenario:
+    """Richiesta misurata, con i messaggi che la precedono sulla stessa sessione"""
+    name: str
+    description: str
+    prompt: str
+    setup_prompts: List[str] = field(default_factory=list)
+    custom_rules: bool = False  # regole modificate: niente solver nativo
+    cold: bool = True  # svuota la cache del codice prima di ogni ripetizione
+    faults: int = 0  # tentativi errati del Code Generator prima di quello corretto
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario(
+        name="saluto",
+        description="Risposta pronta del router, nessuna chiamata LLM",
+        prompt="Ciao Babbo Natale!",
+    ),
+    Scenario(
+        name="calcolo_nativo",
+        description="Calcolo con il solver nativo del template + narrazione",
+        prompt="Dammi le sostituzioni per martedì",
+    ),
+    Scenario(
+        name="calcolo_generato",
+        description="Calcolo con codice generato (LLM + sandbox) + narrazione",
+        prompt="Dammi le sostituzioni per martedì",
+        custom_rules=True,
+    ),
+    Scenario(
+        name="calcolo_retry",
+        description="Codice generato che fallisce al primo tentativo",
+        prompt="Dammi le sostituzioni per mercoledì",
+        custom_rules=True,
+        faults=1,
+    ),
+    Scenario(
+        name="calcolo_cache",
+        description="Programma già in cache del codice (nessuna generazione)",
+        prompt="Dammi le sostituzioni per giovedì",
+        setup_prompts=["Dammi le sostituzioni per lunedì"],
+        custom_rules=True,
+        cold=False,
+    ),
+    Scenario(
+        name="orchestrator",
+        description="Messaggio ambiguo: orchestrator che delega il calcolo",
+        prompt="Calcola le sostituzioni di venerdì e raccontamelo come una storia",
+    ),
+    Scenario(
+        name="spiegazione",
+        description="Spiegazione diretta all'explainer con storico in memoria",
+        prompt="Perché hai scelto questi sostituti?",
+        setup_prompts=["Dammi le sostituzioni per martedì"],
+    ),
+]
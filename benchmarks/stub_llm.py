@@ -0,0 +1,221 @@
+"""
+Server LLM finto, compatibile con la Responses API di OpenAI.
+
+Risponde in modo deterministico in base all'agente che chiama, riconosciuto
+dai tool dichiarati nella richiesta:
+
+- orchestrator (tool `code_generator`, `explainer`, `narrator`): delega il
+  task al Code Generator, poi risponde con un testo
+- code_generator (tool `execute_code_in_sandbox`): invia il programma
+  scriptato (preceduto da `faults` versioni che falliscono), poi conferma
+- router (`max_output_tokens` minimo): etichetta dell'intento
+- explainer / narrator (nessun tool): testo
+
+I token di usage sono stimati dalla lunghezza di input e output (~4 caratteri
+per token): restano stabili tra le esecuzioni e crescono se crescono i prompt.
+Supporta sia le risposte normali sia lo streaming SSE.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from benchmarks.scenarios import BROKEN_CODE, SCRIPTED_CODE
+
+XLSX_PATH = re.compile(r"((?:[A-Za-z]:)?[\\/][^\s'\"`]+\.xlsx)")
+
+DEFAULT_REPLY = "Ho Ho Ho! Tutto sistemato nella fabbrica."
+EXPLANATION = (
+    "Ho scelto il sostituto seguendo la priorità delle regole: prima lo stesso reparto "
+    "con cappello Verde, poi i Jolly, infine gli elfi in pausa pizza."
+)
+STORY = (
+    "C'era una volta, al Polo Nord, un elfo assente e un collega pronto a coprire il suo turno: "
+    "grazie a lui nessun giocattolo rimase indietro."
+)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+    return str(content or "")
+
+
+def _message(text: str) -> List[Dict[str, Any]]:
+    return [{
+        "type": "message", "id": "msg_bench", "role": "assistant", "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }]
+
+
+def _function_call(name: str, arguments: Dict[str, Any], call_id: str) -> List[Dict[str, Any]]:
+    return [{
+        "type": "function_call", "id": f"fc_{call_id}", "call_id": call_id, "name": name,
+        "arguments": json.dumps(arguments, ensure_ascii=False), "status": "completed",
+    }]
+
+
+class ScriptedLLM:
+    """Logica delle risposte (senza HTTP) e contatori delle chiamate"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.faults = 0  # tentativi di codice errato prima di quello corretto
+        self.router_label = "unknown"
+        self._runs = 0
+        self._lock = threading.Lock()
+
+    def _next_run(self) -> int:
+        with self._lock:
+            self._runs += 1
+            return self._runs
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        tools = {t.get("name") for t in request.get("tools") or []}
+        items = request.get("input") if isinstance(request.get("input"), list) else []
+        outputs = [i for i in items if isinstance(i, dict) and i.get("type") == "function_call_output"]
+        # Il system prompt arriva come `instructions` o come messaggio di sistema
+        instructions = (request.get("instructions") or "") + "".join(
+            _text(i.get("content")) for i in items
+            if isinstance(i, dict) and i.get("role") in ("system", "developer")
+        )
+
+        if "execute_code_in_sandbox" in tools:
+            output = self._code_generator(instructions, outputs)
+        elif "code_generator" in tools:
+            output = self._orchestrator(request, outputs)
+        elif (request.get("max_output_tokens") or 1000) <= 16:
+            output = _message(self.router_label)
+        elif "narra" in instructions.lower() or "storia" in instructions.lower():
+            output = _message(STORY)
+        elif "spieg" in instructions.lower():
+            output = _message(EXPLANATION)
+        else:
+            output = _message(DEFAULT_REPLY)
+
+        prompt = json.dumps(request.get("input"), ensure_ascii=False) + (request.get("instructions") or "")
+        completion = json.dumps(output, ensure_ascii=False)
+        return {
+            "id": "resp_bench", "object": "response", "created_at": time.time(),
+            "model": request.get("model", "gpt-4o"), "status": "completed", "output": output,
+            "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+            "usage": {
+                "input_tokens": _tokens(prompt), "output_tokens": _tokens(completion),
+                "total_tokens": _tokens(prompt) + _tokens(completion),
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        }
+
+    def _orchestrator(self, request: Dict[str, Any], outputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if outputs:
+            return _message(DEFAULT_REPLY)
+        task = ""
+        for item in request.get("input") or []:
+            if isinstance(item, dict) and item.get("role") == "user":
+                task = _text(item.get("content")).replace("RICHIESTA UTENTE:", "").strip()
+        lowered = task.lower()
+        # Delega come farebbe il modello: spiegazioni all'explainer, calcoli al Code Generator
+        if "perch" in lowered or "spieg" in lowered:
+            return _function_call("explainer", {"input_task": task}, "call_orchestrator")
+        if "sostitu" in lowered or "calcol" in lowered:
+            return _function_call("code_generator", {"input_task": task}, "call_orchestrator")
+        return _message(DEFAULT_REPLY)
+
+    def _code_generator(self, instructions: str, outputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        attempt = len(outputs)
+        if attempt and '"success": true' in str(outputs[-1].get("output", "")).replace("'", '"'):
+            return _message("Sostituzioni calcolate.")
+        if attempt > self.faults:
+            return _message("Non sono riuscito a calcolare le sostituzioni.")
+        match = XLSX_PATH.search(instructions)
+        code = BROKEN_CODE if attempt < self.faults else SCRIPTED_CODE
+        # Un commento diverso a ogni esecuzione evita la cache dei risultati
+        code = f"# bench run {self._next_run()}\n{code}"
+        arguments = {"codice_python": code, "file_excel_path": match.group(1) if match else ""}
+        return _function_call("execute_code_in_sandbox", arguments, f"call_code_{attempt}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm: ScriptedLLM = None
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        response = self.llm.respond(request)
+
+        if not request.get("stream"):
+            body = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        seq = 0
+        for item in response["output"]:
+            if item["type"] != "message":
+                continue
+            for word in item["content"][0]["text"].split(" "):
+                self._event("response.output_text.delta", {
+                    "delta": word + " ", "item_id": item["id"], "output_index": 0,
+                    "content_index": 0, "sequence_number": seq, "logprobs": [],
+                })
+                seq += 1
+        self._event("response.completed", {"response": response, "sequence_number": seq})
+        self.close_connection = True
+
+    def _event(self, kind: str, data: Dict[str, Any]) -> None:
+        payload = json.dumps(dict(data, type=kind), ensure_ascii=False)
+        self.wfile.write(f"event: {kind}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class StubLLMServer:
+    """Server HTTP su una porta libera di localhost, in un thread in background"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.llm = ScriptedLLM(latency_ms=latency_ms)
+        handler = type("Handler", (_Handler,), {"llm": self.llm})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,260 @@
+"""
+Generatore di orari sintetici nel layout 'GGG_O'.
+
+`app/assets/sample.xlsx` ha 13 elfi: per misurare scala e correttezza servono
+orari con centinaia di elfi e molti reparti. Gli orari generati sono casuali
+ma coerenti con le regole del template di default:
+
+- ogni elfo ha un cappello (Rosso/Verde) e 2-3 reparti abituali;
+- ogni ora è un reparto, 'Jolly', 'RM', 'Carb' o vuota; un'ora vuota tra
+  due ore assegnate è una 'Pausa pizza';
+- le assenze ('ABS - X') sostituiscono solo ore assegnate al reparto X, in
+  un blocco contiguo della giornata dell'elfo;
+- una parte delle assenze è già coperta da un 'SUB - X' di un elfo che in
+  quell'ora era Jolly.
+
+Le colonne 'GGG_O' identificano un giorno della settimana, non una data:
+più settimane sono più orari (uno per settimana) con lo stesso organico.
+
+Uso:
+    python -m benchmarks.synthetic --elves 300 --departments 20 --weeks 2 --output-dir /tmp/orari
+"""
+
+import argparse
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from src.availability_index import ABS, ABS_PREFIX, JOLLY, SUB, SUB_PREFIX, AvailabilityIndex
+
+DAY_CODES = ["LUN", "MAR", "MER", "GIO", "VEN", "SAB", "DOM"]
+BASE_DEPARTMENTS = [
+    "Trenini", "Puzzle", "Robot", "Musica", "Costruzioni", "Peluche", "Libri", "ActionFigure",
+    "Bambole", "Slitte", "Videogiochi", "Palloni", "Aquiloni", "Marionette", "Dadi", "Trottole",
+]
+_PREFIXES = [
+    "Brilla", "Pigna", "Zucche", "Scinti", "Lampo", "Noccio", "Nevo", "Tic", "Rame", "Fulgo",
+    "Cilie", "Spruz", "Fiocco", "Zenzi", "Canni", "Vischio", "Ghiac", "Biscot", "Stelli", "Agrif",
+]
+_SUFFIXES = [
+    "stella", "ferma", "rino", "llino", "gio", "lina", "lino", "tac", "tto", "r",
+    "gia", "zo", "bianco", "vero", "ella", "ne", "ciolo", "tino", "no", "foglio",
+]
+
+
+@dataclass
+class ShiftMix:
+    """Probabilità di ogni tipo di cella per un'ora non di reparto"""
+    work: float = 0.6  # ora assegnata a uno dei reparti abituali
+    jolly: float = 0.12
+    rm: float = 0.06
+    carb: float = 0.04
+    pizza: float = 0.1  # ora centrale di tre assegnate svuotata (pausa pizza garantita)
+    covered: float = 0.2  # assenze già coperte da un 'SUB - X' nell'orario
+
+
+@dataclass
+class Roster:
+    """Organico fisso tra le settimane: nomi, cappelli e reparti abituali"""
+    names: List[str]
+    hats: List[str]
+    departments: List[str]
+    homes: List[List[int]] = field(default_factory=list)
+
+
+def elf_names(count: int, rng: np.random.Generator) -> List[str]:
+    """Nomi unici in stile fabbrica (con numero progressivo oltre le combinazioni)"""
+    combos = [p + s for p in _PREFIXES for s in _SUFFIXES]
+    rng.shuffle(combos)
+    names = combos[:count]
+    for i in range(len(names), count):
+        names.append(f"{combos[i % len(combos)]}{i // len(combos) + 1}")
+    return names
+
+
+def department_names(count: int) -> List[str]:
+    return [BASE_DEPARTMENTS[i] if i < len(BASE_DEPARTMENTS) else f"Reparto{i + 1}" for i in range(count)]
+
+
+class ScheduleGenerator:
+    """Orari casuali ma coerenti con le regole, riproducibili dal seed"""
+
+    def __init__(
+        self,
+        elves: int,
+        departments: int,
+        absence_rate: float = 0.05,
+        seed: int = 0,
+        days: int = 7,
+        hours: int = 6,
+        red_ratio: float = 0.6,
+        mix: Optional[ShiftMix] = None
+    ):
+        """
+        Args:
+            elves: Numero di elfi (righe)
+            departments: Numero di reparti
+            absence_rate: Frazione delle giornate elfo con un'assenza
+            seed: Seed del generatore (stessi parametri = stessi orari)
+            days: Giorni per settimana (da LUN)
+            hours: Ore per giorno (colonne GGG_1..GGG_hours)
+            red_ratio: Frazione di elfi con Cappello Rosso
+            mix: Probabilità dei tipi di cella
+        """
+        if elves < 2 or departments < 1:
+            raise ValueError("Servono almeno 2 elfi e 1 reparto")
+        self.absence_rate = absence_rate
+        self.seed = seed
+        self.days = DAY_CODES[:max(1, min(days, len(DAY_CODES)))]
+        self.hours = hours
+        self.mix = mix or ShiftMix()
+
+        rng = np.random.default_rng(seed)
+        hats = ["Rosso" if rng.random() < red_ratio else "Verde" for _ in range(elves)]
+        # Almeno un Rosso e un Verde: servono alla regola dell'assistente
+        hats[0], hats[1] = "Rosso", "Verde"
+        homes = [
+            sorted(rng.choice(departments, size=min(departments, int(rng.integers(2, 4))), replace=False).tolist())
+            for _ in range(elves)
+        ]
+        self.roster = Roster(elf_names(elves, rng), hats, department_names(departments), homes)
+
+    def week(self, number: int = 0) -> pd.DataFrame:
+        """Orario di una settimana (stesso organico, turni ed assenze diversi)"""
+        rng = np.random.default_rng([self.seed, number])
+        roster, mix = self.roster, self.mix
+        n, h = len(roster.names), self.hours
+        grid: Dict[str, List[Optional[str]]] = {}
+
+        for day in self.days:
+            cells = [[self._shift(rng, roster.homes[e]) for _ in range(h)] for e in range(n)]
+            for row in cells:
+                self._pizza_breaks(rng, row)
+            absences = self._absences(rng, cells)
+            self._covered(rng, cells, absences)
+            for hour in range(h):
+                grid[f"{day}_{hour + 1}"] = [cells[e][hour] for e in range(n)]
+
+        df = pd.DataFrame({"Nome Elfo": roster.names, "Cappello": roster.hats})
+        return pd.concat([df, pd.DataFrame(grid)], axis=1)
+
+    def weeks(self, count: int) -> List[pd.DataFrame]:
+        return [self.week(i) for i in range(count)]
+
+    # ----------------------------------------
+    # Celle
+    # ----------------------------------------
+    def _shift(self, rng: np.random.Generator, home: List[int]) -> Optional[str]:
+        mix = self.mix
+        roll = rng.random()
+        if roll < mix.work:
+            return self.roster.departments[home[int(rng.integers(len(home)))]]
+        roll -= mix.work
+        for value, p in (("Jolly", mix.jolly), ("RM", mix.rm), ("Carb", mix.carb)):
+            if roll < p:
+                return value
+            roll -= p
+        return None
+
+    def _pizza_breaks(self, rng: np.random.Generator, row: List[Optional[str]]) -> None:
+        """Svuota l'ora centrale di alcune terne di ore assegnate"""
+        for hour in range(1, len(row) - 1):
+            if all(self._is_department(row[k]) for k in (hour - 1, hour, hour + 1)) and rng.random() < self.mix.pizza:
+                row[hour] = None
+
+    def _absences(self, rng: np.random.Generator, cells: List[List[Optional[str]]]) -> List[tuple]:
+        """Blocchi contigui di ore assegnate diventano 'ABS - X'; restituisce (elfo, ora, reparto)"""
+        absences = []
+        for e, row in enumerate(cells):
+            worked = [k for k, value in enumerate(row) if self._is_department(value)]
+            if not worked or rng.random() >= self.absence_rate:
+                continue
+            start = int(rng.integers(len(worked)))
+            end = int(rng.integers(start, len(worked))) + 1
+            for k in worked[start:end]:
+                absences.append((e, k, row[k]))
+                row[k] = f"{ABS_PREFIX}{row[k]}"
+        return absences
+
+    def _covered(self, rng: np.random.Generator, cells: List[List[Optional[str]]], absences: List[tuple]) -> None:
+        """Una parte delle assenze è già coperta da un Jolly, che diventa 'SUB - X'"""
+        jolly = [[e for e, row in enumerate(cells) if row[hour] == "Jolly"] for hour in range(self.hours)]
+        for _, hour, department in absences:
+            if not jolly[hour] or rng.random() >= self.mix.covered:
+                continue
+            e = jolly[hour].pop(int(rng.integers(len(jolly[hour]))))
+            cells[e][hour] = f"{SUB_PREFIX}{department}"
+
+    @staticmethod
+    def _is_department(value: Optional[str]) -> bool:
+        return value is not None and value not in ("Jolly", "RM", "Carb") and not value.startswith(ABS_PREFIX)
+
+
+def generate_schedules(
+    elves: int,
+    departments: int,
+    absence_rate: float = 0.05,
+    weeks: int = 1,
+    seed: int = 0,
+    **kwargs: Any
+) -> List[pd.DataFrame]:
+    """
+    Orari sintetici, uno per settimana, con lo stesso organico.
+
+    Args:
+        elves: Numero di elfi
+        departments: Numero di reparti
+        absence_rate: Frazione delle giornate elfo con un'assenza
+        weeks: Numero di settimane
+        seed: Seed del generatore
+        **kwargs: Altri parametri di ScheduleGenerator (days, hours, red_ratio, mix)
+    """
+    return ScheduleGenerator(elves, departments, absence_rate, seed, **kwargs).weeks(weeks)
+
+
+def describe(df: pd.DataFrame) -> Dict[str, int]:
+    """Conteggi di un orario (per controllare che i parametri abbiano effetto)"""
+    index = AvailabilityIndex.from_dataframe(df)
+    return {
+        "elfi": len(index.names),
+        "reparti": len(index.departments),
+        "colonne_turno": len(df.columns) - 2,
+        "assenze": int((index.state == ABS).sum()),
+        "gia_coperte": int((index.state == SUB).sum()),
+        "jolly": int((index.state == JOLLY).sum()),
+        "pause_pizza": int(index.pizza.sum()),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera orari sintetici nel layout GGG_O")
+    parser.add_argument("--elves", type=int, default=200)
+    parser.add_argument("--departments", type=int, default=16)
+    parser.add_argument("--absence-rate", type=float, default=0.05)
+    parser.add_argument("--weeks", type=int, default=1)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--hours", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", type=Path, default=Path("."))
+    args = parser.parse_args(argv)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    schedules = generate_schedules(
+        args.elves, args.departments, args.absence_rate, args.weeks, args.seed,
+        days=args.days, hours=args.hours
+    )
+    for number, df in enumerate(schedules, start=1):
+        path = args.output_dir / f"orario_{args.elves}_elfi_settimana_{number}.xlsx"
+        df.to_excel(path, index=False)
+        print(f"📄 {path}: {describe(df)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
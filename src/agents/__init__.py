@@ -6,12 +6,16 @@ from .code_generator import create_code_generator_agent
 from .explainer import create_explainer_agent
 from .narrator import create_narrator_agent
 from .orchestrator import create_orchestrator_agent
-from .factory import create_multi_agent_system
+from .router import create_intent_router
+from .factory import agent_system, create_multi_agent_system, get_agent_system_pool
 
 __all__ = [
     "create_code_generator_agent",
     "create_explainer_agent",
     "create_narrator_agent",
     "create_orchestrator_agent",
-    "create_multi_agent_system"
+    "create_intent_router",
+    "create_multi_agent_system",
+    "agent_system",
+    "get_agent_system_pool"
 ]
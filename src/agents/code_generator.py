@@ -3,13 +3,233 @@ Code Generator Agent - Specialist per generazione ed esecuzione codice Python
 """
 
 from datapizza.agents import Agent
-from datapizza.clients.openai import OpenAIClient
+from datapizza.agents.agent import StepResult
+from src.agents.llm_client import create_llm_client
+from datapizza.type import TextBlock
+import asyncio
 import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import TypeAdapter, ValidationError
 from src.agents.config import CODE_GENERATOR_SYSTEM_PROMPT
 
 # Import corretti con path assoluto src
-from src.tools import execute_code_in_sandbox
+from src.tools import execute_code_in_sandbox, run_generated_code
 from src.models import Sostituzione
+from src.substitution_store import SubstitutionStore
+from src.config import CODE_CACHE_ENABLED, NATIVE_SOLVER_ENABLED
+from src.code_cache import (
+    CodeCache,
+    RequestSignature,
+    cache_key,
+    get_code_cache,
+    hardcoded_params,
+    normalize_request,
+    rules_fingerprint,
+)
+from src.run_context import RunContext, current_request, run_scope
+from src.run_events import STATUS, EventHooks, TracedAgent, emit
+from src.schedule_cache import schedule_overview
+from src.tracing import span
+from src.solvers import find_native_solver, get_native_solver, is_supported_request, solve_from_params
+
+# Campi dello storico passati al codice generato in params["sostituzioni_precedenti"]
+HISTORY_FIELDS = ("giorno", "ora", "reparto", "assente", "sostituto", "regola_applicata")
+
+_SUBSTITUTIONS = TypeAdapter(List[Sostituzione])
+
+
+def _absence_key(substitution: Sostituzione) -> tuple:
+    """Assenza coperta da una sostituzione: (assente, giorno, ora)"""
+    return (substitution.assente, substitution.giorno, substitution.ora)
+
+
+def summarize_substitutions(substitutions: List[Sostituzione]) -> str:
+    """Riepilogo compatto (una riga per sostituzione) restituito all'orchestratore"""
+    lines = [
+        f"Calcolate {len(substitutions)} sostituzioni. I dati completi sono già stati consegnati "
+        "all'interfaccia e al narrator: NON ripeterli come JSON."
+    ]
+    for s in substitutions:
+        lines.append(f"- {s.giorno} ora {s.ora}, {s.reparto}: {s.assente} → {s.sostituto} ({s.regola_applicata})")
+    return "\n".join(lines)
+
+
+class CachedCodeGeneratorAgent(TracedAgent):
+    """
+    Code Generator che riusa i programmi già eseguiti con successo.
+
+    Elfi, giorni, ore e storico sostituzioni vengono estratti dalla richiesta
+    e passati al codice come `params`: su un hit della cache il programma
+    salvato viene eseguito direttamente con i nuovi parametri, senza
+    chiamate LLM. Se regole e struttura sono quelle di un template con
+    solver nativo (`src/solvers/`) non serve nemmeno il codice.
+    """
+
+    def __init__(
+        self,
+        *args,
+        file_path: str = "",
+        rules: str = "",
+        structure: str = "",
+        prev_substitutions: Optional[List[Dict[str, Any]]] = None,
+        code_cache: Optional[CodeCache] = None,
+        native_template: Optional[str] = None,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.file_path = file_path
+        self.native_template = native_template
+        self.rules_hash = rules_fingerprint(rules, structure)
+        self.code_cache = code_cache
+        self.set_history(prev_substitutions)
+
+    def set_history(self, prev_substitutions: Optional[List[Dict[str, Any]]]) -> None:
+        """Aggiorna lo storico passato al codice (agente riusato tra richieste)"""
+        self.history = [
+            {k: s.get(k) for k in HISTORY_FIELDS}
+            for s in (prev_substitutions or [])
+        ]
+        # Indici per slot (sostituti occupati, assenze coperte) passati al codice
+        self.history_index = SubstitutionStore.from_records(self.history).executor_params()
+
+    def _prepare(self, task_input: str) -> Optional[Tuple[str, RequestSignature, RunContext]]:
+        """Normalizza la richiesta e calcola la chiave della cache"""
+        path = Path(self.file_path) if self.file_path else None
+        if path is None or not path.exists():
+            return None
+        try:
+            names, columns = schedule_overview(path)
+        except Exception as e:
+            print(f"⚠️ Lettura orario per la cache del codice fallita: {e}")
+            return None
+
+        signature = normalize_request(task_input, names)
+        params = dict(signature.params, sostituzioni_precedenti=self.history, **self.history_index)
+        key = cache_key(self.rules_hash, columns, signature.text)
+        return key, signature, RunContext(params=params)
+
+    def _run_native(self, signature: RequestSignature, context: RunContext) -> Optional[StepResult]:
+        """Risolve la richiesta con il solver nativo del template, se applicabile"""
+        if self.native_template is None or not is_supported_request(signature.text):
+            return None
+        try:
+            solver = get_native_solver(self.native_template, Path(self.file_path))
+            result = solve_from_params(solver, context.params)
+        except Exception as e:
+            print(f"⚠️ Solver nativo non applicabile, uso il Code Generator: {e}")
+            return None
+
+        emit(STATUS, self.name, f"Sostituzioni calcolate dal solver nativo ({len(result.substitutions)})")
+        output = [s.model_dump() for s in result.substitutions]
+        context.last_success_result = json.dumps({"success": True, "output": output}, ensure_ascii=False)
+        return self._deliver(context) or StepResult(
+            index=0, content=[TextBlock(content=json.dumps(output, ensure_ascii=False))]
+        )
+
+    def _shortcut(self, key: str, signature: RequestSignature, context: RunContext) -> Optional[StepResult]:
+        """Percorsi senza LLM: prima il solver nativo, poi la cache del codice"""
+        return self._run_native(signature, context) or self._run_cached(key, context)
+
+    def _run_cached(self, key: str, context: RunContext) -> Optional[StepResult]:
+        """Esegue il programma in cache, se presente; un programma che fallisce viene scartato"""
+        if self.code_cache is None:
+            return None
+        code = self.code_cache.get(key)
+        if code is None:
+            return None
+
+        result = run_generated_code(code, Path(self.file_path), context.params)
+        try:
+            payload = json.loads(result)
+        except ValueError:
+            payload = {}
+        if not payload.get("success"):
+            self.code_cache.invalidate(key)
+            return None
+
+        emit(STATUS, self.name, "Programma già noto riusato dalla cache, senza generare codice")
+        context.last_success_code = code
+        context.last_success_result = result
+        output = json.dumps(payload.get("output"), ensure_ascii=False)
+        return self._deliver(context) or StepResult(index=0, content=[TextBlock(content=output)])
+
+    def _deliver(self, context: RunContext) -> Optional[StepResult]:
+        """
+        Consegna le sostituzioni validate al chiamante fuori banda e restituisce
+        all'orchestratore solo un riepilogo. None se non c'è una richiesta
+        attiva o l'output non è una lista di Sostituzione valida.
+        """
+        request = current_request()
+        if request is None or not context.last_success_result:
+            return None
+        with span("validation", kind="validation") as validation_span:
+            try:
+                output = json.loads(context.last_success_result).get("output")
+                substitutions = _SUBSTITUTIONS.validate_python(output)
+            except (ValueError, AttributeError, ValidationError) as e:
+                validation_span.set_attribute("success", False)
+                validation_span.set_attribute("error", str(e)[:200])
+                print(f"⚠️ Output del codice non conforme a Sostituzione, lo restituisco come testo: {e}")
+                return None
+            validation_span.set_attribute("success", True)
+            validation_span.set_attribute("count", len(substitutions))
+
+        # Un nuovo calcolo sostituisce solo le righe delle stesse assenze
+        # (retry, raffinamenti); quelle di altre assenze della richiesta restano
+        computed = {_absence_key(s) for s in substitutions}
+        request.substitutions = [
+            s for s in request.substitutions if _absence_key(s) not in computed
+        ] + list(substitutions)
+        return StepResult(index=0, content=[TextBlock(content=summarize_substitutions(substitutions))])
+
+    def _store(self, key: str, signature: RequestSignature, context: RunContext) -> None:
+        """Salva il programma riuscito, solo se legge elfi, giorni e ore da `params`"""
+        if self.code_cache is None or not context.last_success_code:
+            return
+        literals = hardcoded_params(context.last_success_code, context.params)
+        if literals:
+            print(f"⚠️ Programma non messo in cache, contiene valori della richiesta: {literals[:3]}")
+            return
+        self.code_cache.put(key, context.last_success_code, self.rules_hash, signature.text)
+
+    @staticmethod
+    def _with_params(task_input: str, params: Dict[str, Any]) -> str:
+        return (
+            f"{task_input}\n\n"
+            f"PARAMETRI (dizionario 'params' passato a calcola_sostituzioni):\n"
+            f"{json.dumps(params, ensure_ascii=False)}"
+        )
+
+    def run(self, task_input: str, **kwargs) -> Optional[StepResult]:
+        prepared = self._prepare(task_input)
+        if prepared is None:
+            return super().run(task_input, **kwargs)
+
+        key, signature, context = prepared
+        with run_scope(context):
+            cached = self._shortcut(key, signature, context)
+            if cached is not None:
+                return cached
+            result = super().run(self._with_params(task_input, context.params), **kwargs)
+            self._store(key, signature, context)
+            return self._deliver(context) or result
+
+    async def a_run(self, task_input: str, **kwargs) -> Optional[StepResult]:
+        # Lettura dell'orario, solver nativo e programma in cache sono bloccanti:
+        # in un thread, per non fermare l'event loop condiviso dalle sessioni
+        prepared = await asyncio.to_thread(self._prepare, task_input)
+        if prepared is None:
+            return await super().a_run(task_input, **kwargs)
+
+        key, signature, context = prepared
+        with run_scope(context):
+            cached = await asyncio.to_thread(self._shortcut, key, signature, context)
+            if cached is not None:
+                return cached
+            result = await super().a_run(self._with_params(task_input, context.params), **kwargs)
+            self._store(key, signature, context)
+            return self._deliver(context) or result
 
 
 def create_code_generator_agent(
@@ -18,13 +238,14 @@ def create_code_generator_agent(
     file_path: str = "",
     structure: str = "",
     rules: str = "",
-    prev_subst: str = ""
+    prev_subst: str = "",
+    prev_substitutions: Optional[List[Dict[str, Any]]] = None
     ) -> Agent:
     """
     Crea l'agente specializzato nella generazione di codice Python.
     """
-    client = OpenAIClient(api_key=api_key, model=model)
-    
+    client = create_llm_client(api_key, model)
+
     # Schema Pydantic per output validation
     schema_sostituzione = Sostituzione.model_json_schema()
     target_schema = {
@@ -43,13 +264,20 @@ def create_code_generator_agent(
         schema_str=schema_str
     )
 
-    agent = Agent(
+    agent = CachedCodeGeneratorAgent(
         name="code_generator",
         client=client,
         tools=[execute_code_in_sandbox],
         system_prompt=formatted_system_prompt,
         max_steps=10,
-        terminate_on_text=True
+        terminate_on_text=True,
+        hooks=EventHooks(),
+        file_path=file_path,
+        rules=rules,
+        structure=structure,
+        prev_substitutions=prev_substitutions,
+        code_cache=get_code_cache() if CODE_CACHE_ENABLED else None,
+        native_template=find_native_solver(rules, structure) if NATIVE_SOLVER_ENABLED else None
     )
-    
+
     return agent
@@ -0,0 +1,30 @@
+SYSTEM_PROMPT = """
+Classifica il messaggio dell'utente di una chat sulla gestione dei turni degli elfi nella fabbrica di Babbo Natale.
+Rispondi con UNA SOLA parola tra:
+- greeting: solo un saluto
+- thanks: solo un ringraziamento o una conferma
+- off_topic: domanda estranea a turni, assenze, sostituzioni e organizzazione della fabbrica
+- explain: chiede il perché di sostituzioni già calcolate
+- narrate: chiede una storia o un racconto delle sostituzioni
+- compute: chiede di calcolare sostituzioni per assenze, giorni o ore
+- unknown: nessuna delle precedenti o più di una insieme
+"""
+
+# Risposte a modello di Babbo Natale per i messaggi che non richiedono agenti
+CANNED_REPLIES = {
+    "greeting": [
+        "🎄 Ho! Ho! Ho! Ciao e benvenuto in fabbrica! Dimmi pure quale elfo manca all'appello e troverò subito un sostituto 🎅",
+        "🎅 Ho! Ho! Ho! Che piacere vederti! Quale intoppo sta preoccupando i miei elfi oggi?",
+    ],
+    "thanks": [
+        "🎅 Ho! Ho! Ho! È stato un piacere! Se qualche altro elfo si ammala, sai dove trovarmi ⭐",
+        "🎄 Grazie a te! Gli elfi sono già tornati al lavoro. Chiamami per qualsiasi altra sostituzione 🎁",
+    ],
+    "off_topic": [
+        "Oh oh oh! 🎅 Vorrei tanto chiacchierarne, ma siamo troppo indaffarati con i turni in fabbrica per il Natale! Torniamo a parlare delle sostituzioni degli elfi?",
+        "Ho! Ho! Ho! 🎄 Di questo non mi occupo: qui al Polo Nord penso solo a turni, assenze e sostituzioni degli elfi. Posso aiutarti con quelle?",
+    ],
+    "no_history": [
+        "🎅 Ho! Ho! Ho! Non ho ancora calcolato nessuna sostituzione in questa sessione: dimmi prima quale elfo è assente e in quale giorno!",
+    ],
+}
@@ -3,7 +3,10 @@ Explainer Agent - Specialist per spiegare decisioni e ragionamenti
 """
 
 from datapizza.agents import Agent
-from datapizza.clients.openai import OpenAIClient
+from src.agents.streaming import StreamingAgent
+from src.config import UI_STREAMING_ENABLED
+from src.run_events import EventHooks
+from src.agents.llm_client import create_llm_client
 from src.agents.config import EXPLAINER_SYSTEM_PROMPT
 
 def create_explainer_agent(
@@ -22,7 +25,7 @@ def create_explainer_agent(
     Returns:
         Agent configurato per spiegazioni
     """
-    client = OpenAIClient(api_key=api_key, model=model)
+    client = create_llm_client(api_key, model)
 
     # Inietto le variabili dentro il template importato
     formatted_system_prompt = EXPLAINER_SYSTEM_PROMPT.format(
@@ -30,13 +33,15 @@ def create_explainer_agent(
         prev_subst=prev_subst
     )
 
-    agent = Agent(
+    agent = StreamingAgent(
         name="explainer",
         client=client,
         tools=[],  # Nessun tool, pure reasoning
         system_prompt=formatted_system_prompt,
         max_steps=10,
-        terminate_on_text=True
+        terminate_on_text=True,
+        stream=UI_STREAMING_ENABLED,
+        hooks=EventHooks()
     )
     
     return agent
\ No newline at end of file
@@ -4,20 +4,40 @@ Factory per creare il sistema multi-agente completo
 
 from datapizza.agents import Agent
 from datapizza.memory import Memory
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from .code_generator import create_code_generator_agent
+from .code_generator import CachedCodeGeneratorAgent, create_code_generator_agent
 from .explainer import create_explainer_agent
-from .narrator import create_narrator_agent
+from .narrator import NarratorAgent, create_narrator_agent
 from .orchestrator import create_orchestrator_agent
+from .router import COMPUTE, EXPLAIN, NARRATE, IntentRouter, create_intent_router
 
 # Setup path per importare src
 from pathlib import Path
 import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
-from src.config import CODE_MODEL, EXPLAINER_MODEL, NARRATOR_MODEL, ORCHESTRATOR_MODEL
+from src.config import (
+    CODE_MODEL,
+    EXPLAINER_MODEL,
+    NARRATOR_MODEL,
+    ORCHESTRATOR_MODEL,
+    AGENT_POOL_MAX_GRAPHS,
+    AGENT_POOL_MAX_IDLE_PER_KEY,
+    NARRATION_MODE,
+    ROUTER_MODEL,
+)
+from src.code_cache import rules_fingerprint
+from src.utils import file_content_hash
+
+# Segnaposto lasciato nei system prompt dei grafi riusabili: a ogni richiesta
+# viene sostituito con il riepilogo delle sostituzioni precedenti
+PREV_SUBST_MARKER = "\x00PREV_SUBST\x00"
 
 def create_multi_agent_system(
     api_key: str,
@@ -29,11 +49,12 @@ def create_multi_agent_system(
     file_path: str = "",
     structure: str = "",
     rules: str = "",
-    prev_subst: str = ""
+    prev_subst: str = "",
+    prev_substitutions: Optional[List[Dict[str, Any]]] = None
 ) -> Agent:
     """
     Crea l'intero sistema multi-agente con tutti gli specialist coordinati dall'orchestrator.
-    
+
     Args:
         api_key: OpenAI API key
         code_model: Modello per code generator
@@ -41,10 +62,79 @@ def create_multi_agent_system(
         narrator_model: Modello per narrator
         orchestrator_model: Modello per orchestrator
         memory: Memoria conversazionale condivisa (opzionale)
-    
+        prev_substitutions: Sostituzioni già calcolate, passate al codice generato come parametro
+
     Returns:
         Agent orchestratore pronto per ricevere richieste utente
     """
+    return _build_agent_system(
+        api_key=api_key,
+        code_model=code_model,
+        explainer_model=explainer_model,
+        narrator_model=narrator_model,
+        orchestrator_model=orchestrator_model,
+        memory=memory,
+        file_path=file_path,
+        structure=structure,
+        rules=rules,
+        prev_subst=prev_subst,
+        prev_substitutions=prev_substitutions
+    ).orchestrator
+
+
+# ========================================
+# GRAFI RIUSABILI TRA I MESSAGGI
+# ========================================
+
+@dataclass
+class AgentSystem:
+    """Grafo di agenti già costruito, con i system prompt da completare a ogni richiesta"""
+    orchestrator: Agent
+    code_agent: CachedCodeGeneratorAgent
+    explainer_agent: Agent
+    narrator_agent: NarratorAgent
+    router: IntentRouter
+    # Nome agente -> system prompt con PREV_SUBST_MARKER al posto dello storico
+    prompt_templates: Dict[str, str]
+
+    def update_context(
+        self,
+        prev_subst: str = "",
+        prev_substitutions: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """Inietta lo storico della richiesta corrente senza ricostruire gli agenti"""
+        for agent in (self.code_agent, self.explainer_agent):
+            agent.system_prompt = self.prompt_templates[agent.name].replace(PREV_SUBST_MARKER, prev_subst)
+        self.code_agent.set_history(prev_substitutions)
+        self.narrator_agent.set_history(prev_substitutions)
+
+    def specialist(self, intent: str) -> Optional[Agent]:
+        """
+        Specialist a cui inviare direttamente un messaggio classificato dal router.
+        None se serve l'orchestrator (con la narrazione inline il calcolo passa da lui).
+        """
+        if intent == EXPLAIN:
+            return self.explainer_agent
+        if intent == NARRATE:
+            return self.narrator_agent
+        if intent == COMPUTE and NARRATION_MODE != "inline":
+            return self.code_agent
+        return None
+
+
+def _build_agent_system(
+    api_key: str,
+    code_model: str,
+    explainer_model: str,
+    narrator_model: str,
+    orchestrator_model: str,
+    memory: Optional[Memory],
+    file_path: str,
+    structure: str,
+    rules: str,
+    prev_subst: str,
+    prev_substitutions: Optional[List[Dict[str, Any]]]
+) -> AgentSystem:
     # Crea gli specialist agents
     code_agent = create_code_generator_agent(
         api_key=api_key,
@@ -52,21 +142,23 @@ def create_multi_agent_system(
         file_path=file_path,
         structure=structure,
         rules=rules,
-        prev_subst=prev_subst
+        prev_subst=prev_subst,
+        prev_substitutions=prev_substitutions
     )
-    
+
     explainer_agent = create_explainer_agent(
         api_key=api_key,
         model=explainer_model,
         rules=rules,
         prev_subst=prev_subst
     )
-    
+
     narrator_agent = create_narrator_agent(
         api_key=api_key,
-        model=narrator_model
+        model=narrator_model,
+        prev_substitutions=prev_substitutions
     )
-    
+
     # Crea l'orchestrator che coordina tutti
     orchestrator = create_orchestrator_agent(
         api_key=api_key,
@@ -74,7 +166,153 @@ def create_multi_agent_system(
         explainer_agent=explainer_agent,
         narrator_agent=narrator_agent,
         model=orchestrator_model,
-        memory=memory
+        memory=memory,
+        end_after_code=NARRATION_MODE != "inline"
+    )
+
+    return AgentSystem(
+        orchestrator=orchestrator,
+        code_agent=code_agent,
+        explainer_agent=explainer_agent,
+        narrator_agent=narrator_agent,
+        router=create_intent_router(api_key, ROUTER_MODEL),
+        prompt_templates={
+            code_agent.name: code_agent.system_prompt,
+            explainer_agent.name: explainer_agent.system_prompt,
+        }
+    )
+
+
+class AgentSystemPool:
+    """
+    Pool thread-safe di grafi di agenti, indicizzati per configurazione.
+
+    Un grafo viene prestato a una sola richiesta alla volta (lo storico è
+    scritto nei suoi system prompt): richieste concorrenti con la stessa
+    configurazione ricevono grafi distinti, che tornano poi nel pool.
+    """
+
+    def __init__(self, max_graphs: int = 8, max_idle_per_key: int = 4):
+        """
+        Args:
+            max_graphs: Configurazioni distinte tenute in memoria (oltre si scarta la meno usata)
+            max_idle_per_key: Grafi inattivi conservati per ogni configurazione
+        """
+        self.max_graphs = max(1, max_graphs)
+        self.max_idle_per_key = max(1, max_idle_per_key)
+        self._idle: "OrderedDict[Tuple, List[AgentSystem]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+
+    def acquire(self, key: Tuple, build: Callable[[], AgentSystem]) -> AgentSystem:
+        """Restituisce un grafo inattivo per la configurazione, costruendolo se manca"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._idle.move_to_end(key)
+                self.reuses += 1
+                return idle.pop()
+            self.builds += 1
+        # Costruzione fuori dal lock: non blocca le altre configurazioni
+        return build()
+
+    def release(self, key: Tuple, system: AgentSystem) -> None:
+        """Rimette il grafo nel pool"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle_per_key:
+                idle.append(system)
+            while len(self._idle) > self.max_graphs:
+                self._idle.popitem(last=False)
+
+    @contextmanager
+    def lease(self, key: Tuple, build: Callable[[], AgentSystem]) -> Iterator[AgentSystem]:
+        """Context manager: acquire + release automatico"""
+        system = self.acquire(key, build)
+        try:
+            yield system
+        finally:
+            self.release(key, system)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche del pool (per la modalità debug)"""
+        with self._lock:
+            return {
+                "configurations": len(self._idle),
+                "idle": sum(len(v) for v in self._idle.values()),
+                "builds": self.builds,
+                "reuses": self.reuses,
+            }
+
+
+_pool: Optional[AgentSystemPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_agent_system_pool() -> AgentSystemPool:
+    """Restituisce il pool process-wide dei grafi di agenti, creandolo al primo utilizzo"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AgentSystemPool(
+                max_graphs=AGENT_POOL_MAX_GRAPHS,
+                max_idle_per_key=AGENT_POOL_MAX_IDLE_PER_KEY
+            )
+        return _pool
+
+
+@contextmanager
+def agent_system(
+    api_key: str,
+    code_model: str = CODE_MODEL,
+    explainer_model: str = EXPLAINER_MODEL,
+    narrator_model: str = NARRATOR_MODEL,
+    orchestrator_model: str = ORCHESTRATOR_MODEL,
+    file_path: str = "",
+    structure: str = "",
+    rules: str = "",
+    prev_subst: str = "",
+    prev_substitutions: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[AgentSystem]:
+    """
+    Presta un grafo di agenti dal pool, riusando client e prompt già pronti.
+
+    La chiave è (modelli, hash del file, struttura, regole): lo storico della
+    richiesta viene iniettato nel grafo prestato. La memoria conversazionale
+    va passata a `orchestrator.run(..., memory=...)`.
+
+    Uso:
+        with agent_system(api_key, file_path=..., prev_subst=...) as system:
+            response = system.orchestrator.run(prompt, memory=memory)
+    """
+    path = Path(file_path) if file_path else None
+    file_key = file_content_hash(path) if path is not None and path.exists() else file_path
+    key = (
+        api_key, code_model, explainer_model, narrator_model, orchestrator_model,
+        file_path, file_key, rules_fingerprint(rules, structure)
     )
-    
-    return orchestrator
+
+    def build() -> AgentSystem:
+        return _build_agent_system(
+            api_key=api_key,
+            code_model=code_model,
+            explainer_model=explainer_model,
+            narrator_model=narrator_model,
+            orchestrator_model=orchestrator_model,
+            memory=None,
+            file_path=file_path,
+            structure=structure,
+            rules=rules,
+            prev_subst=PREV_SUBST_MARKER,
+            prev_substitutions=None
+        )
+
+    with get_agent_system_pool().lease(key, build) as system:
+        system.update_context(prev_subst, prev_substitutions)
+        yield system
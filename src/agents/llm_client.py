@@ -0,0 +1,58 @@
+"""
+Client LLM degli agenti, agganciati al pool HTTP condiviso (`src/http_pool.py`)
+e, se attiva, alla cache record/replay delle risposte (`src/llm_cache.py`)
+"""
+
+import asyncio
+
+from datapizza.clients.openai import OpenAIClient
+from openai import AsyncOpenAI
+
+from src.http_pool import get_http_pool, llm_base_url
+from src.llm_cache import CachedOpenAI, get_llm_cache
+
+
+class PooledOpenAIClient(OpenAIClient):
+    """
+    OpenAIClient che usa le connessioni del pool process-wide.
+
+    `OpenAIClient` passa `http_client` solo al client sync: quello async
+    viene creato qui sul client httpx async dell'event loop corrente.
+    Con `LLM_CACHE_MODE` diverso da 'off' entrambi passano dalla cache
+    delle risposte.
+    """
+
+    def __init__(self, api_key: str, model: str, **kwargs):
+        kwargs.setdefault("base_url", llm_base_url())
+        kwargs.setdefault("http_client", get_http_pool().client(kwargs["base_url"]))
+        self._a_client_loop = None
+        super().__init__(api_key=api_key, model=model, **kwargs)
+        if get_llm_cache().enabled:
+            self.client = CachedOpenAI(self.client, get_llm_cache())
+
+    def _get_a_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        if self.a_client is None or self._a_client_loop is not loop:
+            a_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                organization=self.organization,
+                project=self.project,
+                webhook_secret=self.webhook_secret,
+                websocket_base_url=self.websocket_base_url,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                default_headers=self.default_headers,
+                default_query=self.default_query,
+                http_client=get_http_pool().async_client(self.base_url),
+            )
+            if get_llm_cache().enabled:
+                a_client = CachedOpenAI(a_client, get_llm_cache(), asynchronous=True)
+            self.a_client = a_client
+            self._a_client_loop = loop
+        return self.a_client
+
+
+def create_llm_client(api_key: str, model: str) -> OpenAIClient:
+    """Crea il client LLM di un agente sul pool HTTP condiviso"""
+    return PooledOpenAIClient(api_key=api_key, model=model)
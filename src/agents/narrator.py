@@ -3,29 +3,80 @@ Narrator Agent - Specialist per creare narrazioni natalizie
 """
 
 from datapizza.agents import Agent
-from datapizza.clients.openai import OpenAIClient
+from datapizza.agents.agent import StepResult
+import json
+from typing import Any, Dict, List, Optional
+from src.agents.streaming import StreamingAgent
+from src.config import UI_STREAMING_ENABLED
+from src.run_events import EventHooks
+from src.agents.llm_client import create_llm_client
 from src.agents.config import NARRATOR_SYSTEM_PROMPT
+from src.run_context import current_request
 
-def create_narrator_agent(api_key: str, model: str = "gpt-4o-mini") -> Agent:
+
+class NarratorAgent(StreamingAgent):
+    """
+    Narrator che riceve i dati delle sostituzioni fuori banda.
+
+    Le sostituzioni calcolate nella richiesta corrente (o, in mancanza,
+    quelle già in memoria) vengono allegate al task: l'orchestratore non
+    deve ricopiare il JSON nella chiamata.
+    """
+
+    def __init__(self, *args, prev_substitutions: Optional[List[Dict[str, Any]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_history(prev_substitutions)
+
+    def set_history(self, prev_substitutions: Optional[List[Dict[str, Any]]]) -> None:
+        """Aggiorna le sostituzioni in memoria (agente riusato tra richieste)"""
+        self.history = list(prev_substitutions or [])
+
+    def with_data(self, task_input: str) -> str:
+        """Task con i dati delle sostituzioni allegati (se disponibili)"""
+        request = current_request()
+        if request is not None and request.substitutions:
+            data, label = [s.model_dump() for s in request.substitutions], "SOSTITUZIONI APPENA CALCOLATE"
+        elif self.history:
+            data, label = self.history, "SOSTITUZIONI IN MEMORIA"
+        else:
+            return task_input
+        return f"{task_input}\n\n{label} (JSON):\n{json.dumps(data, ensure_ascii=False)}"
+
+    def run(self, task_input: str, **kwargs) -> Optional[StepResult]:
+        return super().run(self.with_data(task_input), **kwargs)
+
+    async def a_run(self, task_input: str, **kwargs) -> Optional[StepResult]:
+        return await super().a_run(self.with_data(task_input), **kwargs)
+
+
+def create_narrator_agent(
+    api_key: str,
+    model: str = "gpt-4o-mini",
+    prev_substitutions: Optional[List[Dict[str, Any]]] = None
+    ) -> Agent:
     """
     Crea l'agente specializzato nella creazione di storie natalizie.
     
     Args:
         api_key: OpenAI API key
         model: Modello LLM da usare (default: gpt-4o-mini, economico per storytelling)
+        prev_substitutions: Sostituzioni già in memoria, allegate se la richiesta non ne calcola di nuove
     
     Returns:
         Agent configurato per narrazione
     """
-    client = OpenAIClient(api_key=api_key, model=model)
+    client = create_llm_client(api_key, model)
     
-    agent = Agent(
+    agent = NarratorAgent(
         name="narrator",
         client=client,
         tools=[],  # Nessun tool, pure creative writing
         system_prompt=NARRATOR_SYSTEM_PROMPT,
         max_steps=10,
-        terminate_on_text=True
+        terminate_on_text=True,
+        stream=UI_STREAMING_ENABLED,
+        hooks=EventHooks(),
+        prev_substitutions=prev_substitutions
     )
     
     return agent
\ No newline at end of file
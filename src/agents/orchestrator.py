@@ -3,10 +3,12 @@ Orchestrator Agent - Master agent che coordina gli specialist agents
 """
 
 from datapizza.agents import Agent
-from datapizza.clients.openai import OpenAIClient
+from src.agents.llm_client import create_llm_client
 from datapizza.memory import Memory
 from typing import Optional
 from src.agents.config import ORCHESTRATOR_SYSTEM_PROMPT
+from src.config import UI_STREAMING_ENABLED
+from src.run_events import EventHooks, TracedAgent
 
 def create_orchestrator_agent(
     api_key: str,
@@ -14,7 +16,8 @@ def create_orchestrator_agent(
     explainer_agent: Agent,
     narrator_agent: Agent,
     model: str = "gpt-4o",
-    memory: Optional[Memory] = None
+    memory: Optional[Memory] = None,
+    end_after_code: bool = False
 ) -> Agent:
     """
     Crea l'agente orchestratore master che coordina tutti gli specialist agents.
@@ -26,24 +29,32 @@ def create_orchestrator_agent(
         narrator_agent: Agent specializzato nelle narrazioni
         model: Modello LLM da usare (default: gpt-4o per reasoning complesso)
         memory: Memoria conversazionale (opzionale, può essere passata al run)
+        end_after_code: Se True la run termina appena code_generator risponde
+            (narrazione gestita dalla UI, fuori dal percorso critico)
     
     Returns:
         Agent orchestratore configurato con can_call() agli specialists
     """
-    client = OpenAIClient(api_key=api_key, model=model)
+    client = create_llm_client(api_key, model)
+
+    # Con end_after_code il code_generator è un tool "finale": dopo il calcolo non c'è un altro turno LLM
+    tools = [code_agent.as_tool(end=True)] if end_after_code else []
+    specialists = [explainer_agent, narrator_agent] if end_after_code else [code_agent, explainer_agent, narrator_agent]
     
-    orchestrator = Agent(
+    orchestrator = TracedAgent(
         name="orchestrator",
         client=client,
-        tools=[],  # Nessun tool diretto, usa can_call() per delegare
+        tools=tools,  # Nessun altro tool diretto, usa can_call() per delegare
         memory=memory,  # Memoria conversazionale
         system_prompt=ORCHESTRATOR_SYSTEM_PROMPT,
         max_steps=15, 
-        terminate_on_text=True
+        terminate_on_text=True,
+        stream=UI_STREAMING_ENABLED,
+        hooks=EventHooks()
     )
     
     # Registra gli specialist agents con can_call
     # Secondo la documentazione, can_call accetta una lista di agents [web:10]
-    orchestrator.can_call([code_agent, explainer_agent, narrator_agent])
+    orchestrator.can_call(specialists)
     
     return orchestrator
\ No newline at end of file
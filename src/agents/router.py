@@ -0,0 +1,166 @@
+"""
+Intent Router - Smista i messaggi prima dell'orchestrator
+
+Saluti, ringraziamenti e domande fuori tema ricevono una risposta a modello
+senza chiamate LLM; spiegazioni, narrazioni e calcoli vanno direttamente
+allo specialist giusto. Solo i messaggi ambigui arrivano all'orchestrator
+(o, se configurato, a un modello economico che li classifica).
+"""
+
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+from datapizza.core.clients import Client
+
+from src.agents.llm_client import create_llm_client
+from src.agents.config import ROUTER_SYSTEM_PROMPT, ROUTER_CANNED_REPLIES
+
+# Intenti
+GREETING = "greeting"
+THANKS = "thanks"
+OFF_TOPIC = "off_topic"
+EXPLAIN = "explain"
+NARRATE = "narrate"
+COMPUTE = "compute"
+UNKNOWN = "unknown"  # va all'orchestrator
+
+INTENTS = (GREETING, THANKS, OFF_TOPIC, EXPLAIN, NARRATE, COMPUTE, UNKNOWN)
+
+# ----------------------------------------
+# Regole
+# ----------------------------------------
+
+# Saluti/ringraziamenti: il messaggio deve contenere solo queste parole
+_GREETING_WORDS = {"ciao", "salve", "buongiorno", "buonasera", "buonanotte", "hey", "ehi", "ehila", "hello", "hi", "hola"}
+_THANKS_WORDS = {"grazie", "ringrazio", "thanks", "perfetto", "ottimo", "benissimo", "fantastico", "ok", "okay"}
+_FILLER_WORDS = {
+    "babbo", "natale", "santa", "claus", "ho", "oh", "a", "te", "ti", "anche", "e", "caro", "carissimo",
+    "come", "stai", "va", "tutto", "bene", "mille", "tante", "molte", "molto", "davvero", "di", "cuore",
+    "sei", "stato", "gentile", "gentilissimo", "allora", "per", "l", "aiuto", "tutti", "voi", "elfi",
+}
+
+# Ambito della fabbrica (giorni, assenze, sostituzioni, reparti, regole)
+_DOMAIN = re.compile(
+    r"sostitu|assen|malat|copr|copertur|turn|manca|mancan|ferie|permess|elf|repart|fabbrica|regol|jolly|"
+    r"luned|marted|mercoled|gioved|venerd|sabato|domenica|\bor[ae]\b|orari"
+)
+_COMPUTE = re.compile(r"sostitu|assen|malat|copr|copertur|manca|mancan|ferie|permess|calcol|trova")
+_DAYS = re.compile(r"luned|marted|mercoled|gioved|venerd|sabato|domenica")
+_EXPLAIN = re.compile(r"perch[eé]|come mai|spieg|motiv|ragion|giustific|chiarisc")
+_NARRATE = re.compile(r"storia|raccont|narra|fiaba|favola|poesia|filastrocca")
+_OFF_TOPIC = re.compile(
+    r"meteo|piov|ricett|cucin|calcio|partit|campionat|politic|elezion|borsa|bitcoin|criptovalut|"
+    r"\bfilm\b|serie tv|canzon|barzellett|oroscop|tradu[ci]|python|javascript|programmare"
+)
+
+
+@dataclass
+class Route:
+    """Decisione del router per un messaggio"""
+    intent: str
+    reply: Optional[str] = None  # risposta pronta (nessun agente da chiamare)
+    source: str = "rules"  # "rules" o "model"
+
+
+def _words(text: str):
+    return re.findall(r"[a-zàèéìòù]+", text.lower())
+
+
+def classify_by_rules(text: str) -> str:
+    """Classifica il messaggio con regole deterministiche (UNKNOWN se ambiguo)"""
+    lowered = text.lower()
+    words = _words(text)
+    if not words:
+        return UNKNOWN
+
+    vocabulary = set(words)
+    if vocabulary <= _GREETING_WORDS | _THANKS_WORDS | _FILLER_WORDS:
+        if vocabulary & _THANKS_WORDS:
+            return THANKS
+        if vocabulary & _GREETING_WORDS:
+            return GREETING
+
+    domain = bool(_DOMAIN.search(lowered))
+    if _OFF_TOPIC.search(lowered) and not domain:
+        return OFF_TOPIC
+
+    # Un'assenza con giorno/ora va calcolata anche se il messaggio chiede
+    # altro ("è assente lunedì perché...", "...raccontalo come una fiaba"):
+    # più compiti insieme, decide l'orchestrator
+    compute = bool(_COMPUTE.search(lowered) and (_DAYS.search(lowered) or re.search(r"\d", lowered)))
+    explain = bool(_EXPLAIN.search(lowered))
+    narrate = bool(_NARRATE.search(lowered))
+    if compute:
+        return UNKNOWN if explain or narrate else COMPUTE
+    if explain:
+        return EXPLAIN
+    if narrate:
+        # "calcola ... e raccontamelo": due compiti insieme, decide l'orchestrator
+        return UNKNOWN if re.search(r"calcol|trova", lowered) else NARRATE
+    return UNKNOWN
+
+
+class IntentRouter:
+    """
+    Router a regole, con un modello economico opzionale per i casi ambigui.
+    """
+
+    def __init__(self, client: Optional[Client] = None):
+        """
+        Args:
+            client: Client LLM economico per classificare i messaggi ambigui (None = solo regole)
+        """
+        self.client = client
+
+    def classify(self, text: str) -> Route:
+        intent = classify_by_rules(text)
+        if intent != UNKNOWN or self.client is None:
+            return Route(intent)
+        try:
+            response = self.client.invoke(text, system_prompt=ROUTER_SYSTEM_PROMPT, temperature=0, max_tokens=5)
+            label = response.text.strip().lower().strip(".")
+        except Exception as e:
+            print(f"⚠️ Classificazione del router fallita, uso l'orchestrator: {e}")
+            return Route(UNKNOWN)
+        return Route(label if label in INTENTS else UNKNOWN, source="model")
+
+    def route(self, text: str, has_substitutions: bool = False) -> Route:
+        """
+        Decide come gestire il messaggio.
+
+        Args:
+            text: Messaggio dell'utente
+            has_substitutions: True se ci sono sostituzioni in memoria
+
+        Returns:
+            Route con la risposta pronta se non serve nessun agente
+        """
+        route = self.classify(text)
+        if route.intent in (GREETING, THANKS, OFF_TOPIC):
+            route.reply = _canned(route.intent, text)
+        elif route.intent in (EXPLAIN, NARRATE) and not has_substitutions:
+            route.reply = _canned("no_history", text)
+        return route
+
+
+def _canned(kind: str, text: str) -> str:
+    """Risposta a modello, scelta in modo stabile in base al messaggio"""
+    replies = ROUTER_CANNED_REPLIES[kind]
+    return replies[zlib.crc32(text.encode("utf-8")) % len(replies)]
+
+
+def create_intent_router(api_key: str, model: str = "") -> IntentRouter:
+    """
+    Crea il router degli intenti.
+
+    Args:
+        api_key: OpenAI API key
+        model: Modello economico per i messaggi ambigui (vuoto = solo regole)
+
+    Returns:
+        IntentRouter configurato
+    """
+    client = create_llm_client(api_key, model) if model else None
+    return IntentRouter(client=client)
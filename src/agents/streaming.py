@@ -0,0 +1,32 @@
+"""
+Agent che pubblica i token della risposta mentre arrivano (`src/run_events.py`)
+"""
+
+from typing import Optional
+
+from datapizza.agents.agent import StepResult
+from datapizza.core.clients import ClientResponse
+
+from src.run_events import TOKEN, TracedAgent, emit, is_streaming
+
+
+class StreamingAgent(TracedAgent):
+    """
+    Agent usato come tool dall'orchestratore (narrator, explainer).
+
+    datapizza invoca gli agenti-tool con `a_run`, che attende la risposta
+    completa: se la UI sta ascoltando, la risposta viene invece letta in
+    streaming e ogni frammento di testo pubblicato come evento TOKEN.
+    """
+
+    async def a_run(self, task_input: str, **kwargs) -> Optional[StepResult]:
+        if not is_streaming():
+            return await super().a_run(task_input, **kwargs)
+
+        final = None
+        async for item in self.a_stream_invoke(task_input, **kwargs):
+            if isinstance(item, ClientResponse) and item.delta:
+                emit(TOKEN, self.name, item.delta)
+            elif isinstance(item, StepResult):
+                final = item
+        return final
@@ -0,0 +1,252 @@
+"""
+Indice di disponibilità precalcolato su un orario in formato largo ('GGG_O').
+
+Lo stato di ogni cella (elfo, giorno, ora) viene codificato una sola volta in
+array NumPy compatti, insieme alle maschere derivate usate dalle regole di
+sostituzione (Pausa pizza, co-assegnazione per reparto). Le ricerche dei
+candidati diventano letture di una colonna dell'array invece di scansioni
+del DataFrame.
+
+Modulo autosufficiente (solo numpy/pandas, nessun import da `src`): il suo
+sorgente viene incluso nel wrapper di esecuzione, così il codice generato
+trova l'indice già pronto nella variabile globale `indice` anche dentro
+le sandbox remote.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Codici di stato delle celle
+EMPTY = 0
+ASSIGNED = 1
+JOLLY = 2
+RM = 3
+CARB = 4
+ABS = 5
+SUB = 6
+PADDING = 255  # ora non presente nel file per quel giorno
+
+STATE_NAMES = {
+    EMPTY: "empty", ASSIGNED: "assigned", JOLLY: "jolly", RM: "rm",
+    CARB: "carb", ABS: "abs", SUB: "sub", PADDING: "padding",
+}
+
+ABS_PREFIX = "ABS - "
+SUB_PREFIX = "SUB - "
+_FIXED_CODES = {"": EMPTY, "Jolly": JOLLY, "RM": RM, "Carb": CARB}
+_SHIFT_COLUMN = re.compile(r"^([A-Z]{3})_(\d+)$")
+
+
+class AvailabilityIndex:
+    """
+    Stato dell'orario come array elfi × giorni × ore.
+
+    Attributi principali (ore 1-based sull'ultimo asse, indice 0 inutilizzato):
+        state: uint8, codice di stato della cella (EMPTY, ASSIGNED, JOLLY, ...)
+        department: int16, indice in `departments` del reparto della cella
+            (per ASSIGNED, ABS e SUB), -1 altrimenti
+        pizza: bool, ora vuota tra due ore "occupate da reparto" dello stesso giorno
+        coassigned: bool reparti × giorni × ore × elfi, elfi assegnati
+            (ASSIGNED o SUB) a ogni reparto in ogni ora
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        hats: Sequence[str],
+        days: Sequence[str],
+        departments: Sequence[str],
+        state: np.ndarray,
+        department: np.ndarray
+    ):
+        self.names = [str(n) for n in names]
+        self.hats = [str(h) for h in hats]
+        self.days = [str(d) for d in days]
+        self.departments = [str(d) for d in departments]
+        self.state = state
+        self.department = department
+        self.max_hour = state.shape[2] - 2
+
+        self._elf = {name: i for i, name in enumerate(self.names)}
+        self._day = {day: i for i, day in enumerate(self.days)}
+        self._dept = {dept: i for i, dept in enumerate(self.departments)}
+        self.green = np.array([h.strip().lower() == "verde" for h in self.hats], dtype=bool)
+        self._derive()
+
+    # ----------------------------------------
+    # Costruzione
+    # ----------------------------------------
+    @classmethod
+    def from_dataframe(
+        cls,
+        df: pd.DataFrame,
+        name_column: str = "Nome Elfo",
+        hat_column: str = "Cappello"
+    ) -> "AvailabilityIndex":
+        """
+        Costruisce l'indice da un orario con colonne turno 'GGG_O'.
+
+        Raises:
+            ValueError: Se mancano la colonna nomi o le colonne turno
+        """
+        if name_column not in df.columns:
+            raise ValueError(f"Colonna '{name_column}' non trovata")
+
+        slots: Dict[str, Dict[int, Any]] = {}
+        for col in df.columns:
+            match = _SHIFT_COLUMN.match(str(col))
+            if match:
+                slots.setdefault(match.group(1), {})[int(match.group(2))] = col
+        if not slots:
+            raise ValueError("Nessuna colonna turno nel formato 'GGG_O'")
+
+        days = list(slots)
+        max_hour = max(max(hours) for hours in slots.values())
+        shape = (len(df), len(days), max_hour + 2)
+        state = np.full(shape, PADDING, dtype=np.uint8)
+        department = np.full(shape, -1, dtype=np.int16)
+        departments: Dict[str, int] = {}
+
+        for d, day in enumerate(days):
+            for hour, col in slots[day].items():
+                for e, raw in enumerate(df[col].tolist()):
+                    value = "" if raw is None or (isinstance(raw, float) and np.isnan(raw)) else str(raw).strip()
+                    code = _FIXED_CODES.get(value)
+                    if code is not None:
+                        state[e, d, hour] = code
+                        continue
+                    if value.startswith(ABS_PREFIX):
+                        code, name = ABS, value[len(ABS_PREFIX):].strip()
+                    elif value.startswith(SUB_PREFIX):
+                        code, name = SUB, value[len(SUB_PREFIX):].strip()
+                    else:
+                        code, name = ASSIGNED, value
+                    state[e, d, hour] = code
+                    department[e, d, hour] = departments.setdefault(name, len(departments))
+
+        hats = df[hat_column].fillna("").astype(str).str.strip().tolist() if hat_column in df.columns else [""] * len(df)
+        names = df[name_column].fillna("").astype(str).str.strip().tolist()
+        return cls(names, hats, days, list(departments), state, department)
+
+    def _derive(self) -> None:
+        """Maschere derivate dallo stato (ricalcolate dopo ogni modifica)"""
+        busy = (self.state == ASSIGNED) | (self.state == SUB)
+        before = np.zeros_like(busy)
+        after = np.zeros_like(busy)
+        before[:, :, 1:] = busy[:, :, :-1]
+        after[:, :, :-1] = busy[:, :, 1:]
+        self.pizza = (self.state == EMPTY) & before & after
+
+        n_dept = max(len(self.departments), 1)
+        self.coassigned = np.zeros((n_dept,) + self.state.shape[1:] + (self.state.shape[0],), dtype=bool)
+        e, d, h = np.nonzero(busy)
+        if len(e):
+            self.coassigned[self.department[e, d, h], d, h, e] = True
+
+    def save(self, path) -> None:
+        """Salva l'indice in formato .npz (le maschere derivate vengono ricalcolate al caricamento)"""
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                names=np.array(self.names, dtype=object),
+                hats=np.array(self.hats, dtype=object),
+                days=np.array(self.days, dtype=object),
+                departments=np.array(self.departments, dtype=object),
+                state=self.state,
+                department=self.department,
+            )
+
+    @classmethod
+    def load(cls, path) -> "AvailabilityIndex":
+        data = np.load(path, allow_pickle=True)
+        return cls(
+            data["names"].tolist(), data["hats"].tolist(), data["days"].tolist(),
+            data["departments"].tolist(), data["state"], data["department"]
+        )
+
+    def with_absences(self, absences: Sequence[Dict[str, Any]]) -> "AvailabilityIndex":
+        """
+        Copia dell'indice con assenze aggiuntive ({"elfo", "giorno", "ora"};
+        ora None = tutte le ore con un reparto). Le celle con un reparto
+        diventano ABS, le altre (solo con ora esplicita) RM, cioè non disponibili.
+        """
+        state = self.state.copy()
+        for absence in absences:
+            e = self._elf.get(str(absence.get("elfo", "")).strip())
+            d = self._day.get(str(absence.get("giorno", ""))[:3].upper())
+            if e is None or d is None:
+                continue
+            hour = absence.get("ora")
+            hours = [int(hour)] if hour is not None else range(1, self.max_hour + 1)
+            for h in hours:
+                if not 0 < h <= self.max_hour or state[e, d, h] in (PADDING, ABS):
+                    continue
+                if state[e, d, h] in (ASSIGNED, SUB):
+                    state[e, d, h] = ABS
+                elif hour is not None:
+                    state[e, d, h] = RM
+        return AvailabilityIndex(self.names, self.hats, self.days, self.departments, state, self.department)
+
+    # ----------------------------------------
+    # Ricerche per (giorno, ora)
+    # ----------------------------------------
+    def _slot(self, day: str, hour: int):
+        return self._day[str(day)[:3].upper()], int(hour)
+
+    def _names(self, mask: np.ndarray) -> List[str]:
+        return [self.names[i] for i in np.flatnonzero(mask)]
+
+    def jolly(self, day: str, hour: int) -> List[str]:
+        """Elfi con 'Jolly' in quell'ora, in ordine di file"""
+        d, h = self._slot(day, hour)
+        return self._names(self.state[:, d, h] == JOLLY)
+
+    def pizza_break(self, day: str, hour: int) -> List[str]:
+        """Elfi in Pausa pizza (ora vuota tra due ore assegnate) in quell'ora"""
+        d, h = self._slot(day, hour)
+        return self._names(self.pizza[:, d, h])
+
+    def same_department(self, day: str, hour: int, department: str, hat: Optional[str] = None) -> List[str]:
+        """Elfi assegnati al reparto in quell'ora, opzionalmente filtrati per cappello"""
+        d, h = self._slot(day, hour)
+        k = self._dept.get(department)
+        if k is None:
+            return []
+        mask = self.coassigned[k, d, h].copy()
+        if hat is not None:
+            mask &= np.array([x.strip().lower() == hat.strip().lower() for x in self.hats])
+        return self._names(mask)
+
+    def state_of(self, elf: str, day: str, hour: int) -> str:
+        """Stato della cella come stringa ('assigned', 'jolly', 'abs', ...)"""
+        d, h = self._slot(day, hour)
+        return STATE_NAMES[int(self.state[self._elf[elf], d, h])]
+
+    def department_of(self, elf: str, day: str, hour: int) -> Optional[str]:
+        """Reparto della cella (anche per 'ABS - X' e 'SUB - X'), None se non applicabile"""
+        d, h = self._slot(day, hour)
+        k = int(self.department[self._elf[elf], d, h])
+        return self.departments[k] if k >= 0 else None
+
+    def absences(self, day: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Assenze ('ABS') in ordine giorno, ora, riga: {"elfo", "cappello", "giorno", "ora", "reparto"}"""
+        mask = self.state == ABS
+        if day is not None:
+            keep = np.zeros(len(self.days), dtype=bool)
+            keep[self._day[str(day)[:3].upper()]] = True
+            mask = mask & keep[None, :, None]
+        e, d, h = np.nonzero(mask)
+        order = np.lexsort((e, h, d))
+        return [
+            {
+                "elfo": self.names[e[i]],
+                "cappello": self.hats[e[i]],
+                "giorno": self.days[d[i]],
+                "ora": int(h[i]),
+                "reparto": self.departments[self.department[e[i], d[i], h[i]]],
+            }
+            for i in order
+        ]
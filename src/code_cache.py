@@ -0,0 +1,342 @@
+"""
+Cache persistente dei programmi generati dal Code Generator.
+
+Regole e struttura di un template cambiano di rado, mentre le richieste
+differiscono quasi sempre solo per elfo, giorno e ora. La richiesta viene
+quindi normalizzata: nomi degli elfi, giorni e ore diventano segnaposto e i
+valori concreti vengono passati al programma come `params`. Un programma
+eseguito con successo viene salvato con chiave
+    hash(regole + struttura + colonne del file + richiesta normalizzata)
+e riusato per tutte le richieste con la stessa forma, saltando le chiamate
+LLM di generazione del codice.
+"""
+
+import ast
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.config import (
+    CODE_CACHE_FILE,
+    CODE_CACHE_MAX_ENTRIES,
+    CODE_CACHE_TTL_HOURS,
+)
+
+# Versione del contratto codice/wrapper: cambiandola si invalida tutta la cache
+CODE_CACHE_VERSION = 2  # 2: esclusi i programmi con valori della richiesta nel codice
+
+# Nomi dei giorni (senza accenti) -> codice usato nelle colonne turno
+DAY_ALIASES = {
+    "lunedi": "LUN", "lun": "LUN",
+    "martedi": "MAR", "mar": "MAR",
+    "mercoledi": "MER", "mer": "MER",
+    "giovedi": "GIO", "gio": "GIO",
+    "venerdi": "VEN", "ven": "VEN",
+    "sabato": "SAB", "sab": "SAB",
+    "domenica": "DOM", "dom": "DOM",
+}
+
+ORDINAL_HOURS = {
+    "prima": 1, "seconda": 2, "terza": 3, "quarta": 4, "quinta": 5,
+    "sesta": 6, "settima": 7, "ottava": 8,
+}
+
+# Riferimenti diretti a una colonna turno: 'LUN_3'
+SHIFT_PATTERN = re.compile(r"\b(lun|mar|mer|gio|ven|sab|dom)_(\d{1,2})\b")
+# 'ora 3', '3^ ora', '3a ora', '3° ora', 'terza ora'
+HOUR_PATTERN = re.compile(
+    r"\bor[ae]\s+(\d{1,2})\b"
+    r"|\b(\d{1,2})\s*(?:\^|°|ª|a)?\s*ora\b"
+    r"|\b(" + "|".join(ORDINAL_HOURS) + r")\s+ora\b"
+)
+DAY_PATTERN = re.compile(r"\b(" + "|".join(sorted(DAY_ALIASES, key=len, reverse=True)) + r")\b")
+
+ELF_TOKEN = "<elfo>"
+DAY_TOKEN = "<giorno>"
+HOUR_TOKEN = "<ora>"
+
+
+@dataclass
+class RequestSignature:
+    """Richiesta normalizzata e parametri estratti"""
+    text: str
+    params: Dict[str, Any]
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(c)
+    )
+
+
+def normalize_request(request: str, names: Iterable[str]) -> RequestSignature:
+    """
+    Sostituisce nomi degli elfi, giorni e ore con segnaposto.
+
+    Args:
+        request: Testo della richiesta ricevuta dal Code Generator
+        names: Nomi degli elfi presenti nell'orario
+
+    Returns:
+        RequestSignature con testo normalizzato e parametri
+        {"elfi": [...], "giorni": [...], "ore": [...]} in ordine di apparizione
+    """
+    text = _strip_accents(request.lower())
+    found: List[Tuple[int, str, Any]] = []
+
+    # Nomi più lunghi per primi: 'Choco-Effo' non deve diventare '<elfo>-Effo'
+    for name in sorted({str(n).strip() for n in names if str(n).strip()}, key=len, reverse=True):
+        pattern = re.compile(r"(?<![\w-])" + re.escape(_strip_accents(name.lower())) + r"(?![\w-])")
+        for match in pattern.finditer(text):
+            found.append((match.start(), "elfi", name))
+        text = pattern.sub(ELF_TOKEN, text)
+
+    def _hour(match: re.Match) -> str:
+        value = match.group(1) or match.group(2)
+        found.append((match.start(), "ore", int(value) if value else ORDINAL_HOURS[match.group(3)]))
+        return HOUR_TOKEN
+
+    def _day(match: re.Match) -> str:
+        found.append((match.start(), "giorni", DAY_ALIASES[match.group(1)]))
+        return DAY_TOKEN
+
+    def _shift(match: re.Match) -> str:
+        found.append((match.start(), "giorni", DAY_ALIASES[match.group(1)]))
+        found.append((match.start(), "ore", int(match.group(2))))
+        return f"{DAY_TOKEN} {HOUR_TOKEN}"
+
+    # Le posizioni servono solo per l'ordine relativo dentro ogni categoria
+    text = SHIFT_PATTERN.sub(_shift, text)
+    text = HOUR_PATTERN.sub(_hour, text)
+    text = DAY_PATTERN.sub(_day, text)
+
+    params: Dict[str, Any] = {"elfi": [], "giorni": [], "ore": []}
+    for _, kind, value in sorted(found, key=lambda item: item[0]):
+        params[kind].append(value)
+
+    text = re.sub(r"[^\w<>]+", " ", text)
+    return RequestSignature(text=" ".join(text.split()), params=params)
+
+
+def hardcoded_params(code: str, params: Dict[str, Any]) -> List[str]:
+    """
+    Valori della richiesta scritti come letterali nel codice invece che letti
+    da `params`. Un programma così risponde sempre alla richiesta originale:
+    riusato per un'altra richiesta con la stessa forma darebbe sostituzioni
+    sbagliate ma valide, quindi non va messo in cache.
+
+    Cerca stringhe con il nome di un elfo richiesto, il giorno richiesto (non
+    un elenco di tutti i giorni) o la colonna turno 'GGG_O' richiesta, e
+    confronti tra una variabile dell'ora e l'ora richiesta.
+
+    Returns:
+        Letterali trovati (lista vuota se il programma è parametrico)
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return ["<codice non analizzabile>"]
+
+    elves = [_strip_accents(str(e).lower()) for e in params.get("elfi") or []]
+    days = {str(d) for d in params.get("giorni") or []}
+    hours = {int(h) for h in params.get("ore") or [] if str(h).isdigit()}
+    shifts = {f"{d}_{h}".lower() for d in days for h in hours}
+
+    strings = [
+        _strip_accents(node.value.lower()) for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, str)
+    ]
+    day_literals = {DAY_ALIASES[text.strip()] for text in strings if text.strip() in DAY_ALIASES}
+    found: List[str] = []
+    for text in strings:
+        if any(re.search(r"(?<![\w-])" + re.escape(elf) + r"(?![\w-])", text) for elf in elves if elf):
+            found.append(text)
+        elif text.strip() in shifts:
+            found.append(text)
+        # Un elenco di più giorni (es. tutti i giorni della settimana) è codice generico
+        elif len(day_literals) < 3 and DAY_ALIASES.get(text.strip()) in days:
+            found.append(text)
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Compare):
+            continue
+        operands = [node.left, *node.comparators]
+        names = " ".join(ast.unparse(o).lower() for o in operands if not isinstance(o, ast.Constant))
+        if not re.search(r"\bora\b|\bore\b|hour", names):
+            continue
+        for operand in operands:
+            if isinstance(operand, ast.Constant) and type(operand.value) is int and operand.value in hours:
+                found.append(ast.unparse(node))
+    return found
+
+
+def rules_fingerprint(rules: str, structure: str) -> str:
+    """Hash di regole e struttura (spazi normalizzati)"""
+    payload = " ".join(rules.split()) + "\x00" + " ".join(structure.split())
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(rules_hash: str, columns: Iterable[str], signature: str) -> str:
+    """Chiave della cache: regole, colonne del file e richiesta normalizzata"""
+    payload = json.dumps(
+        [CODE_CACHE_VERSION, rules_hash, [str(c) for c in columns], signature],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CodeCache:
+    """Cache persistente (JSON) dei programmi riusciti, con eviction LRU e TTL"""
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = 256,
+        ttl_seconds: float = 7 * 24 * 3600,
+        save_interval: float = 30
+    ):
+        """
+        Args:
+            path: File JSON in cui persistere la cache
+            max_entries: Numero massimo di programmi (oltre si elimina il meno usato)
+            ttl_seconds: Programmi non usati da più di questo tempo vengono scartati
+            save_interval: Intervallo minimo tra due salvataggi dovuti solo agli hit
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_interval = save_interval
+
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Cache del codice illeggibile, la ricreo: {e}")
+            return {}
+        if data.get("version") != CODE_CACHE_VERSION:
+            return {}
+        return data.get("entries", {})
+
+    def _save(self) -> None:
+        """Scrittura atomica dell'indice (chiamare col lock)"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CODE_CACHE_VERSION, "entries": self._entries}, f, ensure_ascii=False)
+            tmp_path.replace(self.path)
+            self._last_save = time.time()
+            self._dirty = False
+        except OSError as e:
+            print(f"⚠️ Impossibile salvare la cache del codice: {e}")
+
+    def _evict(self, now: float) -> None:
+        """Scarta i programmi scaduti e quelli oltre la capienza (chiamare col lock)"""
+        for key, entry in list(self._entries.items()):
+            if now - entry["last_used"] > self.ttl_seconds:
+                del self._entries[key]
+        if len(self._entries) > self.max_entries:
+            by_age = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+            for key in by_age[:len(self._entries) - self.max_entries]:
+                del self._entries[key]
+
+    def get(self, key: str) -> Optional[str]:
+        """Restituisce il codice in cache per la chiave, se presente e non scaduto"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry["last_used"] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            entry["last_used"] = now
+            entry["hits"] = entry.get("hits", 0) + 1
+            self.hits += 1
+            self._dirty = True
+            if now - self._last_save > self.save_interval:
+                self._save()
+            return entry["code"]
+
+    def put(self, key: str, code: str, rules_hash: str, signature: str) -> None:
+        """Salva un programma eseguito con successo"""
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "code": code,
+                "rules_hash": rules_hash,
+                "signature": signature,
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+            }
+            self._evict(now)
+            self._save()
+
+    def invalidate(self, key: str) -> None:
+        """Elimina un programma (es. fallito su un nuovo orario)"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def invalidate_rules(self, rules_hash: str) -> int:
+        """Elimina tutti i programmi generati per una versione di regole/struttura"""
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e.get("rules_hash") == rules_hash]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._save()
+            return len(stale)
+
+    def programs(self, rules_hash: Optional[str] = None) -> List[Dict[str, str]]:
+        """Programmi in cache ({"key", "signature", "code"}), opzionalmente per versione di regole"""
+        with self._lock:
+            return [
+                {"key": key, "signature": entry.get("signature", ""), "code": entry["code"]}
+                for key, entry in self._entries.items()
+                if rules_hash is None or entry.get("rules_hash") == rules_hash
+            ]
+
+    def flush(self) -> None:
+        """Salva su disco gli aggiornamenti pendenti (ultimi utilizzi)"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche della cache (per la modalità debug)"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[CodeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CodeCache:
+    """Restituisce la cache process-wide dei programmi, creandola al primo utilizzo"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CodeCache(
+                CODE_CACHE_FILE,
+                max_entries=CODE_CACHE_MAX_ENTRIES,
+                ttl_seconds=CODE_CACHE_TTL_HOURS * 3600
+            )
+        return _cache
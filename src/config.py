@@ -15,9 +15,13 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 E2B_API_KEY = os.getenv("E2B_API_KEY")
 
+# Backend di esecuzione del codice generato:
+# "e2b" (sandbox remota), "local" (sottoprocesso) o "forkserver" (fork di un processo pre-caricato)
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "e2b").lower()
+
 if not OPENAI_API_KEY:
     raise ValueError("❌ OPENAI_API_KEY non trovata nel file .env")
-if not E2B_API_KEY:
+if EXECUTOR_BACKEND == "e2b" and not E2B_API_KEY:
     raise ValueError("❌ E2B_API_KEY non trovata nel file .env")
 
 # ========================================
@@ -29,6 +33,45 @@ EXPLAINER_MODEL = "gpt-4o"
 NARRATOR_MODEL = "gpt-4o-mini"
 ORCHESTRATOR_MODEL = "gpt-4o" 
 
+# Streaming di avanzamento e risposta nella chat (false = solo spinner fino alla risposta completa)
+UI_STREAMING_ENABLED = os.getenv("UI_STREAMING_ENABLED", "true").lower() == "true"
+
+# Narrazione dopo un calcolo: "inline" (l'orchestrator chiama il narrator prima di rispondere),
+# "background" (tabella subito, storia LLM generata dopo) o "template" (storia deterministica, nessuna chiamata LLM)
+NARRATION_MODE = os.getenv("NARRATION_MODE", "background").lower()
+
+# Router degli intenti davanti all'orchestrator: saluti, ringraziamenti e fuori tema con risposta
+# a modello, spiegazioni/narrazioni/calcoli direttamente allo specialist
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_MODEL = os.getenv("ROUTER_MODEL", "")  # modello economico per i messaggi ambigui (es. gpt-4o-mini); vuoto = solo regole
+
+# Grafi di agenti riusati tra i messaggi (chiave: modelli, file, struttura, regole)
+AGENT_POOL_MAX_GRAPHS = 8  # configurazioni distinte tenute in memoria (eviction LRU)
+AGENT_POOL_MAX_IDLE_PER_KEY = 4  # grafi inattivi per configurazione (uno per richiesta concorrente)
+
+# ========================================
+# MEMORIA CONVERSAZIONALE
+# ========================================
+
+# Vista della memoria passata agli agenti: ultimi turni entro il budget, i più vecchi nel riassunto progressivo
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "3000"))  # token massimi (finestra + riassunto)
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "8"))  # turni recenti mantenuti per intero
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "600"))  # oltre si scartano le righe più vecchie
+# Sostituzioni precedenti iniettate nei prompt di code generator ed explainer (solo quelle pertinenti alla richiesta)
+HISTORY_PROMPT_MAX_ENTRIES = int(os.getenv("HISTORY_PROMPT_MAX_ENTRIES", "40"))
+
+# ========================================
+# LLM HTTP POOL
+# ========================================
+
+# Endpoint compatibile OpenAI alternativo (es. stand-in locale per i test); vuoto = OpenAI
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "")
+LLM_HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+LLM_HTTP_MAX_KEEPALIVE_PER_HOST = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_PER_HOST", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))  # secondi di inattività prima di chiudere una connessione
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))  # timeout di una chiamata LLM (secondi)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"  # richiede il pacchetto 'h2'
+
 # ========================================
 # STREAMLIT CONFIG
 # ========================================
@@ -62,10 +105,32 @@ ICONS = {
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = PROJECT_ROOT / "app" / "data"
 FILE_DIR = PROJECT_ROOT / "src" / "data"
+# Ore per cui un file caricato senza più sessioni che lo usano viene conservato
+UPLOAD_RETENTION_HOURS = float(os.getenv("UPLOAD_RETENTION_HOURS", "24"))
+# Copie colonnari (Parquet) degli orari, con l'hash del contenuto come nome
+COLUMNAR_CACHE_DIR = DATA_DIR / "cache"
+# Programmi generati ed eseguiti con successo, riusati tra richieste simili
+CODE_CACHE_FILE = DATA_DIR / "code_cache.json"
+
+# Persistenza di sessioni, chat, memoria e sostituzioni: "sqlite" (file condivisibile tra repliche) o "memory"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH", str(DATA_DIR / "state.db")))
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "0.5"))  # secondi tra due scritture in batch
+STATE_FLUSH_BATCH = int(os.getenv("STATE_FLUSH_BATCH", "200"))  # scritture in coda oltre cui si scrive subito
+STATE_FLUSH_RETRIES = int(os.getenv("STATE_FLUSH_RETRIES", "3"))  # tentativi di un batch prima di scartare le scritture non valide
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))  # messaggi della chat caricati per pagina
+
+# Budget di memoria per lo stato delle sessioni residenti: oltre il budget (o dopo
+# SESSION_IDLE_SECONDS di inattività) le sessioni inattive vengono scaricate su disco
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))  # 0 = solo a budget superato
+SESSION_MIN_IDLE_SECONDS = 60  # le sessioni usate più di recente non vengono mai scaricate
+SESSION_OFFLOAD_RETENTION_HOURS = float(os.getenv("SESSION_OFFLOAD_RETENTION_HOURS", "24"))
 
 # Create directories if none exist
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 FILE_DIR.mkdir(parents=True, exist_ok=True)
+COLUMNAR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Template Global initialization
 TEMPLATES_FILE = PROJECT_ROOT / "src" / "templates" / "default_templates.yaml"
@@ -77,9 +142,68 @@ TEMPLATES_FILE = PROJECT_ROOT / "src" / "templates" / "default_templates.yaml"
 E2B_TIMEOUT = 300  # 5 minute sandbox timeout
 E2B_SANDBOX_TEMPLATE = "python"
 
+# Pool di sandbox pre-avviate (condiviso da tutto il processo)
+E2B_POOL_MIN_SIZE = int(os.getenv("E2B_POOL_MIN_SIZE", "1"))
+E2B_POOL_MAX_SIZE = int(os.getenv("E2B_POOL_MAX_SIZE", "4"))
+E2B_POOL_IDLE_TIMEOUT = 240  # secondi di inattività prima di chiudere una sandbox oltre il minimo
+E2B_POOL_ACQUIRE_TIMEOUT = 60  # attesa massima per un lease con pool saturo
+E2B_POOL_HEALTHCHECK_INTERVAL = 30  # secondi tra due health check
+E2B_UPLOAD_COMPRESS_MIN_BYTES = 256 * 1024  # sopra questa dimensione i file viaggiano compressi
+
+# ========================================
+# LOCAL EXECUTOR CONFIG
+# ========================================
+
+LOCAL_EXECUTOR_TIMEOUT = 60  # limite tempo reale (secondi)
+LOCAL_EXECUTOR_CPU_SECONDS = 30  # limite tempo CPU (RLIMIT_CPU)
+LOCAL_EXECUTOR_MEMORY_MB = 2048  # limite memoria virtuale (RLIMIT_AS)
+
+# Moduli che il codice generato può importare direttamente
+LOCAL_EXECUTOR_ALLOWED_IMPORTS = [
+    "pandas", "numpy", "json", "math", "re", "datetime", "collections",
+    "itertools", "functools", "typing", "dataclasses", "string", "copy",
+    "operator", "statistics", "enum", "unicodedata"
+]
+
+# Fork-server: numero di DataFrame (per hash del file) tenuti in memoria dal processo padre
+FORKSERVER_DF_CACHE_SIZE = 16
+
+# Diagnostica del wrapper (tutti i backend): righe del profilo cProfile di
+# calcola_sostituzioni nel risultato (0 = disattivato) e soglia oltre cui la
+# funzione viene segnalata come lenta
+SANDBOX_PROFILE_TOP_N = int(os.getenv("SANDBOX_PROFILE_TOP_N", "0"))
+SANDBOX_SLOW_CALL_SECONDS = float(os.getenv("SANDBOX_SLOW_CALL_SECONDS", "2"))
+
+# ========================================
+# CODE CACHE CONFIG
+# ========================================
+
+CODE_CACHE_ENABLED = os.getenv("CODE_CACHE_ENABLED", "true").lower() == "true"
+CODE_CACHE_MAX_ENTRIES = 256  # programmi tenuti in cache (eviction LRU)
+CODE_CACHE_TTL_HOURS = float(os.getenv("CODE_CACHE_TTL_HOURS", "168"))  # scadenza di un programma non più usato
+
+# Solver nativi (senza LLM) per i template con regole deterministiche
+NATIVE_SOLVER_ENABLED = os.getenv("NATIVE_SOLVER_ENABLED", "true").lower() == "true"
+
+# ========================================
+# LLM RESPONSE CACHE CONFIG
+# ========================================
+
+# off | record (riusa le risposte già viste, registra le nuove) | replay (solo risposte registrate)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", str(DATA_DIR / "llm_cache")))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))  # oltre si eliminano le risposte meno usate
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))  # 0 = nessuna scadenza
+
 # ========================================
 # LOGGING CONFIG
 # ========================================
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-ENABLE_TRACING = os.getenv("ENABLE_TRACING", "true").lower() == "true"
\ No newline at end of file
+ENABLE_TRACING = os.getenv("ENABLE_TRACING", "true").lower() == "true"
+# Destinazioni degli span (separate da virgola): "jsonl" (file locale), "otlp" (collector HTTP), "none"
+TRACE_EXPORTERS = [e.strip() for e in os.getenv("TRACE_EXPORTERS", "jsonl").lower().split(",") if e.strip()]
+TRACE_FILE = Path(os.getenv("TRACE_FILE", str(DATA_DIR / "traces.jsonl")))
+TRACE_FILE_MAX_MB = 50  # oltre questa dimensione il file viene ruotato in .1
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_KEEP_REQUESTS = 50  # richieste recenti tenute in memoria per la waterfall in debug
@@ -7,17 +7,38 @@ from typing import Any, Dict, Optional
 from datetime import datetime
 
 from .models import ConfigSetup
+from .config import MESSAGES_PAGE_SIZE
+from .state_backend import StateBackend, get_state_backend
 
 class SessionManager:
-    """Gestisce lo stato della sessione Streamlit in modo type-safe"""
-   
-    def __init__(self):
-        """Inizializza session state se non esiste"""
+    """
+    Gestisce lo stato della sessione Streamlit in modo type-safe.
+
+    `st.session_state` fa da cache: configurazione e messaggi vengono letti
+    dal backend di persistenza quando la sessione viene ripresa (reload della
+    pagina, riavvio del server, altra replica) e ogni modifica viene salvata.
+    """
+
+    def __init__(self, session_id: str = "", backend: Optional[StateBackend] = None):
+        """
+        Inizializza session state se non esiste
+
+        Args:
+            session_id: ID della sessione (vuoto = nessuna persistenza)
+            backend: Backend di persistenza (default: quello process-wide)
+        """
+        self.session_id = session_id
+        self.backend = (backend or get_state_backend()) if session_id else None
+
         if "config" not in st.session_state:
-            st.session_state.config = None
-        
+            saved = self.backend.load_session(session_id) if self.backend else None
+            st.session_state.config = saved.get("config") if saved else None
+
         if "messages" not in st.session_state:
-            st.session_state.messages = []
+            # Solo gli ultimi messaggi: i precedenti si caricano su richiesta
+            stored = self.backend.load_messages(session_id, limit=MESSAGES_PAGE_SIZE) if self.backend else []
+            st.session_state.messages = [message for _, message in stored]
+            st.session_state.messages_oldest_seq = stored[0][0] if stored else None
 
     def is_configured(self) -> bool:
         """Verifica se il sistema è configurato"""
@@ -31,7 +52,9 @@ class SessionManager:
             config_dict: Dizionario con file_path, struttura, regole, etc.
         """
         config = ConfigSetup(**config_dict)
-        st.session_state.config = config.model_dump()
+        st.session_state.config = config.model_dump(mode="json")
+        if self.backend is not None:
+            self.backend.save_config(self.session_id, st.session_state.config)
     
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -56,7 +79,44 @@ class SessionManager:
         """Reset completo della configurazione"""
         st.session_state.config = None
         st.session_state.messages = []
+        st.session_state.messages_oldest_seq = None
+        if self.backend is not None:
+            self.backend.clear_session(self.session_id)
     
     def get_messages(self) -> list:
         """Restituisce tutti i messaggi della chat"""
-        return st.session_state.messages
\ No newline at end of file
+        return st.session_state.messages
+
+    def add_message(self, message: Dict[str, Any]) -> None:
+        """
+        Aggiunge un messaggio alla chat (e al backend)
+
+        Args:
+            message: Dizionario con role, content ed eventuali substitutions_data
+        """
+        st.session_state.messages.append(message)
+        if self.backend is not None:
+            self.backend.append_message(self.session_id, message)
+
+    def has_older_messages(self) -> bool:
+        """True se nel backend ci sono messaggi più vecchi di quelli caricati"""
+        oldest = st.session_state.get("messages_oldest_seq")
+        if self.backend is None or oldest is None:
+            return False
+        return bool(self.backend.load_messages(self.session_id, limit=1, before=oldest))
+
+    def load_older_messages(self) -> int:
+        """
+        Carica la pagina di messaggi precedente
+
+        Returns:
+            Numero di messaggi caricati
+        """
+        oldest = st.session_state.get("messages_oldest_seq")
+        if self.backend is None or oldest is None:
+            return 0
+        stored = self.backend.load_messages(self.session_id, limit=MESSAGES_PAGE_SIZE, before=oldest)
+        if stored:
+            st.session_state.messages = [message for _, message in stored] + st.session_state.messages
+            st.session_state.messages_oldest_seq = stored[0][0]
+        return len(stored)
\ No newline at end of file
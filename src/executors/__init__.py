@@ -0,0 +1,90 @@
+"""
+Executors package - Backend intercambiabili per l'esecuzione del codice generato
+"""
+
+import threading
+from typing import Optional
+
+from src.config import (
+    EXECUTOR_BACKEND,
+    LOCAL_EXECUTOR_TIMEOUT,
+    LOCAL_EXECUTOR_CPU_SECONDS,
+    LOCAL_EXECUTOR_MEMORY_MB,
+    LOCAL_EXECUTOR_ALLOWED_IMPORTS,
+    FORKSERVER_DF_CACHE_SIZE,
+    SANDBOX_PROFILE_TOP_N,
+)
+from .base import CodeExecutor, build_wrapper, error_result
+from .result_cache import ExecutionResultCache
+
+_executor: Optional[CodeExecutor] = None
+_executor_lock = threading.Lock()
+
+# Risultati riusciti indicizzati per (hash contenuto file, hash codice)
+result_cache = ExecutionResultCache()
+
+
+def create_executor(backend: str) -> CodeExecutor:
+    """
+    Crea il backend di esecuzione indicato.
+
+    Args:
+        backend: "e2b" (sandbox remota), "local" (sottoprocesso isolato)
+            oppure "forkserver" (figli forkati da un processo con pandas pre-caricato)
+
+    Raises:
+        ValueError: Se il backend non è supportato
+    """
+    backend = backend.lower().strip()
+
+    if backend == "e2b":
+        # Import lazy: il backend locale non deve richiedere E2B
+        from .e2b_executor import E2BExecutor
+        return E2BExecutor(profile_top_n=SANDBOX_PROFILE_TOP_N)
+
+    if backend == "local":
+        from .local_executor import LocalExecutor
+        return LocalExecutor(
+            timeout=LOCAL_EXECUTOR_TIMEOUT,
+            cpu_seconds=LOCAL_EXECUTOR_CPU_SECONDS,
+            memory_mb=LOCAL_EXECUTOR_MEMORY_MB,
+            allowed_imports=LOCAL_EXECUTOR_ALLOWED_IMPORTS,
+            profile_top_n=SANDBOX_PROFILE_TOP_N
+        )
+
+    if backend == "forkserver":
+        from .forkserver_executor import ForkServerExecutor, is_supported
+        if is_supported():
+            return ForkServerExecutor(
+                timeout=LOCAL_EXECUTOR_TIMEOUT,
+                cpu_seconds=LOCAL_EXECUTOR_CPU_SECONDS,
+                memory_mb=LOCAL_EXECUTOR_MEMORY_MB,
+                allowed_imports=LOCAL_EXECUTOR_ALLOWED_IMPORTS,
+                df_cache_size=FORKSERVER_DF_CACHE_SIZE,
+                profile_top_n=SANDBOX_PROFILE_TOP_N
+            )
+        print("⚠️ Fork-server non supportato su questa piattaforma, uso il backend 'local'")
+        return create_executor("local")
+
+    raise ValueError(
+        f"Backend di esecuzione '{backend}' non supportato. Disponibili: e2b, local, forkserver"
+    )
+
+
+def get_executor() -> CodeExecutor:
+    """Restituisce il backend configurato in `src/config.py` (singleton di processo)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_executor(EXECUTOR_BACKEND)
+        return _executor
+
+
+__all__ = [
+    "CodeExecutor",
+    "build_wrapper",
+    "error_result",
+    "create_executor",
+    "get_executor",
+    "result_cache"
+]
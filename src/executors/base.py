@@ -0,0 +1,266 @@
+"""
+Interfaccia comune dei backend di esecuzione e wrapper condiviso.
+
+Ogni backend esegue il modulo `user_logic.py` generato dall'LLM e restituisce
+una stringa JSON con il contratto del tool:
+    {"success": true, "output": [...]}
+    {"success": false, "error": "...", "traceback": "..."}
+"""
+
+import json
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+# Nome con cui il file dell'orario viene messo a disposizione del wrapper
+REMOTE_FILENAME = "orario_input.xlsx"
+# Nome della copia colonnare (Parquet) dell'orario, se disponibile
+REMOTE_COLUMNAR_FILENAME = "orario_input.parquet"
+# Nome dell'indice di disponibilità precalcolato (.npz), se disponibile
+REMOTE_INDEX_FILENAME = "orario_input.index.npz"
+
+
+# Sorgente dell'indice di disponibilità, incluso nel wrapper (modulo senza dipendenze da src)
+INDEX_MODULE_PATH = Path(__file__).resolve().parent.parent / "availability_index.py"
+
+
+@lru_cache(maxsize=1)
+def _index_source() -> str:
+    return INDEX_MODULE_PATH.read_text(encoding="utf-8")
+
+
+def error_result(error: str, traceback_text: Optional[str] = None) -> str:
+    """Serializza un errore secondo il contratto JSON del tool"""
+    payload = {"success": False, "error": error}
+    if traceback_text:
+        payload["traceback"] = traceback_text
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def _import_guard_snippet(allowed_imports: Iterable[str]) -> str:
+    """
+    Codice che limita gli import fatti direttamente da `user_logic`.
+    Le librerie importate da pandas & co. non sono toccate.
+    """
+    allowed = sorted(set(allowed_imports))
+    return f"""
+import builtins as _builtins
+
+_ALLOWED_IMPORTS = set({allowed!r})
+_real_import = _builtins.__import__
+
+def _guarded_import(name, globals=None, locals=None, fromlist=(), level=0):
+    caller = globals if globals is not None else sys._getframe(1).f_globals
+    if level == 0 and caller.get('__name__', '').split('.')[0] == 'user_logic':
+        if name.split('.')[0] not in _ALLOWED_IMPORTS:
+            raise ImportError(f"Import di '{{name}}' non consentito nella sandbox")
+    return _real_import(name, globals, locals, fromlist, level)
+
+_builtins.__import__ = _guarded_import
+"""
+
+
+def build_wrapper(
+    workdir: str,
+    data_filename: str = REMOTE_FILENAME,
+    allowed_imports: Optional[Iterable[str]] = None,
+    preamble: str = "",
+    preloaded_df: bool = False,
+    columnar_filename: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None,
+    profile_top_n: int = 0,
+    index_filename: Optional[str] = None
+) -> str:
+    """
+    Costruisce lo script che importa `user_logic`, legge l'orario e invoca
+    `calcola_sostituzioni(df)` (o `calcola_sostituzioni(df, params)` se la
+    funzione accetta i parametri) stampando il risultato in JSON.
+
+    Il risultato contiene anche `timings`: tempo reale e CPU di ogni fase
+    (import pandas, lettura dati, indice, import user_logic, funzione utente,
+    serializzazione), picco di memoria (RSS) e, con `profile_top_n` > 0, le
+    funzioni più costose della chiamata utente secondo cProfile.
+
+    Args:
+        workdir: Working directory (dedicata) in cui si trovano i file
+        data_filename: Nome del file orario dentro workdir
+        allowed_imports: Se indicato, allowlist dei moduli importabili da user_logic
+        preamble: Codice eseguito prima di tutto (es. limiti di risorse)
+        preloaded_df: Se True il DataFrame è già in memoria nella variabile
+            globale `__preloaded_df__` (fork-server) e il file non viene riletto;
+            lo stesso vale per l'indice di disponibilità (`__preloaded_index__`)
+        columnar_filename: Copia Parquet da leggere al posto dell'xlsx; le colonne
+            categoriche vengono riportate a object come in `pd.read_excel`
+        params: Parametri della richiesta (elfi, giorni, ore, storico) passati
+            come secondo argomento a `calcola_sostituzioni`
+        profile_top_n: Righe del profilo cProfile della funzione utente (0 = niente profilo)
+        index_filename: Indice di disponibilità precalcolato al caricamento (.npz);
+            se manca o non è leggibile l'indice viene ricostruito dal DataFrame
+    """
+    guard = _import_guard_snippet(allowed_imports) if allowed_imports is not None else ""
+    if preloaded_df:
+        load_data = "df = __preloaded_df__"
+    elif columnar_filename:
+        load_data = (
+            f"df = pd.read_parquet({columnar_filename!r})\n"
+            "    for _col in df.select_dtypes(include='category').columns:\n"
+            "        df[_col] = df[_col].astype(object)"
+        )
+    else:
+        load_data = "df = pd.read_excel(remote_filename, header=0)"
+    if preloaded_df:
+        load_index = "indice = __preloaded_index__"
+    else:
+        load_index = (
+            "try:\n"
+            "        _index_ns = {'__name__': 'availability_index'}\n"
+            f"        exec(compile({_index_source()!r}, 'availability_index', 'exec'), _index_ns)\n"
+            "        _Index = _index_ns['AvailabilityIndex']\n"
+            "        indice = None\n"
+            f"        if {index_filename!r} and os.path.exists({index_filename!r}):\n"
+            "            try:\n"
+            f"                indice = _Index.load({index_filename!r})\n"
+            "            except Exception:\n"
+            "                indice = None\n"
+            "        if indice is None:\n"
+            "            indice = _Index.from_dataframe(df)\n"
+            "    except Exception:\n"
+            "        indice = None"
+        )
+    # Lettura dati e indice stanno dentro un blocco `with _Phase(...)`: un livello in più
+    load_data = load_data.replace("\n", "\n    ")
+    load_index = load_index.replace("\n", "\n    ")
+    params_json = json.dumps(params or {}, ensure_ascii=False)
+    return f"""
+{preamble}
+import time as _time
+
+# Tempi per fase (reale e CPU) riportati nel risultato in 'timings'
+_timings = {{"phases": {{}}}}
+
+class _Phase:
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.wall, self.cpu = _time.perf_counter(), _time.process_time()
+    def __exit__(self, *exc):
+        _timings["phases"][self.name] = {{
+            "wall_ms": round((_time.perf_counter() - self.wall) * 1000, 2),
+            "cpu_ms": round((_time.process_time() - self.cpu) * 1000, 2)
+        }}
+
+def _peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KB su Linux, byte su macOS
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except (ImportError, OSError):
+        return None
+
+def _profile_rows(profiler, top_n):
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [{{
+        "function": f"{{os.path.basename(filename)}}:{{line}}({{name}})",
+        "calls": calls,
+        "tottime_ms": round(tottime * 1000, 2),
+        "cumtime_ms": round(cumtime * 1000, 2)
+    }} for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+with _Phase("import_pandas"):
+    import pandas as pd
+import json
+import inspect
+import traceback
+import sys
+import os
+
+# Working directory dedicata: l'interprete può essere riusato,
+# quindi va eliminata ogni versione precedente di user_logic già importata
+os.chdir({workdir!r})
+sys.path.insert(0, {workdir!r})
+sys.modules.pop('user_logic', None)
+{guard}
+# LOGICA DI ESECUZIONE CONTROLLATA
+try:
+    # Import dinamico del codice utente
+    with _Phase("import_user_logic"):
+        import user_logic
+
+    # Setup dati
+    remote_filename = {data_filename!r}
+    with _Phase("read_data"):
+        {load_data}
+
+    # Indice di disponibilità visibile al codice generato come globale `indice`
+    # (None se l'orario non ha il layout 'GGG_O')
+    with _Phase("build_index"):
+        {load_index}
+    user_logic.indice = indice
+    
+    # Verifica esistenza funzione nel modulo importato
+    if not hasattr(user_logic, 'calcola_sostituzioni'):
+        raise NameError("La funzione 'calcola_sostituzioni(df)' non è stata definita nel codice generato.")
+    
+    # Esecuzione (i parametri della richiesta solo se la funzione li prevede)
+    params = json.loads({params_json!r})
+    args = (df, params) if len(inspect.signature(user_logic.calcola_sostituzioni).parameters) >= 2 else (df,)
+    with _Phase("calcola_sostituzioni"):
+        if {profile_top_n!r} > 0:
+            import cProfile
+            _profiler = cProfile.Profile()
+            risultati = _profiler.runcall(user_logic.calcola_sostituzioni, *args)
+        else:
+            risultati = user_logic.calcola_sostituzioni(*args)
+    if {profile_top_n!r} > 0:
+        _timings["profile"] = _profile_rows(_profiler, {profile_top_n!r})
+    
+    # Output
+    with _Phase("json_dumps"):
+        output_json = json.dumps(risultati, ensure_ascii=False)
+    _timings["peak_rss_mb"] = _peak_rss_mb()
+    print('{{"success": true, "output": ' + output_json + ', "timings": ' + json.dumps(_timings) + '}}')
+
+except Exception as e:
+    _timings["peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps({{
+        "success": False,
+        "error": str(e),
+        "traceback": traceback.format_exc(),
+        "timings": _timings
+    }}, ensure_ascii=False))
+finally:
+    if sys.path and sys.path[0] == {workdir!r}:
+        sys.path.pop(0)
+"""
+
+
+class CodeExecutor(ABC):
+    """Backend capace di eseguire `calcola_sostituzioni(df)` su un file orario"""
+
+    name: str = "base"
+
+    @abstractmethod
+    def execute(
+        self,
+        code: str,
+        file_path: Path,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Esegue il codice generato sul file indicato.
+
+        Args:
+            code: Sorgente del modulo user_logic (definisce calcola_sostituzioni)
+            file_path: Path locale del file Excel caricato
+            params: Parametri della richiesta passati a calcola_sostituzioni
+
+        Returns:
+            Stringa JSON con il contratto success/output/error/traceback
+        """
+
+    def close(self) -> None:
+        """Rilascia eventuali risorse del backend"""
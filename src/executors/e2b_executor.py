@@ -0,0 +1,140 @@
+"""
+Backend E2B: esecuzione remota in una sandbox presa in prestito dal pool.
+"""
+
+import gzip
+import json
+import threading
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.config import E2B_UPLOAD_COMPRESS_MIN_BYTES
+from src.executors.base import CodeExecutor, build_wrapper
+from src.sandbox_pool import get_sandbox_pool, SandboxLease, REMOTE_BLOB_ROOT
+from src.schedule_cache import get_availability_index_path, get_columnar_path
+from src.tracing import span
+from src.utils import file_content_hash
+
+
+class E2BExecutor(CodeExecutor):
+    """Esegue il codice generato in una sandbox E2B del pool condiviso"""
+
+    name = "e2b"
+
+    def __init__(self, compress_min_bytes: int = E2B_UPLOAD_COMPRESS_MIN_BYTES, profile_top_n: int = 0):
+        """
+        Args:
+            compress_min_bytes: Dimensione oltre la quale i file vengono inviati compressi
+            profile_top_n: Righe del profilo cProfile nel risultato (0 = disattivato)
+        """
+        self.compress_min_bytes = compress_min_bytes
+        self.profile_top_n = profile_top_n
+        self._stats = {"uploads": 0, "upload_skipped": 0, "bytes_sent": 0, "bytes_saved": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def stats(self) -> Dict[str, int]:
+        """Contatori di upload (per la modalità debug)"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _ensure_uploaded(self, lease: SandboxLease, local_path: Path, file_hash: str) -> str:
+        """
+        Carica il file nella sandbox solo se non è già presente.
+        I file vivono fuori dalla working directory del lease, indicizzati per
+        hash: i tentativi successivi (e le altre sessioni con lo stesso orario)
+        li trovano già pronti.
+
+        Returns:
+            Path remoto del file
+        """
+        key = f"{file_hash}{local_path.suffix}"
+        remote_path = lease.pooled.uploaded.get(key)
+        if remote_path:
+            self._count(upload_skipped=1)
+            return remote_path
+
+        sandbox = lease.sandbox
+        remote_path = f"{REMOTE_BLOB_ROOT}/{key}"
+        with open(local_path, 'rb') as f:
+            data = f.read()
+
+        # Compressione solo se conviene davvero (xlsx e parquet sono già compressi)
+        payload = None
+        if len(data) >= self.compress_min_bytes:
+            compressed = gzip.compress(data, compresslevel=6)
+            if len(compressed) < 0.9 * len(data):
+                payload = compressed
+
+        if payload is not None:
+            sandbox.files.write(f"{remote_path}.gz", payload)
+            sandbox.commands.run(f"gunzip -f '{remote_path}.gz'")
+            self._count(uploads=1, bytes_sent=len(payload), bytes_saved=len(data) - len(payload))
+        else:
+            sandbox.files.write(remote_path, data)
+            self._count(uploads=1, bytes_sent=len(data))
+
+        lease.pooled.uploaded[key] = remote_path
+        return remote_path
+
+    def execute(
+        self,
+        code: str,
+        file_path: Path,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        # L'affinità sul contenuto del file fa sì che i tentativi della stessa
+        # richiesta (e le sessioni con lo stesso orario) riusino la stessa sandbox
+        file_hash = file_content_hash(file_path)
+        with ExitStack() as stack:
+            with span("sandbox.acquire", kind="sandbox"):
+                lease = stack.enter_context(get_sandbox_pool().lease(affinity_key=file_hash))
+            sandbox = lease.sandbox
+            workdir = lease.workdir
+
+            with span("sandbox.upload", kind="sandbox"):
+                # Preferisce la copia colonnare: più piccola e molto più veloce da leggere
+                columnar = get_columnar_path(file_path)
+                remote_data = self._ensure_uploaded(lease, Path(columnar or file_path), file_hash)
+                # Indice precalcolato accanto ai dati, caricato una volta per sandbox
+                index_path = get_availability_index_path(file_path)
+                remote_index = self._ensure_uploaded(lease, index_path, file_hash) if index_path else None
+
+                sandbox.files.write(f"{workdir}/user_logic.py", code)
+
+            if columnar:
+                wrapper = build_wrapper(
+                    workdir, columnar_filename=remote_data, params=params,
+                    profile_top_n=self.profile_top_n, index_filename=remote_index
+                )
+            else:
+                wrapper = build_wrapper(
+                    workdir, data_filename=remote_data, params=params,
+                    profile_top_n=self.profile_top_n, index_filename=remote_index
+                )
+            with span("sandbox.run", kind="sandbox"):
+                execution = sandbox.run_code(wrapper)
+
+            with span("sandbox.parse", kind="sandbox"):
+                if execution.error:
+                    return json.dumps({
+                        "success": False,
+                        "error": f"Errore Runtime Sandbox: {execution.error.name}: {execution.error.value}",
+                        "traceback": execution.error.traceback
+                    })
+
+                output_text = execution.text or ""
+                if not output_text and execution.logs.stdout:
+                    output_text = "\n".join(execution.logs.stdout)
+                if execution.logs.stderr:
+                    output_text += "\nERR: " + "\n".join(execution.logs.stderr)
+
+                if not output_text:
+                    return json.dumps({"success": False, "error": "Nessun output ricevuto dalla sandbox."})
+
+                return output_text
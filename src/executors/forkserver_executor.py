@@ -0,0 +1,216 @@
+"""
+Backend fork-server: processo padre longevo con pandas e orari già in memoria.
+
+Il costo di `import pandas` e della lettura dell'orario viene pagato una sola volta
+per file (chiave = hash del contenuto) invece che a ogni tentativo: ogni
+esecuzione è un `fork()` del padre, che parte con DataFrame già pronto.
+Disponibile solo su sistemi POSIX (serve `os.fork` e socket AF_UNIX).
+"""
+
+import atexit
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from multiprocessing.connection import Client
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from src.executors.base import INDEX_MODULE_PATH, CodeExecutor, build_wrapper, error_result
+from src.executors.local_executor import parse_process_output
+from src.schedule_cache import get_availability_index_path, get_columnar_path
+from src.tracing import span
+from src.utils import file_content_hash
+
+SERVER_SCRIPT = Path(__file__).resolve().parent / "forkserver_server.py"
+
+
+def is_supported() -> bool:
+    """True se la piattaforma supporta il fork-server"""
+    import socket
+    return hasattr(os, "fork") and hasattr(socket, "AF_UNIX")
+
+
+class ForkServerExecutor(CodeExecutor):
+    """Esegue il codice generato in figli forkati da un server pre-caricato"""
+
+    name = "forkserver"
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        cpu_seconds: int = 30,
+        memory_mb: int = 1024,
+        allowed_imports: Optional[Iterable[str]] = None,
+        df_cache_size: int = 16,
+        startup_timeout: float = 60,
+        profile_top_n: int = 0
+    ):
+        """
+        Args:
+            timeout: Limite di tempo reale (secondi) per ogni esecuzione
+            cpu_seconds: Limite di tempo CPU del figlio (RLIMIT_CPU)
+            memory_mb: Memoria aggiuntiva concessa al figlio oltre a quella ereditata
+            allowed_imports: Moduli importabili dal codice generato (None = nessun filtro)
+            df_cache_size: Numero massimo di DataFrame tenuti in memoria dal server
+            startup_timeout: Attesa massima per l'avvio del server
+            profile_top_n: Righe del profilo cProfile nel risultato (0 = disattivato)
+        """
+        if not is_supported():
+            raise RuntimeError("Il backend fork-server richiede un sistema POSIX")
+
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.allowed_imports = list(allowed_imports) if allowed_imports is not None else None
+        self.df_cache_size = df_cache_size
+        self.startup_timeout = startup_timeout
+        self.profile_top_n = profile_top_n
+
+        self._process: Optional[subprocess.Popen] = None
+        self._address: Optional[str] = None
+        self._authkey = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    # ----------------------------------------
+    # Gestione processo server
+    # ----------------------------------------
+    def _ensure_server(self) -> str:
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return self._address
+
+            sock_dir = tempfile.mkdtemp(prefix="fai_forkserver_")
+            self._address = os.path.join(sock_dir, "server.sock")
+            env = {
+                "PATH": os.environ.get("PATH", ""),
+                "PYTHONIOENCODING": "utf-8",
+                "OPENBLAS_NUM_THREADS": "1",
+                "OMP_NUM_THREADS": "1",
+                "MKL_NUM_THREADS": "1",
+                "FAI_FORKSERVER_AUTHKEY": self._authkey.hex(),
+                "FAI_FORKSERVER_DF_CACHE_SIZE": str(self.df_cache_size),
+            }
+            self._process = subprocess.Popen(
+                [sys.executable, "-I", str(SERVER_SCRIPT), self._address, str(INDEX_MODULE_PATH)],
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                text=True
+            )
+
+            ready = threading.Event()
+
+            def _wait_ready():
+                line = self._process.stdout.readline()
+                if line.strip() == "READY":
+                    ready.set()
+
+            threading.Thread(target=_wait_ready, daemon=True).start()
+            if not ready.wait(self.startup_timeout):
+                self._stop_process()
+                raise RuntimeError("Avvio del fork-server non riuscito")
+
+            return self._address
+
+    def _stop_process(self) -> None:
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+        if self._address:
+            shutil.rmtree(os.path.dirname(self._address), ignore_errors=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                try:
+                    with Client(self._address, family="AF_UNIX", authkey=self._authkey) as conn:
+                        conn.send({"op": "shutdown"})
+                        conn.poll(2)
+                except Exception:
+                    pass
+            self._stop_process()
+
+    # ----------------------------------------
+    # Esecuzione
+    # ----------------------------------------
+    def _request(self, address: str, request: dict) -> Optional[bytes]:
+        with Client(address, family="AF_UNIX", authkey=self._authkey) as conn:
+            conn.send(request)
+            # Margine oltre al timeout del figlio per la serializzazione del risultato
+            if not conn.poll(self.timeout + 5):
+                return None
+            return conn.recv_bytes()
+
+    def execute(
+        self,
+        code: str,
+        file_path: Path,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        workdir = tempfile.mkdtemp(prefix="fai_run_")
+        try:
+            with open(os.path.join(workdir, "user_logic.py"), "w", encoding="utf-8") as f:
+                f.write(code)
+
+            columnar = get_columnar_path(file_path)
+            index_path = get_availability_index_path(file_path)
+            request = {
+                "op": "run",
+                "wrapper": build_wrapper(
+                    workdir,
+                    allowed_imports=self.allowed_imports,
+                    preloaded_df=True,
+                    params=params,
+                    profile_top_n=self.profile_top_n
+                ),
+                "file_path": str(Path(file_path).resolve()),
+                "file_hash": file_content_hash(file_path),
+                "columnar_path": str(columnar) if columnar else None,
+                "index_path": str(index_path) if index_path else None,
+                "timeout": self.timeout,
+                "cpu_seconds": self.cpu_seconds,
+                "memory_mb": self.memory_mb,
+            }
+
+            with span("sandbox.acquire", kind="sandbox"):
+                address = self._ensure_server()
+            with span("sandbox.run", kind="sandbox"):
+                try:
+                    raw = self._request(address, request)
+                except (ConnectionError, FileNotFoundError):
+                    # Server morto o riavviato: un solo nuovo tentativo
+                    with self._lock:
+                        self._stop_process()
+                    raw = self._request(self._ensure_server(), request)
+
+            if raw is None:
+                return error_result(
+                    f"Tempo massimo di esecuzione superato ({self.timeout}s). "
+                    "Il codice potrebbe contenere cicli troppo lenti o infiniti."
+                )
+            if not raw:
+                return error_result(
+                    "Processo di esecuzione terminato senza output "
+                    "(possibile superamento dei limiti di CPU o memoria)."
+                )
+
+            with span("sandbox.parse", kind="sandbox"):
+                return parse_process_output(raw.decode("utf-8", errors="replace"), "")
+        except EOFError:
+            return error_result(
+                "Processo di esecuzione terminato inaspettatamente "
+                "(possibile superamento dei limiti di CPU o memoria)."
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,215 @@
+"""
+Processo fork-server per l'esecuzione del codice generato.
+
+Script standalone (non importa `src`): viene avviato da `ForkServerExecutor`,
+importa pandas/openpyxl una sola volta e tiene in memoria i DataFrame già
+letti, indicizzati per hash del contenuto del file. Per ogni esecuzione fa
+`fork()`: il figlio eredita interprete, DataFrame e indice di disponibilità
+già pronti, esegue il wrapper e risponde direttamente al client sulla
+connessione ricevuta.
+
+Uso: python -I forkserver_server.py <socket_path> [<availability_index.py>]
+     (authkey esadecimale nella variabile d'ambiente FAI_FORKSERVER_AUTHKEY)
+"""
+
+import importlib.util
+import io
+import json
+import os
+import signal
+import sys
+import traceback
+from collections import OrderedDict
+from multiprocessing.connection import Listener
+
+# Import costosi fatti una volta sola nel processo padre
+import pandas as pd
+import openpyxl  # noqa: F401  (motore di pd.read_excel)
+try:
+    import pyarrow  # noqa: F401  (motore di pd.read_parquet)
+except ImportError:
+    pass
+
+AUTHKEY_ENV = "FAI_FORKSERVER_AUTHKEY"
+DF_CACHE_SIZE_ENV = "FAI_FORKSERVER_DF_CACHE_SIZE"
+
+
+def _load(file_path: str, columnar_path: str = None):
+    """Legge la copia colonnare se presente (categoriche riportate a object), altrimenti l'xlsx"""
+    if columnar_path and os.path.exists(columnar_path):
+        try:
+            df = pd.read_parquet(columnar_path)
+            for col in df.select_dtypes(include="category").columns:
+                df[col] = df[col].astype(object)
+            return df
+        except Exception:
+            pass
+    return pd.read_excel(file_path, header=0)
+
+
+def _load_index_class(module_path: str = None):
+    """Importa AvailabilityIndex dal file indicato (il server non importa `src`)"""
+    if not module_path:
+        return None
+    try:
+        spec = importlib.util.spec_from_file_location("availability_index", module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.AvailabilityIndex
+    except Exception:
+        return None
+
+
+class DataFrameCache:
+    """Cache LRU di (DataFrame, indice di disponibilità), chiave = hash del contenuto del file"""
+
+    def __init__(self, max_entries: int, index_class=None):
+        self.max_entries = max(1, max_entries)
+        self.index_class = index_class
+        self._items = OrderedDict()
+
+    def get(self, file_hash: str, file_path: str, columnar_path: str = None, index_path: str = None):
+        item = self._items.get(file_hash)
+        if item is not None:
+            self._items.move_to_end(file_hash)
+            return item
+        df = _load(file_path, columnar_path)
+        index = None
+        if self.index_class is not None:
+            # Indice precalcolato al caricamento, altrimenti ricostruito dal DataFrame
+            if index_path and os.path.exists(index_path):
+                try:
+                    index = self.index_class.load(index_path)
+                except Exception:
+                    index = None
+            if index is None:
+                try:
+                    index = self.index_class.from_dataframe(df)
+                except Exception:
+                    pass
+        self._items[file_hash] = (df, index)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        return df, index
+
+
+def _apply_limits(cpu_seconds: int, memory_mb: int) -> None:
+    """Limiti di risorse per il figlio (la memoria è in aggiunta a quella ereditata)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    except (ValueError, OSError):
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            current_vm = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        limit = current_vm + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (OSError, ValueError):
+        pass
+
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("Tempo massimo di esecuzione superato")
+
+
+def _run_child(conn, request: dict, df, index) -> None:
+    """Corpo del processo figlio: esegue il wrapper e invia lo stdout catturato"""
+    _apply_limits(request.get("cpu_seconds", 30), request.get("memory_mb", 1024))
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.alarm(max(1, int(request.get("timeout", 60))))
+
+    captured = io.StringIO()
+    sys.stdout = captured
+    try:
+        code = compile(request["wrapper"], "<fai-wrapper>", "exec")
+        exec(code, {"__name__": "__fai_run__", "__preloaded_df__": df, "__preloaded_index__": index})
+    except BaseException as e:
+        captured.write("\n" + json.dumps({
+            "success": False,
+            "error": str(e) or type(e).__name__,
+            "traceback": traceback.format_exc()
+        }, ensure_ascii=False) + "\n")
+    finally:
+        signal.alarm(0)
+        sys.stdout = sys.__stdout__
+
+    conn.send_bytes(captured.getvalue().encode("utf-8"))
+    conn.close()
+
+
+def serve(address: str, index_module: str = None) -> None:
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_ENV))
+    cache = DataFrameCache(
+        int(os.environ.get(DF_CACHE_SIZE_ENV, "16")),
+        index_class=_load_index_class(index_module)
+    )
+
+    # I figli vengono raccolti automaticamente dal kernel
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    print("READY", flush=True)
+
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError):
+            continue
+        except Exception:
+            # Handshake fallito (authkey errata): ignora il client
+            continue
+
+        try:
+            request = conn.recv()
+            op = request.get("op")
+
+            if op == "ping":
+                conn.send({"ok": True, "cached_frames": len(cache._items)})
+                conn.close()
+                continue
+
+            if op == "shutdown":
+                conn.send({"ok": True})
+                conn.close()
+                break
+
+            df, index = cache.get(
+                request["file_hash"],
+                request["file_path"],
+                request.get("columnar_path"),
+                request.get("index_path")
+            )
+        except Exception as e:
+            try:
+                conn.send_bytes(json.dumps({
+                    "success": False,
+                    "error": f"Errore fork-server: {e}",
+                    "traceback": traceback.format_exc()
+                }, ensure_ascii=False).encode("utf-8"))
+            finally:
+                conn.close()
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _run_child(conn, request, df, index)
+            except BaseException:
+                exit_code = 1
+            finally:
+                # Niente finalizer: il listener condiviso non va chiuso dal figlio
+                os._exit(exit_code)
+
+        conn.close()
+
+    listener.close()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,183 @@
+"""
+Backend locale: esecuzione in un sottoprocesso isolato.
+
+Niente round trip di rete: il codice gira in un interprete Python separato
+(`-I`, ambiente ripulito) dentro una directory temporanea, con limiti di CPU,
+memoria e tempo reale e una allowlist degli import consentiti a `user_logic`.
+L'allowlist è una difesa aggiuntiva, l'isolamento vero è il sottoprocesso.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from src.executors.base import (
+    CodeExecutor,
+    REMOTE_FILENAME,
+    REMOTE_COLUMNAR_FILENAME,
+    REMOTE_INDEX_FILENAME,
+    build_wrapper,
+    error_result
+)
+from src.schedule_cache import get_availability_index_path, get_columnar_path
+from src.tracing import span
+
+
+def rlimit_snippet(cpu_seconds: int, memory_mb: int) -> str:
+    """Codice che applica i limiti di risorse al processo corrente (solo POSIX)"""
+    return f"""
+try:
+    import resource as _resource
+    _resource.setrlimit(_resource.RLIMIT_CPU, ({cpu_seconds}, {cpu_seconds}))
+    _mem = {memory_mb} * 1024 * 1024
+    _resource.setrlimit(_resource.RLIMIT_AS, (_mem, _mem))
+except (ImportError, ValueError, OSError):
+    pass
+"""
+
+
+def parse_process_output(stdout: str, stderr: str) -> str:
+    """
+    Estrae il risultato JSON dallo stdout del wrapper.
+    Eventuali print() del codice generato precedono la riga finale.
+    """
+    for line in reversed(stdout.strip().splitlines()):
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(payload, dict) and "success" in payload:
+            return line
+
+    if stdout.strip():
+        output_text = stdout
+        if stderr.strip():
+            output_text += "\nERR: " + stderr
+        return output_text
+
+    return error_result(
+        "Nessun output ricevuto dall'esecutore locale.",
+        stderr.strip()[-4000:] or None
+    )
+
+
+class LocalExecutor(CodeExecutor):
+    """Esegue il codice generato in un sottoprocesso Python con rlimit"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        cpu_seconds: int = 30,
+        memory_mb: int = 2048,
+        allowed_imports: Optional[Iterable[str]] = None,
+        python_executable: Optional[str] = None,
+        profile_top_n: int = 0
+    ):
+        """
+        Args:
+            timeout: Limite di tempo reale (secondi) per l'intera esecuzione
+            cpu_seconds: Limite di tempo CPU (RLIMIT_CPU)
+            memory_mb: Limite di memoria virtuale (RLIMIT_AS) in MB
+            allowed_imports: Moduli importabili dal codice generato (None = nessun filtro)
+            python_executable: Interprete da usare (default: quello corrente)
+            profile_top_n: Righe del profilo cProfile nel risultato (0 = disattivato)
+        """
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.allowed_imports = list(allowed_imports) if allowed_imports is not None else None
+        self.python_executable = python_executable or sys.executable
+        self.profile_top_n = profile_top_n
+
+    def _child_env(self) -> dict:
+        """Ambiente minimo: niente API key né variabili del processo Streamlit"""
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            "PYTHONIOENCODING": "utf-8",
+            "PYTHONDONTWRITEBYTECODE": "1",
+            # Evita che BLAS riservi memoria per decine di thread
+            "OPENBLAS_NUM_THREADS": "1",
+            "OMP_NUM_THREADS": "1",
+            "MKL_NUM_THREADS": "1",
+        }
+        # Su Windows l'interprete ha bisogno di SYSTEMROOT per avviarsi
+        for key in ("SYSTEMROOT", "TEMP", "TMP"):
+            if key in os.environ:
+                env[key] = os.environ[key]
+        return env
+
+    def execute(
+        self,
+        code: str,
+        file_path: Path,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        workdir = tempfile.mkdtemp(prefix="fai_run_")
+        try:
+            with span("sandbox.upload", kind="sandbox"):
+                # Preferisce la copia colonnare, con fallback sull'xlsx se manca
+                columnar = get_columnar_path(file_path)
+                if columnar:
+                    shutil.copyfile(columnar, os.path.join(workdir, REMOTE_COLUMNAR_FILENAME))
+                else:
+                    shutil.copyfile(file_path, os.path.join(workdir, REMOTE_FILENAME))
+                # Indice precalcolato al caricamento: il wrapper non lo ricostruisce
+                index_path = get_availability_index_path(file_path)
+                if index_path:
+                    shutil.copyfile(index_path, os.path.join(workdir, REMOTE_INDEX_FILENAME))
+                with open(os.path.join(workdir, "user_logic.py"), "w", encoding="utf-8") as f:
+                    f.write(code)
+
+                wrapper = build_wrapper(
+                    workdir,
+                    allowed_imports=self.allowed_imports,
+                    preamble=rlimit_snippet(self.cpu_seconds, self.memory_mb),
+                    columnar_filename=REMOTE_COLUMNAR_FILENAME if columnar else None,
+                    params=params,
+                    profile_top_n=self.profile_top_n,
+                    index_filename=REMOTE_INDEX_FILENAME if index_path else None
+                )
+                runner_path = os.path.join(workdir, "_runner.py")
+                with open(runner_path, "w", encoding="utf-8") as f:
+                    f.write(wrapper)
+
+            try:
+                with span("sandbox.run", kind="sandbox"):
+                    completed = subprocess.run(
+                        [self.python_executable, "-I", runner_path],
+                        cwd=workdir,
+                        env=self._child_env(),
+                        capture_output=True,
+                        text=True,
+                        encoding="utf-8",
+                        errors="replace",
+                        timeout=self.timeout,
+                        stdin=subprocess.DEVNULL
+                    )
+            except subprocess.TimeoutExpired:
+                return error_result(
+                    f"Tempo massimo di esecuzione superato ({self.timeout}s). "
+                    "Il codice potrebbe contenere cicli troppo lenti o infiniti."
+                )
+
+            if completed.returncode != 0 and not completed.stdout.strip():
+                return error_result(
+                    f"Processo di esecuzione terminato con codice {completed.returncode} "
+                    "(possibile superamento dei limiti di CPU o memoria).",
+                    completed.stderr.strip()[-4000:] or None
+                )
+
+            with span("sandbox.parse", kind="sandbox"):
+                return parse_process_output(completed.stdout, completed.stderr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
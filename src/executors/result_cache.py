@@ -0,0 +1,62 @@
+"""
+Cache dei risultati di esecuzione.
+
+Chiave = (hash del contenuto del file, hash di codice + parametri): lo stesso
+programma con gli stessi parametri sullo stesso orario produce sempre lo stesso output, anche se arriva da
+un'altra sessione o da un tentativo ripetuto identico.
+Vengono memorizzati solo i risultati con "success": true.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ExecutionResultCache:
+    """Cache LRU thread-safe dei risultati JSON di esecuzione riusciti"""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(file_hash: str, code: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+        digest = hashlib.sha256(code.encode("utf-8"))
+        if params:
+            digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return file_hash, digest.hexdigest()
+
+    def get(self, file_hash: str, code: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        k = self.key(file_hash, code, params)
+        with self._lock:
+            result = self._items.get(k)
+            if result is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(k)
+            self.hits += 1
+            return result
+
+    def put(
+        self,
+        file_hash: str,
+        code: str,
+        result: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> None:
+        try:
+            if not json.loads(result).get("success"):
+                return
+        except (ValueError, AttributeError):
+            return
+        k = self.key(file_hash, code, params)
+        with self._lock:
+            self._items[k] = result
+            self._items.move_to_end(k)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
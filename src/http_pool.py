@@ -0,0 +1,217 @@
+"""
+Pool HTTP process-wide condiviso da tutti i client LLM.
+
+Ogni agente crea il proprio `OpenAIClient`, ma tutti usano lo stesso
+`httpx.Client` per host: le connessioni TLS restano aperte (keep-alive,
+HTTP/2 opzionale) e vengono riusate tra agenti, messaggi e sessioni.
+Il client async è uno per event loop, perché le connessioni httpx async
+non possono passare da un loop all'altro.
+
+Per host vengono contate richieste e nuove connessioni TCP, da cui il
+numero di richieste servite su una connessione già aperta.
+"""
+
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from src.config import (
+    LLM_BASE_URL,
+    LLM_HTTP2,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_MAX_CONNECTIONS_PER_HOST,
+    LLM_HTTP_MAX_KEEPALIVE_PER_HOST,
+    LLM_HTTP_TIMEOUT,
+)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+@dataclass
+class HostStats:
+    """Contatori di utilizzo delle connessioni verso un host"""
+    requests: int = 0
+    connections: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def count(self, requests: int = 0, connections: int = 0) -> None:
+        with self._lock:
+            self.requests += requests
+            self.connections += connections
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.connections,
+                "reused": max(self.requests - self.connections, 0),
+            }
+
+
+def _origin(base_url: Optional[str]) -> str:
+    """'https://api.openai.com/v1' -> 'https://api.openai.com'"""
+    url = httpx.URL(base_url or DEFAULT_BASE_URL)
+    return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMHttpPool:
+    """
+    Client httpx condivisi, uno per host (e per event loop per la variante async).
+
+    Il limite di connessioni vale per host: ogni host ha il proprio pool.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 20,
+        max_keepalive_per_host: int = 10,
+        keepalive_expiry: float = 60,
+        timeout: float = 120,
+        http2: bool = False
+    ):
+        """
+        Args:
+            max_connections_per_host: Connessioni contemporanee massime verso un host
+            max_keepalive_per_host: Connessioni inattive tenute aperte per host
+            keepalive_expiry: Secondi dopo cui una connessione inattiva viene chiusa
+            timeout: Timeout complessivo di una richiesta (secondi)
+            http2: Abilita HTTP/2 (richiede il pacchetto 'h2')
+        """
+        if http2 and not _http2_available():
+            print("⚠️ HTTP/2 richiesto ma il pacchetto 'h2' non è installato: uso HTTP/1.1")
+            http2 = False
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 10))
+        self.http2 = http2
+
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[Tuple[str, int], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._stats: Dict[str, HostStats] = {}
+
+    def _host_stats(self, origin: str) -> HostStats:
+        """Contatori dell'host (chiamare col lock)"""
+        return self._stats.setdefault(origin, HostStats())
+
+    # ----------------------------------------
+    # Client sync
+    # ----------------------------------------
+    def client(self, base_url: Optional[str] = None) -> httpx.Client:
+        """Client httpx condiviso per l'host di base_url"""
+        origin = _origin(base_url)
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None or client.is_closed:
+                stats = self._host_stats(origin)
+
+                def _trace(event: str, info: dict) -> None:
+                    if event.endswith("connect_tcp.complete"):
+                        stats.count(connections=1)
+
+                def _on_request(request: httpx.Request) -> None:
+                    stats.count(requests=1)
+                    request.extensions["trace"] = _trace
+
+                client = httpx.Client(
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    event_hooks={"request": [_on_request]}
+                )
+                self._clients[origin] = client
+            return client
+
+    # ----------------------------------------
+    # Client async (uno per event loop)
+    # ----------------------------------------
+    def async_client(self, base_url: Optional[str] = None) -> httpx.AsyncClient:
+        """
+        Client httpx async condiviso per l'host di base_url e l'event loop corrente.
+
+        Raises:
+            RuntimeError: Se chiamato fuori da un event loop
+        """
+        loop = asyncio.get_running_loop()
+        origin = _origin(base_url)
+        key = (origin, id(loop))
+        with self._lock:
+            # I client dei loop chiusi non sono più utilizzabili
+            for stale in [k for k, (l, _) in self._async_clients.items() if l.is_closed()]:
+                del self._async_clients[stale]
+
+            entry = self._async_clients.get(key)
+            if entry is None or entry[0] is not loop or entry[1].is_closed:
+                stats = self._host_stats(origin)
+
+                async def _trace(event: str, info: dict) -> None:
+                    if event.endswith("connect_tcp.complete"):
+                        stats.count(connections=1)
+
+                async def _on_request(request: httpx.Request) -> None:
+                    stats.count(requests=1)
+                    request.extensions["trace"] = _trace
+
+                entry = (loop, httpx.AsyncClient(
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    event_hooks={"request": [_on_request]}
+                ))
+                self._async_clients[key] = entry
+            return entry[1]
+
+    # ----------------------------------------
+    # Metriche e chiusura
+    # ----------------------------------------
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Richieste, nuove connessioni e connessioni riusate per host"""
+        with self._lock:
+            return {origin: s.snapshot() for origin, s in self._stats.items()}
+
+    def close(self) -> None:
+        """Chiude i client sync (quelli async si chiudono con il loro event loop)"""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._async_clients.clear()
+
+
+_pool: Optional[LLMHttpPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> LLMHttpPool:
+    """Restituisce il pool HTTP process-wide, creandolo al primo utilizzo"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LLMHttpPool(
+                max_connections_per_host=LLM_HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_per_host=LLM_HTTP_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                timeout=LLM_HTTP_TIMEOUT,
+                http2=LLM_HTTP2
+            )
+        return _pool
+
+
+def llm_base_url() -> Optional[str]:
+    """Endpoint LLM configurato (LLM_BASE_URL), None = default OpenAI"""
+    return LLM_BASE_URL or None
@@ -0,0 +1,315 @@
+"""
+Cache record/replay delle risposte LLM.
+
+Si aggancia al client OpenAI degli agenti (`src/agents/llm_client.py`)
+all'altezza di `responses.create`, dove la richiesta è già completa:
+modello, messaggi (system prompt, memoria, messaggio utente), tool e
+parametri. La chiave è l'hash SHA-256 della richiesta in JSON canonico
+(chiavi ordinate, senza il flag `stream`), più l'endpoint: la stessa
+richiesta verso un altro server non riusa la risposta.
+
+Le risposte sono salvate su disco, un file JSON per chiave, con eviction
+per dimensione totale (meno usate prima) e per TTL. Modalità:
+
+- `record`: una risposta già vista viene riusata, le altre vengono
+  richieste al modello e registrate
+- `replay`: solo risposte registrate; una richiesta nuova fallisce con
+  `LLMCacheMiss` (test offline e benchmark ripetibili)
+- `off`: nessuna cache
+
+Le chiamate in streaming vengono registrate dall'evento finale e riprodotte
+come un delta di testo per messaggio seguito dall'evento di completamento.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from opentelemetry import trace
+from openai.types.responses import Response, ResponseCompletedEvent, ResponseTextDeltaEvent
+
+from src.config import LLM_CACHE_DIR, LLM_CACHE_MAX_MB, LLM_CACHE_MODE, LLM_CACHE_TTL_HOURS
+
+MODES = ("off", "record", "replay")
+DEFAULT_ENDPOINT = "https://api.openai.com/v1"
+# Parametri che non cambiano la risposta
+_IGNORED_PARAMS = ("stream", "timeout", "extra_headers")
+
+
+class LLMCacheMiss(RuntimeError):
+    """Richiesta non registrata in modalità replay"""
+
+
+def request_key(request: Dict[str, Any], endpoint: Optional[str] = None) -> str:
+    """Hash canonico di una richiesta `responses.create`"""
+    canonical = {k: v for k, v in request.items() if k not in _IGNORED_PARAMS and v is not None}
+    payload = json.dumps(
+        {"endpoint": str(endpoint or DEFAULT_ENDPOINT).rstrip("/"), "request": canonical},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _mark_span(status: str) -> None:
+    """Esito della cache sullo span della chiamata LLM (visibile nella waterfall)"""
+    trace.get_current_span().set_attribute("llm_cache", status)
+
+
+class LLMResponseCache:
+    """Store su disco delle risposte, con eviction per dimensione e TTL"""
+
+    def __init__(
+        self,
+        directory: Path,
+        mode: str = "record",
+        max_bytes: int = 200 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600
+    ):
+        """
+        Args:
+            directory: Directory dei file di risposta
+            mode: 'record', 'replay' o 'off'
+            max_bytes: Dimensione totale oltre cui si eliminano le risposte meno usate
+            ttl_seconds: Risposte non usate da più di questo tempo vengono scartate
+                (0 = nessuna scadenza; in replay le risposte non scadono mai)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Modalità cache LLM non valida: {mode} (attese: {', '.join(MODES)})")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # chiave -> (byte, ultimo utilizzo)
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for path in self.directory.glob("*/*.json"):
+                stat = path.stat()
+                self._entries[path.stem] = (stat.st_size, stat.st_mtime)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    # ----------------------------------------
+    # Store
+    # ----------------------------------------
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Risposta registrata (JSON della Response), None se assente o scaduta"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = (
+                entry is not None and self.mode != "replay"
+                and self.ttl_seconds and now - entry[1] > self.ttl_seconds
+            )
+            if entry is None or expired:
+                if expired:
+                    self._remove(key)
+                self._counters["misses"] += 1
+                return None
+            try:
+                data = json.loads(self._path(key).read_text(encoding="utf-8"))
+                os.utime(self._path(key), (now, now))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Risposta LLM in cache illeggibile, la scarto: {e}")
+                self._remove(key)
+                self._counters["misses"] += 1
+                return None
+            self._entries[key] = (entry[0], now)
+            self._counters["hits"] += 1
+            return data
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        """Registra una risposta completata (solo in modalità record)"""
+        if self.mode != "record" or response.get("status") not in (None, "completed"):
+            return
+        data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        with self._lock:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp_path.write_bytes(data)
+                tmp_path.replace(path)
+            except OSError as e:
+                print(f"⚠️ Impossibile salvare la risposta LLM in cache: {e}")
+                return
+            self._entries[key] = (len(data), time.time())
+            self._counters["stores"] += 1
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        """Elimina una risposta (chiamare col lock)"""
+        self._entries.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        """Scarta le risposte scadute e, oltre il budget, le meno usate (chiamare col lock)"""
+        now = time.time()
+        if self.ttl_seconds:
+            for key in [k for k, (_, used) in self._entries.items() if now - used > self.ttl_seconds]:
+                self._remove(key)
+                self._counters["evictions"] += 1
+        total = sum(size for size, _ in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key][0]
+            self._remove(key)
+            self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Metriche della cache (per la modalità debug)"""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "entries": len(self._entries),
+                "bytes": sum(size for size, _ in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                **self._counters,
+            }
+
+    # ----------------------------------------
+    # Richieste
+    # ----------------------------------------
+    def lookup(self, request: Dict[str, Any], endpoint: Optional[str]) -> tuple:
+        """
+        Chiave e risposta registrata per una richiesta.
+
+        Raises:
+            LLMCacheMiss: In modalità replay, se la richiesta non è registrata
+        """
+        key = request_key(request, endpoint)
+        cached = self.get(key)
+        if cached is None and self.mode == "replay":
+            _mark_span("miss")
+            raise LLMCacheMiss(
+                f"Risposta LLM non registrata per {request.get('model')} (chiave {key[:12]}, LLM_CACHE_MODE=replay)"
+            )
+        _mark_span("hit" if cached is not None else "miss")
+        return key, cached
+
+
+# ========================================
+# RIPRODUZIONE DELLO STREAMING
+# ========================================
+
+def _replay_events(data: Dict[str, Any]) -> Iterator[Any]:
+    """Eventi di streaming equivalenti a una risposta registrata"""
+    response = Response.model_validate(data)
+    sequence = 0
+    for index, item in enumerate(data.get("output") or []):
+        if item.get("type") != "message":
+            continue
+        for content_index, content in enumerate(item.get("content") or []):
+            if content.get("type") != "output_text":
+                continue
+            yield ResponseTextDeltaEvent(
+                type="response.output_text.delta", delta=content.get("text", ""), item_id=item.get("id", ""),
+                output_index=index, content_index=content_index, sequence_number=sequence, logprobs=[]
+            )
+            sequence += 1
+    yield ResponseCompletedEvent(type="response.completed", response=response, sequence_number=sequence)
+
+
+def _record_events(cache: LLMResponseCache, key: str, stream) -> Iterator[Any]:
+    for event in stream:
+        if isinstance(event, ResponseCompletedEvent):
+            cache.put(key, event.response.model_dump(mode="json"))
+        yield event
+
+
+async def _a_replay_events(data: Dict[str, Any]):
+    for event in _replay_events(data):
+        yield event
+
+
+async def _a_record_events(cache: LLMResponseCache, key: str, stream):
+    async for event in stream:
+        if isinstance(event, ResponseCompletedEvent):
+            cache.put(key, event.response.model_dump(mode="json"))
+        yield event
+
+
+# ========================================
+# CLIENT OPENAI CON CACHE
+# ========================================
+
+class _CachedResponses:
+    def __init__(self, responses, cache: LLMResponseCache, endpoint: Optional[str]):
+        self._responses = responses
+        self._cache = cache
+        self._endpoint = endpoint
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._responses, name)
+
+    def create(self, **kwargs: Any) -> Any:
+        key, cached = self._cache.lookup(kwargs, self._endpoint)
+        if kwargs.get("stream"):
+            if cached is not None:
+                return _replay_events(cached)
+            return _record_events(self._cache, key, self._responses.create(**kwargs))
+        if cached is not None:
+            return Response.model_validate(cached)
+        response = self._responses.create(**kwargs)
+        self._cache.put(key, response.model_dump(mode="json"))
+        return response
+
+
+class _AsyncCachedResponses(_CachedResponses):
+    async def create(self, **kwargs: Any) -> Any:
+        key, cached = self._cache.lookup(kwargs, self._endpoint)
+        if kwargs.get("stream"):
+            if cached is not None:
+                return _a_replay_events(cached)
+            return _a_record_events(self._cache, key, await self._responses.create(**kwargs))
+        if cached is not None:
+            return Response.model_validate(cached)
+        response = await self._responses.create(**kwargs)
+        self._cache.put(key, response.model_dump(mode="json"))
+        return response
+
+
+class CachedOpenAI:
+    """
+    Client OpenAI (sync o async) con `responses.create` passato dalla cache;
+    il resto è delegato al client originale.
+    """
+
+    def __init__(self, client, cache: LLMResponseCache, asynchronous: bool = False):
+        self._client = client
+        endpoint = str(getattr(client, "base_url", "") or "") or None
+        wrapper = _AsyncCachedResponses if asynchronous else _CachedResponses
+        self.responses = wrapper(client.responses, cache, endpoint)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Restituisce la cache process-wide delle risposte, creandola al primo utilizzo"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(
+                LLM_CACHE_DIR,
+                mode=LLM_CACHE_MODE,
+                max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+            )
+        return _cache
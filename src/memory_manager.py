@@ -1,6 +1,7 @@
 """
 Gestione memoria conversazionale per sistema multi-agente.
-Integra datapizza.memory.Memory con Streamlit session state.
+Integra datapizza.memory.Memory con Streamlit session state, usato come
+cache del backend di persistenza (`src/state_backend.py`).
 """
 
 import streamlit as st
@@ -9,6 +10,11 @@ from datetime import datetime
 from datapizza.memory import Memory
 from datapizza.type import ROLE, TextBlock
 from src.models import Sostituzione
+from src.memory_policy import MemoryPolicy, MemoryState, compact_substitution_json
+from src.substitution_store import SubstitutionStore, UpsertReport, slot_of
+from src.code_cache import normalize_request
+from src.state_backend import StateBackend, get_state_backend
+from src.config import MEMORY_TOKEN_BUDGET, MEMORY_WINDOW_TURNS, MEMORY_SUMMARY_MAX_TOKENS, HISTORY_PROMPT_MAX_ENTRIES
 import json
 
 
@@ -22,32 +28,127 @@ class ConversationMemoryManager:
     MEMORY_KEY = "datapizza_memory"
     CONTEXT_KEY = "app_context"
     
-    def __init__(self):
-        """Inizializza o recupera Memory da session state"""
+    def __init__(self, session_id: str = "", backend: Optional[StateBackend] = None):
+        """
+        Inizializza o recupera Memory da session state (o dal backend dopo un reload)
+
+        Args:
+            session_id: ID della sessione (vuoto = nessuna persistenza)
+            backend: Backend di persistenza (default: quello process-wide)
+        """
+        self.session_id = session_id
+        self.backend = (backend or get_state_backend()) if session_id else None
+        self.policy = MemoryPolicy(
+            token_budget=MEMORY_TOKEN_BUDGET,
+            window_turns=MEMORY_WINDOW_TURNS,
+            summary_max_tokens=MEMORY_SUMMARY_MAX_TOKENS
+        )
+        self.last_token_stats: Dict[str, int] = {}
         self._init_session_state()
     
     def _init_session_state(self):
         """Inizializza le chiavi necessarie in session state"""
-        if self.MEMORY_KEY not in st.session_state:
-            # Crea nuova Memory datapizza
-            st.session_state[self.MEMORY_KEY] = Memory()
-        
         if self.CONTEXT_KEY not in st.session_state:
             # Context applicativo (non parte della memory LLM)
-            st.session_state[self.CONTEXT_KEY] = {
-                "all_substitutions": [],
-                "last_request": "",
-                "last_calculation_time": None
-            }
+            st.session_state[self.CONTEXT_KEY] = self._load_context()
+
+    @staticmethod
+    def _empty_context() -> Dict[str, Any]:
+        return {
+            "substitution_store": None,  # caricato alla prima richiesta (get_store)
+            "last_request": "",
+            "last_calculation_time": None,
+            "last_batch": None,
+            "memory_state": MemoryState(),
+            "turn_base": 0  # turni già riassunti non ricaricati dal backend
+        }
+
+    def _load_context(self) -> Dict[str, Any]:
+        """Context salvato nel backend (sessione ripresa dopo un reload o un riavvio)"""
+        ctx = self._empty_context()
+        saved = self.backend.load_session(self.session_id) if self.backend else None
+        if not saved or not saved.get("context"):
+            return ctx
+        data = saved["context"]
+        ctx["last_request"] = data.get("last_request", "")
+        if data.get("last_calculation_time"):
+            ctx["last_calculation_time"] = datetime.fromisoformat(data["last_calculation_time"])
+        ctx["last_batch"] = data.get("last_batch")
+        state = data.get("memory_state") or {}
+        ctx["memory_state"] = MemoryState(summary_lines=list(state.get("summary_lines", [])))
+        ctx["turn_base"] = int(state.get("summarized_turns", 0))
+        return ctx
+
+    def _save_context(self) -> None:
+        if self.backend is None:
+            return
+        ctx = st.session_state[self.CONTEXT_KEY]
+        state: MemoryState = ctx["memory_state"]
+        calculated = ctx.get("last_calculation_time")
+        self.backend.save_context(self.session_id, {
+            "last_request": ctx.get("last_request", ""),
+            "last_calculation_time": calculated.isoformat() if calculated else None,
+            "last_batch": ctx.get("last_batch"),
+            # Indice assoluto: al reload si caricano solo i turni non ancora riassunti
+            "memory_state": {
+                "summary_lines": state.summary_lines,
+                "summarized_turns": ctx["turn_base"] + state.summarized_turns,
+            },
+        })
     
     def get_memory(self) -> Memory:
         """
-        Restituisce l'oggetto Memory datapizza corrente
+        Restituisce l'oggetto Memory datapizza corrente (caricata dal backend al primo accesso)
         
         Returns:
             Memory: Oggetto Memory con la storia conversazionale
         """
+        if self.MEMORY_KEY not in st.session_state:
+            memory = Memory()
+            if self.backend is not None:
+                base = st.session_state[self.CONTEXT_KEY]["turn_base"]
+                for _, role, content in self.backend.load_turns(self.session_id, from_seq=base):
+                    memory.add_turn(TextBlock(content=content), role=ROLE(role))
+            st.session_state[self.MEMORY_KEY] = memory
         return st.session_state[self.MEMORY_KEY]
+
+    def _add_turn(self, content: str, role: ROLE) -> None:
+        memory = self.get_memory()
+        if self.backend is not None:
+            seq = st.session_state[self.CONTEXT_KEY]["turn_base"] + len(memory)
+            self.backend.append_turn(self.session_id, seq, role.value, content)
+        memory.add_turn(TextBlock(content=content), role=role)
+
+    def get_context_memory(self) -> Memory:
+        """
+        Memoria da passare agli agenti: ultimi turni entro il budget di token,
+        i più vecchi compattati nel riassunto progressivo.
+
+        Returns:
+            Memory: Vista compatta della conversazione (la Memory completa non cambia)
+        """
+        ctx = st.session_state[self.CONTEXT_KEY]
+        state = ctx["memory_state"]
+        folded = state.summarized_turns
+        context, stats = self.policy.build(self.get_memory(), state)
+        # Turni già riassunti in sessioni precedenti (non ricaricati)
+        stats["turns_total"] += ctx["turn_base"]
+        stats["turns_summarized"] += ctx["turn_base"]
+        self.last_token_stats = stats
+        if state.summarized_turns != folded:
+            self._save_context()
+        return context
+
+    def get_token_stats(self) -> Dict[str, int]:
+        """
+        Contabilità dei token della memoria (per la modalità debug)
+
+        Returns:
+            Token della conversazione completa e della vista passata agli agenti
+        """
+        if not self.last_token_stats:
+            self.get_context_memory()
+        return self.last_token_stats
     
     def add_user_message(self, content: str):
         """
@@ -56,9 +157,7 @@ class ConversationMemoryManager:
         Args:
             content: Testo del messaggio utente
         """
-        memory = self.get_memory()
-        text_block = TextBlock(content=content)
-        memory.add_turn(text_block, role=ROLE.USER)
+        self._add_turn(content, ROLE.USER)
     
     def add_assistant_message(self, content: str):
         """
@@ -67,48 +166,67 @@ class ConversationMemoryManager:
         Args:
             content: Testo della risposta assistant
         """
-        memory = self.get_memory()
-        text_block = TextBlock(content=content)
-        memory.add_turn(text_block, role=ROLE.ASSISTANT)
+        # I JSON delle sostituzioni restano nello storico strutturato: in memoria solo un riferimento
+        batch = st.session_state[self.CONTEXT_KEY].get("last_batch")
+        reference = MemoryPolicy.reference(batch)
+        self._add_turn(compact_substitution_json(content, reference), ROLE.ASSISTANT)
 
     def save_calculation_context(
         self,
         request: str,
         substitutions: List[Sostituzione]
-    ):
+    ) -> UpsertReport:
         """
-        Salva (APPEND) il context di un calcolo nel context applicativo.
-        Mantiene le sostituzioni precedenti.
+        Salva il context di un calcolo nello storico strutturato.
+        Le ripetizioni vengono scartate e un nuovo sostituto per la stessa
+        assenza supera quello precedente.
 
         Args:
             request: La richiesta dell'utente
             substitutions: Lista di sostituzioni calcolate (Pydantic models)
+
+        Returns:
+            UpsertReport con inserite, duplicate, superate e conflitti
         """
-        # Recupera sostituzioni esistenti
-        current_subs = st.session_state[self.CONTEXT_KEY].get("all_substitutions", [])
-        
-        # Prepara le nuove
-        new_subs = [s.model_dump() for s in substitutions]
-        
-        # Unisci le liste
-        # (Opzionale: potrei rimuovere duplicati, ma per ora append è più sicuro)
-        updated_subs = current_subs + new_subs
-        
+        store = self.get_store()
+        report = store.upsert_many(substitutions)
+        if self.backend is not None:
+            self.backend.save_substitutions(
+                self.session_id,
+                [(i, store.get(i)) for i in report.added_ids if store.get(i) is not None],
+                deactivated=report.superseded_ids
+            )
+
         # Aggiorna lo stato
         st.session_state[self.CONTEXT_KEY].update({
-            "all_substitutions": updated_subs,
             "last_request": request,
-            "last_calculation_time": datetime.now()
+            "last_calculation_time": datetime.now(),
+            "last_batch": report.ids
         })
+        self._save_context()
+        return report
+
+    def get_store(self) -> SubstitutionStore:
+        """
+        Storico strutturato delle sostituzioni della sessione
+
+        Returns:
+            SubstitutionStore indicizzato per giorno/ora, sostituto e assente
+        """
+        ctx = st.session_state[self.CONTEXT_KEY]
+        if ctx.get("substitution_store") is None:
+            saved = self.backend.load_substitutions(self.session_id) if self.backend else []
+            ctx["substitution_store"] = SubstitutionStore.restore(saved)
+        return ctx["substitution_store"]
 
     def get_all_substitutions(self) -> List[Dict[str, Any]]:
         """
-        Recupera le ultime sostituzioni calcolate
+        Recupera le sostituzioni attive (senza duplicati né voci superate)
         
         Returns:
             Lista di dizionari con le sostituzioni
         """
-        return st.session_state[self.CONTEXT_KEY].get("all_substitutions", [])
+        return self.get_store().records()
     
     def has_substitutions(self) -> bool:
         """
@@ -117,41 +235,61 @@ class ConversationMemoryManager:
         Returns:
             True se ci sono sostituzioni salvate
         """
-        return len(self.get_all_substitutions()) > 0
+        return len(self.get_store()) > 0
     
-    def get_substitutions_summary(self) -> str:
+    def get_substitutions_summary(self, request: str = "") -> str:
         """
-        Crea un summary testuale delle sostituzioni per context degli agenti
-        
+        Crea un summary testuale delle sostituzioni per context degli agenti.
+        Con `request` include solo le sostituzioni pertinenti (elfi, giorni e
+        ore citati), al massimo HISTORY_PROMPT_MAX_ENTRIES righe.
+
+        Args:
+            request: Richiesta dell'utente (vuota = tutte le sostituzioni, più recenti)
+
         Returns:
             Stringa formattata con il summary
         """
-        subs = self.get_all_substitutions()
-        if not subs:
+        store = self.get_store()
+        if not len(store):
             return "Nessuna sostituzione calcolata in precedenza."
-        
+
+        if request:
+            params = normalize_request(request, store.names()).params
+            ids = store.select(params["elfi"], params["giorni"], params["ore"])
+        else:
+            ids = [i for i, _ in store.items()]
+        # Oltre il limite si tengono le più recenti
+        ids = ids[-HISTORY_PROMPT_MAX_ENTRIES:] if HISTORY_PROMPT_MAX_ENTRIES > 0 else []
+        omitted = len(store) - len(ids)
+
         ctx = st.session_state[self.CONTEXT_KEY]
-        summary = f"**Ultima richiesta**: {ctx.get('last_request', 'N/A')}\n"
-        summary += f"**Calcolo**: {ctx.get('last_calculation_time', 'N/A')}\n"
-        summary += f"**Sostituzioni calcolate** ({len(subs)}):\n\n"
-        
-        for i, s in enumerate(subs, 1):
-            summary += f"{i}. {s['assente']} ({s['reparto']}, {s['giorno']} ora {s['ora']}) "
-            summary += f"→ {s['sostituto']} [{s['regola_applicata']}]\n"
-            if s.get('reasoning'):
-                summary += f"   Reasoning: {s['reasoning']}\n"
-        
-        return summary
+        lines = [
+            f"**Ultima richiesta**: {ctx.get('last_request', 'N/A')}",
+            f"**Calcolo**: {ctx.get('last_calculation_time', 'N/A')}",
+            f"**Sostituzioni calcolate** ({len(store)}, mostrate {len(ids)}):",
+            "",
+        ]
+        lines.extend(store.summary_lines(ids))
+        if omitted:
+            lines.append(f"... altre {omitted} sostituzioni omesse (non pertinenti o meno recenti)")
+
+        shown = {(slot_of(store.get(i)) or ("", 0)) for i in ids}
+        conflicts = [c for c in store.conflicts() if slot_of({"giorno": c.giorno, "ora": c.ora}) in shown]
+        if conflicts:
+            lines.append("")
+            lines.append("**Conflitti da risolvere**:")
+            lines.extend(f"- {c}" for c in conflicts)
+
+        return "\n".join(lines) + "\n"
     
     
     def clear_all(self):
         """Reset completo: memory conversazionale + context applicativo"""
         st.session_state[self.MEMORY_KEY] = Memory()
-        st.session_state[self.CONTEXT_KEY] = {
-            "all_substitutions": [],
-            "last_request": "",
-            "last_calculation_time": None
-        }
+        st.session_state[self.CONTEXT_KEY] = self._empty_context()
+        self.last_token_stats = {}
+        if self.backend is not None:
+            self.backend.clear_session(self.session_id)
     
     def get_conversation_length(self) -> int:
         """
@@ -0,0 +1,163 @@
+"""
+Politica di memoria conversazionale con budget di token.
+
+La Memory completa resta la trascrizione della sessione; agli agenti viene
+passata una vista compatta: gli ultimi turni entro il budget e, al posto dei
+turni più vecchi, un riassunto progressivo (una riga per turno). I JSON delle
+sostituzioni nelle risposte diventano riferimenti allo storico strutturato.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from datapizza.memory import Memory
+from datapizza.type import ROLE, TextBlock
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken opzionale: stima a caratteri
+    _ENCODING = None
+
+SUMMARY_HEADER = "RIASSUNTO DELLA CONVERSAZIONE PRECEDENTE (turni più vecchi, compattati):"
+ROLE_LABELS = {ROLE.USER: "Utente", ROLE.ASSISTANT: "Babbo Natale"}
+
+
+def count_tokens(text: str) -> int:
+    """Token del testo (tiktoken se installato, altrimenti ~4 caratteri per token)"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+def turn_text(turn) -> str:
+    """Testo di un turno (solo i TextBlock)"""
+    return "\n".join(block.content for block in turn if isinstance(block, TextBlock))
+
+
+def compact_substitution_json(text: str, reference: str) -> str:
+    """
+    Sostituisce nel testo gli array JSON di sostituzioni (anche in blocchi
+    ```json) con un riferimento allo storico strutturato.
+
+    Args:
+        text: Testo di una risposta
+        reference: Testo del riferimento (es. "[4 sostituzioni: storico #1-#4]")
+    """
+    decoder = json.JSONDecoder()
+    out: List[str] = []
+    i = 0
+    while i < len(text):
+        start = text.find("[", i)
+        if start < 0:
+            break
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except ValueError:
+            out.append(text[i:start + 1])
+            i = start + 1
+            continue
+        if isinstance(value, list) and value and all(isinstance(v, dict) and "sostituto" in v for v in value):
+            out.append(text[i:start] + reference)
+        else:
+            out.append(text[i:end])
+        i = end
+    out.append(text[i:])
+    compacted = "".join(out)
+    # Blocchi ```json rimasti con il solo riferimento
+    return re.sub(r"```(?:json)?\s*(" + re.escape(reference) + r")\s*```", r"\1", compacted)
+
+
+def _abstract(text: str, max_chars: int = 160) -> str:
+    """Prima frase del testo, su una riga"""
+    flat = " ".join(text.split())
+    sentence = re.split(r"(?<=[.!?])\s", flat, maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 1] + "…"
+
+
+@dataclass
+class MemoryState:
+    """Stato del riassunto progressivo (salvato nel context applicativo)"""
+    summary_lines: List[str] = field(default_factory=list)
+    summarized_turns: int = 0  # turni della Memory completa già nel riassunto
+
+
+class MemoryPolicy:
+    """
+    Costruisce la vista di memoria da passare agli agenti.
+
+    I turni escono dalla finestra dal più vecchio quando sono più di
+    `window_turns` o quando finestra + riassunto superano `token_budget`;
+    il riassunto tiene solo le righe più recenti entro `summary_max_tokens`.
+    """
+
+    def __init__(self, token_budget: int = 3000, window_turns: int = 8, summary_max_tokens: int = 600):
+        self.token_budget = token_budget
+        self.window_turns = max(1, window_turns)
+        self.summary_max_tokens = summary_max_tokens
+
+    def _fold(self, turn, state: MemoryState) -> None:
+        text = turn_text(turn)
+        if text.strip():
+            label = ROLE_LABELS.get(turn.role, turn.role.value)
+            state.summary_lines.append(f"- {label}: {_abstract(text)}")
+        state.summarized_turns += 1
+        while state.summary_lines and count_tokens("\n".join(state.summary_lines)) > self.summary_max_tokens:
+            state.summary_lines.pop(0)
+
+    def build(self, memory: Memory, state: MemoryState) -> Tuple[Memory, Dict[str, int]]:
+        """
+        Vista compatta della memoria; aggiorna `state` con i turni compattati.
+
+        Returns:
+            (Memory per gli agenti, contabilità dei token)
+        """
+        turns = list(memory)
+        state.summarized_turns = min(state.summarized_turns, len(turns))
+        window = turns[state.summarized_turns:]
+        window_tokens = [count_tokens(turn_text(t)) for t in window]
+
+        def summary_tokens() -> int:
+            return count_tokens(SUMMARY_HEADER + "\n" + "\n".join(state.summary_lines)) if state.summary_lines else 0
+
+        # Si lascia sempre almeno l'ultimo scambio (utente + risposta)
+        while window and (
+            len(window) > self.window_turns
+            or (len(window) > 2 and sum(window_tokens) + summary_tokens() > self.token_budget)
+        ):
+            self._fold(window.pop(0), state)
+            window_tokens.pop(0)
+
+        context = Memory()
+        if state.summary_lines:
+            context.add_turn(TextBlock(content=SUMMARY_HEADER + "\n" + "\n".join(state.summary_lines)), role=ROLE.USER)
+        for turn in window:
+            context.memory.append(turn)
+
+        stats = {
+            "budget": self.token_budget,
+            "full_tokens": sum(count_tokens(turn_text(t)) for t in turns),
+            "context_tokens": summary_tokens() + sum(window_tokens),
+            "summary_tokens": summary_tokens(),
+            "window_tokens": sum(window_tokens),
+            "turns_total": len(turns),
+            "turns_window": len(window),
+            "turns_summarized": state.summarized_turns,
+        }
+        return context, stats
+
+    @staticmethod
+    def reference(ids: Optional[List[int]] = None) -> str:
+        """Riferimento testuale a un blocco di sostituzioni dello storico strutturato (per id)"""
+        if not ids:
+            return "[sostituzioni: vedi storico strutturato]"
+        ids = sorted(set(ids))
+        if ids == list(range(ids[0], ids[-1] + 1)):
+            span = f"#{ids[0]}" if len(ids) == 1 else f"#{ids[0]}-#{ids[-1]}"
+        else:
+            span = ", ".join(f"#{i}" for i in ids)
+        return f"[{len(ids)} sostituzioni: storico strutturato {span}]"
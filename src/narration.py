@@ -0,0 +1,79 @@
+"""
+Narrazione deterministica delle sostituzioni (senza chiamate LLM).
+
+Alternativa al Narrator per chi preferisce una risposta immediata e
+riproducibile: il racconto viene composto da frasi a modello scelte in
+base alla regola applicata, con gli stessi fatti della tabella.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+from src.models import Sostituzione
+
+# Frase per regola (chiave cercata nel testo di regola_applicata, minuscolo)
+RULE_SENTENCES = OrderedDict([
+    ("assistente", "{sostituto}, assistente dal cappello verde già al lavoro in {reparto}, prende in mano il reparto al posto di {assente} nella {ora}^ ora"),
+    ("jolly", "{sostituto}, che aveva l'ora Jolly, corre in {reparto} a coprire {assente} nella {ora}^ ora"),
+    ("pizza", "{sostituto} rinuncia alla pausa pizza 🍕 e raggiunge {reparto} al posto di {assente} nella {ora}^ ora"),
+    ("precedente", "{sostituto} conferma la copertura di {assente} in {reparto} nella {ora}^ ora"),
+])
+DEFAULT_SENTENCE = "{sostituto} copre {assente} in {reparto} nella {ora}^ ora"
+UNCOVERED_SENTENCE = "per {assente} in {reparto} nella {ora}^ ora non c'è ancora un sostituto: servirà un piano B ❄️"
+
+
+def _is_uncovered(s: Sostituzione) -> bool:
+    """True se la sostituzione non ha un sostituto (es. 'Nessun sostituto disponibile')"""
+    value = str(s.sostituto).strip().lower()
+    return not value or value.startswith("nessun") or value in ("n/a", "-")
+
+
+def _sentence(s: Sostituzione) -> str:
+    values = {"sostituto": s.sostituto, "assente": s.assente, "reparto": s.reparto, "ora": s.ora}
+    if _is_uncovered(s):
+        return UNCOVERED_SENTENCE.format(**values)
+    rule = str(s.regola_applicata).lower()
+    for key, template in RULE_SENTENCES.items():
+        if key in rule:
+            return template.format(**values)
+    return DEFAULT_SENTENCE.format(**values)
+
+
+def template_narration(substitutions: Sequence[Sostituzione]) -> str:
+    """
+    Racconto natalizio delle sostituzioni, raggruppate per giorno.
+
+    Args:
+        substitutions: Sostituzioni validate
+
+    Returns:
+        Testo markdown (stringa vuota se non ci sono sostituzioni)
+    """
+    if not substitutions:
+        return ""
+
+    by_day: Dict[str, List[Sostituzione]] = OrderedDict()
+    for s in substitutions:
+        by_day.setdefault(str(s.giorno), []).append(s)
+
+    absent = sorted({str(s.assente) for s in substitutions})
+    covered = sum(1 for s in substitutions if not _is_uncovered(s))
+
+    names = ", ".join(absent[:-1]) + " e " + absent[-1] if len(absent) > 1 else absent[0]
+    verb = "mancano" if len(absent) > 1 else "manca"
+    lines = [
+        f"🎄 Allarme in Fabbrica! {names} {verb} all'appello, ma Babbo Natale ha già attivato il Piano di Emergenza ⭐",
+        "",
+    ]
+    for day, items in by_day.items():
+        sentences = [_sentence(s) for s in sorted(items, key=lambda x: x.ora)]
+        lines.append(f"**{day}**: " + "; ".join(sentences) + ".")
+        lines.append("")
+
+    if covered == len(substitutions):
+        lines.append("Grazie al lavoro di squadra degli elfi, la produzione continua senza sosta! Ho Ho Ho! 🎅")
+    else:
+        lines.append(
+            f"{covered} turni su {len(substitutions)} sono coperti: per gli altri Babbo Natale sta già cercando rinforzi. Ho Ho Ho! 🎅"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,76 @@
+"""
+Contesto della richiesta in corso, condiviso tra agenti e tool.
+
+Gli agenti invocati dall'orchestratore e il tool `execute_code_in_sandbox`
+girano nello stesso task asyncio (o in thread che ne copiano il contesto):
+un `ContextVar` con un oggetto mutabile permette di passare dati fuori
+banda (parametri della richiesta, ultimo codice eseguito con successo)
+senza farli transitare dal testo scambiato con l'LLM.
+
+Allo stesso modo `RequestResult` riporta al chiamante (la UI) le
+sostituzioni validate, che l'orchestratore non deve più ricopiare nella
+risposta finale.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@dataclass
+class RunContext:
+    """Stato di una singola invocazione del Code Generator"""
+    # Parametri passati a calcola_sostituzioni(df, params)
+    params: Dict[str, Any] = field(default_factory=dict)
+    # Ultimo programma eseguito con successo e relativo output JSON
+    last_success_code: Optional[str] = None
+    last_success_result: Optional[str] = None
+    # Esecuzioni in sandbox effettuate (per gli eventi di avanzamento)
+    attempts: int = 0
+
+
+_current: ContextVar[Optional[RunContext]] = ContextVar("fai_run_context", default=None)
+
+
+def current_run() -> Optional[RunContext]:
+    """Restituisce il contesto attivo, oppure None fuori da una richiesta"""
+    return _current.get()
+
+
+@contextmanager
+def run_scope(context: Optional[RunContext] = None) -> Iterator[RunContext]:
+    """Attiva un contesto per la durata del blocco `with`"""
+    context = context or RunContext()
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@dataclass
+class RequestResult:
+    """Dati strutturati prodotti durante una richiesta utente, per il chiamante"""
+    # Sostituzioni validate (oggetti Sostituzione) della richiesta; un nuovo
+    # calcolo sostituisce le righe delle stesse assenze (assente, giorno, ora)
+    substitutions: List[Any] = field(default_factory=list)
+
+
+_request: ContextVar[Optional[RequestResult]] = ContextVar("fai_request_result", default=None)
+
+
+def current_request() -> Optional[RequestResult]:
+    """Restituisce il risultato della richiesta utente in corso, se attivo"""
+    return _request.get()
+
+
+@contextmanager
+def request_scope(result: Optional[RequestResult] = None) -> Iterator[RequestResult]:
+    """Raccoglie i risultati strutturati della richiesta eseguita nel blocco `with`"""
+    result = result or RequestResult()
+    token = _request.set(result)
+    try:
+        yield result
+    finally:
+        _request.reset(token)
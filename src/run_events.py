@@ -0,0 +1,202 @@
+"""
+Eventi di avanzamento di una richiesta, per lo streaming verso la UI.
+
+Agenti e tool pubblicano eventi (passo avviato, tool chiamato, tentativo
+in sandbox, token della risposta) su un sink legato al contesto della
+richiesta tramite ContextVar: il contesto segue la richiesta anche nel
+loop asincrono in cui datapizza esegue gli agenti usati come tool.
+`stream_agent_run` (e `stream_agent_call` per gli specialist) esegue un
+agente in un thread separato e restituisce gli eventi man mano che arrivano.
+"""
+
+import contextvars
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from datapizza.agents import Agent
+from datapizza.agents.agent import AgentHooks, StepContext, StepResult
+from datapizza.core.clients import ClientResponse
+from datapizza.core.executors.async_executor import AsyncExecutor
+from datapizza.memory import Memory
+
+from src.tracing import StepSpans
+
+# Tipi di evento
+STEP = "step"        # un agente inizia un passo (chiamata LLM)
+TOOL = "tool"        # un agente ha chiamato un tool o un altro agente
+STATUS = "status"    # avanzamento descritto a parole (tentativi, cache, solver)
+TOKEN = "token"      # frammento della risposta testuale di un agente
+FINAL = "final"      # fine della richiesta: `result` contiene lo StepResult
+ERROR = "error"      # fine con errore: `error` contiene l'eccezione
+
+
+@dataclass
+class RunEvent:
+    """Evento di avanzamento di una richiesta"""
+    kind: str
+    agent: str = ""
+    message: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[StepResult] = None
+    error: Optional[BaseException] = None
+
+
+_sink: ContextVar[Optional[Callable[[RunEvent], None]]] = ContextVar("fai_run_events", default=None)
+
+
+@contextmanager
+def event_scope(sink: Callable[[RunEvent], None]) -> Iterator[None]:
+    """Rende `sink` il destinatario degli eventi emessi nel blocco"""
+    token = _sink.set(sink)
+    try:
+        yield
+    finally:
+        _sink.reset(token)
+
+
+def is_streaming() -> bool:
+    """True se qualcuno sta ascoltando gli eventi della richiesta corrente"""
+    return _sink.get() is not None
+
+
+def emit(kind: str, agent: str = "", message: str = "", **data: Any) -> None:
+    """Pubblica un evento (nessun effetto fuori da `event_scope`)"""
+    sink = _sink.get()
+    if sink is None:
+        return
+    try:
+        sink(RunEvent(kind=kind, agent=agent, message=message, data=data))
+    except Exception as e:
+        print(f"⚠️ Evento di avanzamento non consegnato: {e}")
+
+
+class EventHooks(AgentHooks):
+    """Hook datapizza che pubblicano inizio passo e tool chiamati (e aprono lo span del passo)"""
+
+    def __init__(self):
+        self.spans = StepSpans()
+
+    def before_step(self, context: StepContext) -> None:
+        self.spans.start(context, context.agent.name, context.step_index)
+        emit(STEP, context.agent.name, step=context.step_index)
+
+    def after_step(self, context: StepContext, result: StepResult) -> None:
+        for call in result.tools_used:
+            emit(TOOL, context.agent.name, tool=call.name)
+        self.spans.end(
+            context,
+            tools=",".join(call.name for call in result.tools_used) or None,
+            prompt_tokens=result.usage.prompt_tokens,
+            completion_tokens=result.usage.completion_tokens,
+        )
+
+
+class TracedAgent(Agent):
+    """
+    Agent che, se un passo solleva un'eccezione, chiude gli span dei passi
+    rimasti aperti (datapizza non chiama after_step sul percorso d'errore).
+    Base di tutti gli agenti del sistema con `EventHooks`.
+    """
+
+    def _abort_steps(self, error: BaseException) -> None:
+        if isinstance(self._hooks, EventHooks):
+            self._hooks.spans.abort(error)
+
+    def run(self, *args, **kwargs):
+        try:
+            return super().run(*args, **kwargs)
+        except BaseException as e:
+            self._abort_steps(e)
+            raise
+
+    async def a_run(self, *args, **kwargs):
+        try:
+            return await super().a_run(*args, **kwargs)
+        except BaseException as e:
+            self._abort_steps(e)
+            raise
+
+    def stream_invoke(self, *args, **kwargs):
+        try:
+            yield from super().stream_invoke(*args, **kwargs)
+        except BaseException as e:
+            self._abort_steps(e)
+            raise
+
+    async def a_stream_invoke(self, *args, **kwargs):
+        try:
+            async for item in super().a_stream_invoke(*args, **kwargs):
+                yield item
+        except BaseException as e:
+            self._abort_steps(e)
+            raise
+
+
+def _stream_in_thread(name: str, target: Callable[[], Optional[StepResult]]) -> Iterator[RunEvent]:
+    """Esegue `target` in un thread con gli eventi rediretti su una coda, restituendoli man mano"""
+    events: "queue.Queue[RunEvent]" = queue.Queue()
+
+    def _worker() -> None:
+        with event_scope(events.put):
+            try:
+                final = target()
+                events.put(RunEvent(kind=FINAL, agent=name, result=final))
+            except BaseException as e:
+                events.put(RunEvent(kind=ERROR, agent=name, error=e))
+
+    # Il worker eredita il contesto del chiamante (es. request_scope)
+    context = contextvars.copy_context()
+    worker = threading.Thread(target=context.run, args=(_worker,), name=f"stream-{name}", daemon=True)
+    worker.start()
+    try:
+        while True:
+            event = events.get()
+            yield event
+            if event.kind in (FINAL, ERROR):
+                return
+    finally:
+        # Anche se il chiamante smette di leggere (es. rerun di Streamlit) si
+        # attende la fine del worker: chi consuma gli eventi tiene le risorse
+        # della richiesta (pool degli agenti, sessione occupata) finché la run
+        # non è davvero terminata
+        worker.join()
+
+
+def stream_agent_run(
+    agent,
+    task_input: str,
+    memory: Optional[Memory] = None
+) -> Iterator[RunEvent]:
+    """
+    Esegue l'agente in streaming in un thread separato.
+
+    Yields:
+        Gli eventi della richiesta in ordine di arrivo; l'ultimo è sempre
+        FINAL (con lo StepResult finale) oppure ERROR.
+    """
+    def _run() -> Optional[StepResult]:
+        final = None
+        for item in agent.stream_invoke(task_input, memory=memory):
+            if isinstance(item, ClientResponse) and item.delta:
+                emit(TOKEN, agent.name, item.delta)
+            elif isinstance(item, StepResult):
+                final = item
+        return final
+
+    return _stream_in_thread(agent.name, _run)
+
+
+def stream_agent_call(agent, task_input: str) -> Iterator[RunEvent]:
+    """
+    Come `stream_agent_run`, ma passa da `agent.a_run` come quando l'agente è
+    usato come tool: valgono gli override degli specialist (cache e consegna
+    del code generator, dati allegati e token del narrator).
+    """
+    return _stream_in_thread(
+        agent.name,
+        lambda: AsyncExecutor.get_instance().run(agent.a_run(task_input))
+    )
@@ -0,0 +1,371 @@
+"""
+Pool process-wide di sandbox E2B pre-avviate.
+
+Evita di pagare boot e teardown di una sandbox a ogni chiamata di
+`execute_code_in_sandbox`: le sandbox vengono prestate (lease) e restituite
+al pool, riutilizzate tra i tentativi di self-correction della stessa
+richiesta e tra utenti diversi.
+"""
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from e2b_code_interpreter import Sandbox
+
+from src.config import (
+    E2B_API_KEY,
+    E2B_TIMEOUT,
+    E2B_POOL_MIN_SIZE,
+    E2B_POOL_MAX_SIZE,
+    E2B_POOL_IDLE_TIMEOUT,
+    E2B_POOL_ACQUIRE_TIMEOUT,
+    E2B_POOL_HEALTHCHECK_INTERVAL,
+)
+
+# Root remota sotto cui vengono create le working directory dei lease
+REMOTE_WORK_ROOT = "/home/user/runs"
+# Root remota dei file condivisi tra lease (orari, per hash del contenuto)
+REMOTE_BLOB_ROOT = "/home/user/blobs"
+
+
+@dataclass
+class PooledSandbox:
+    """Sandbox gestita dal pool con i suoi metadati di utilizzo"""
+    sandbox: Sandbox
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    last_health_check: float = field(default_factory=time.monotonic)
+    affinity_key: Optional[str] = None
+    leases: int = 0
+    # File già caricati nella sandbox: chiave (hash + estensione) -> path remoto
+    uploaded: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def sandbox_id(self) -> str:
+        return getattr(self.sandbox, "sandbox_id", "") or str(id(self.sandbox))
+
+
+@dataclass
+class SandboxLease:
+    """Prestito di una sandbox: working directory pulita e dedicata"""
+    pooled: PooledSandbox
+    workdir: str
+
+    @property
+    def sandbox(self) -> Sandbox:
+        return self.pooled.sandbox
+
+
+class SandboxPool:
+    """
+    Pool thread-safe di sandbox E2B con dimensione minima/massima,
+    health check, eviction delle sandbox inattive e API lease/return.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        min_size: int = 1,
+        max_size: int = 4,
+        idle_timeout: float = 240,
+        sandbox_timeout: int = 300,
+        acquire_timeout: float = 60,
+        healthcheck_interval: float = 30,
+    ):
+        """
+        Args:
+            api_key: E2B API key
+            min_size: Numero di sandbox da tenere sempre calde
+            max_size: Numero massimo di sandbox vive contemporaneamente
+            idle_timeout: Secondi di inattività dopo cui una sandbox oltre il minimo viene chiusa
+            sandbox_timeout: Timeout E2B (secondi) rinnovato a ogni lease
+            acquire_timeout: Attesa massima per un lease quando il pool è saturo
+            healthcheck_interval: Secondi minimi tra due health check della stessa sandbox
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Dimensioni pool non valide: min={min_size}, max={max_size}")
+
+        self.api_key = api_key
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.sandbox_timeout = sandbox_timeout
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        self._idle: List[PooledSandbox] = []
+        self._busy: Dict[str, PooledSandbox] = {}
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._maintenance_thread: Optional[threading.Thread] = None
+
+    # ----------------------------------------
+    # Ciclo di vita sandbox
+    # ----------------------------------------
+    def _create_sandbox(self) -> PooledSandbox:
+        sandbox = Sandbox.create(api_key=self.api_key, timeout=self.sandbox_timeout)
+        return PooledSandbox(sandbox=sandbox)
+
+    def _kill(self, pooled: PooledSandbox) -> None:
+        try:
+            pooled.sandbox.kill()
+        except Exception as e:
+            print(f"⚠️ Impossibile chiudere la sandbox {pooled.sandbox_id}: {e}")
+
+    def _is_healthy(self, pooled: PooledSandbox, force: bool = False) -> bool:
+        """Verifica che la sandbox sia ancora viva (al massimo una volta per intervallo)"""
+        now = time.monotonic()
+        if not force and now - pooled.last_health_check < self.healthcheck_interval:
+            return True
+        try:
+            healthy = pooled.sandbox.is_running()
+        except Exception:
+            healthy = False
+        pooled.last_health_check = now
+        return healthy
+
+    def _total(self) -> int:
+        return len(self._idle) + len(self._busy) + self._pending
+
+    # ----------------------------------------
+    # Lease / return
+    # ----------------------------------------
+    def acquire(self, affinity_key: Optional[str] = None) -> SandboxLease:
+        """
+        Prende in prestito una sandbox dal pool.
+
+        Se `affinity_key` è indicata (es. il file della richiesta corrente) viene
+        preferita la sandbox usata per ultima con la stessa chiave, così i
+        tentativi successivi della stessa richiesta riusano la stessa macchina.
+
+        Raises:
+            TimeoutError: Se il pool è saturo oltre `acquire_timeout`
+        """
+        self._ensure_maintenance()
+        deadline = time.monotonic() + self.acquire_timeout
+
+        while True:
+            pooled = None
+            must_create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Il pool di sandbox è stato chiuso")
+
+                if self._idle:
+                    pooled = self._pick_idle(affinity_key)
+                elif self._total() < self.max_size:
+                    must_create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Nessuna sandbox disponibile nel pool")
+                    self._cond.wait(timeout=remaining)
+                    continue
+                # Finché il lease non è aperto la sandbox conta come "in preparazione"
+                self._pending += 1
+
+            lease = None
+            try:
+                if must_create:
+                    pooled = self._create_sandbox()
+                if must_create or self._is_healthy(pooled):
+                    lease = self._open_lease(pooled, affinity_key)
+            except Exception:
+                if pooled is None or time.monotonic() >= deadline:
+                    with self._cond:
+                        self._pending -= 1
+                        self._cond.notify_all()
+                    raise
+
+            with self._cond:
+                self._pending -= 1
+                if lease is not None:
+                    self._busy[pooled.sandbox_id] = pooled
+                self._cond.notify_all()
+
+            if lease is not None:
+                return lease
+
+            # Sandbox non utilizzabile: la scartiamo e riproviamo
+            self._kill(pooled)
+
+    def _pick_idle(self, affinity_key: Optional[str]) -> PooledSandbox:
+        """Estrae una sandbox idle preferendo quella con la stessa affinità (chiamare col lock)"""
+        if affinity_key is not None:
+            for i, candidate in enumerate(self._idle):
+                if candidate.affinity_key == affinity_key:
+                    return self._idle.pop(i)
+        # Altrimenti la più recente (LIFO): le più vecchie scadono per prime
+        return self._idle.pop()
+
+    def _open_lease(self, pooled: PooledSandbox, affinity_key: Optional[str]) -> SandboxLease:
+        """Rinnova il timeout E2B e prepara una working directory pulita"""
+        pooled.sandbox.set_timeout(self.sandbox_timeout)
+        workdir = f"{REMOTE_WORK_ROOT}/{uuid.uuid4().hex}"
+        pooled.sandbox.files.make_dir(workdir)
+        pooled.affinity_key = affinity_key
+        pooled.leases += 1
+        return SandboxLease(pooled=pooled, workdir=workdir)
+
+    def release(self, lease: SandboxLease, healthy: bool = True) -> None:
+        """
+        Restituisce una sandbox al pool ripulendo la working directory del lease.
+
+        Args:
+            lease: Lease ottenuto da `acquire`
+            healthy: False se l'esecuzione ha lasciato la sandbox in stato incerto
+        """
+        pooled = lease.pooled
+        if healthy:
+            try:
+                pooled.sandbox.files.remove(lease.workdir)
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            self._busy.pop(pooled.sandbox_id, None)
+            keep = healthy and not self._closed
+            if keep:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify_all()
+
+        if not keep:
+            self._kill(pooled)
+
+    @contextmanager
+    def lease(self, affinity_key: Optional[str] = None) -> Iterator[SandboxLease]:
+        """Context manager: `with pool.lease(key) as lease: ...`"""
+        lease = self.acquire(affinity_key)
+        healthy = True
+        try:
+            yield lease
+        except BaseException:
+            healthy = self._is_healthy(lease.pooled, force=True)
+            raise
+        finally:
+            self.release(lease, healthy=healthy)
+
+    # ----------------------------------------
+    # Manutenzione: warm-up, keep-alive, eviction
+    # ----------------------------------------
+    def _ensure_maintenance(self) -> None:
+        with self._cond:
+            if self._maintenance_thread is not None or self._closed:
+                return
+            self._maintenance_thread = threading.Thread(
+                target=self._maintenance_loop,
+                name="e2b-sandbox-pool",
+                daemon=True
+            )
+            self._maintenance_thread.start()
+
+    def _maintenance_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"⚠️ Errore manutenzione pool sandbox: {e}")
+            time.sleep(self.healthcheck_interval)
+
+    def maintain(self) -> None:
+        """
+        Un giro di manutenzione:
+            - chiude le sandbox idle oltre il minimo e inattive da troppo
+            - scarta le sandbox non più sane e rinnova il timeout delle altre
+            - riporta il pool alla dimensione minima
+        """
+        now = time.monotonic()
+        to_check: List[PooledSandbox] = []
+        to_kill: List[PooledSandbox] = []
+
+        with self._cond:
+            # Le più vecchie sono in testa alla lista
+            while (
+                self._idle
+                and len(self._idle) + len(self._busy) > self.min_size
+                and now - self._idle[0].last_used > self.idle_timeout
+            ):
+                to_kill.append(self._idle.pop(0))
+            to_check = list(self._idle)
+
+        for pooled in to_kill:
+            self._kill(pooled)
+
+        for pooled in to_check:
+            alive = self._is_healthy(pooled, force=True)
+            if alive:
+                try:
+                    pooled.sandbox.set_timeout(self.sandbox_timeout)
+                except Exception:
+                    alive = False
+            if not alive:
+                with self._cond:
+                    if pooled in self._idle:
+                        self._idle.remove(pooled)
+                self._kill(pooled)
+
+        while True:
+            with self._cond:
+                if self._closed or self._total() >= self.min_size:
+                    break
+                self._pending += 1
+            try:
+                pooled = self._create_sandbox()
+            except Exception as e:
+                print(f"⚠️ Warm-up sandbox fallito: {e}")
+                with self._cond:
+                    self._pending -= 1
+                break
+            with self._cond:
+                self._pending -= 1
+                self._idle.append(pooled)
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche correnti del pool (per la modalità debug)"""
+        with self._cond:
+            return {
+                "idle": len(self._idle),
+                "busy": len(self._busy),
+                "pending": self._pending,
+                "max_size": self.max_size,
+            }
+
+    def shutdown(self) -> None:
+        """Chiude tutte le sandbox idle; quelle in uso vengono chiuse al rilascio"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._kill(pooled)
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Restituisce il pool process-wide, creandolo al primo utilizzo"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                api_key=E2B_API_KEY,
+                min_size=E2B_POOL_MIN_SIZE,
+                max_size=E2B_POOL_MAX_SIZE,
+                idle_timeout=E2B_POOL_IDLE_TIMEOUT,
+                sandbox_timeout=E2B_TIMEOUT,
+                acquire_timeout=E2B_POOL_ACQUIRE_TIMEOUT,
+                healthcheck_interval=E2B_POOL_HEALTHCHECK_INTERVAL,
+            )
+        return _pool
@@ -0,0 +1,198 @@
+"""
+Cache colonnare (Parquet) degli orari caricati.
+
+Leggere un .xlsx con openpyxl è il modo più lento di caricare dati tabellari:
+al momento dell'upload l'orario viene convertito una volta sola in Parquet,
+con le colonne turno in dtype categorico, e salvato con l'hash del contenuto
+come nome. Gli esecutori caricano questa copia e tornano all'xlsx solo se la
+cache manca.
+"""
+
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from src.availability_index import AvailabilityIndex
+from src.config import COLUMNAR_CACHE_DIR
+from src.utils import file_content_hash
+
+# Colonne turno nel formato 'GGG_O' (es. 'LUN_1', 'MAR_6')
+SHIFT_COLUMN_PATTERN = re.compile(r"^[A-Z]{3}_\d+$")
+
+# Oltre questa quota di valori distinti una colonna testuale non diventa categorica
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+
+def is_shift_column(column) -> bool:
+    """True se la colonna segue il formato turni 'GGG_O'"""
+    return bool(SHIFT_COLUMN_PATTERN.match(str(column)))
+
+
+def to_columnar_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte le colonne turno (e le colonne testuali a bassa cardinalità)
+    in dtype categorico: i codici reparto si ripetono moltissimo.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].dropna()
+        ratio = values.nunique() / len(values) if len(values) else 0
+        if is_shift_column(col) or ratio <= CATEGORICAL_MAX_UNIQUE_RATIO:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def decode_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Riporta le colonne categoriche a object.
+    Il codice generato assume celle libere (NaN, fillna(""), assegnazioni di
+    nuovi valori come 'ABS - Robot') che un Categorical rifiuterebbe.
+    """
+    for col in df.select_dtypes(include="category").columns:
+        df[col] = df[col].astype(object)
+    return df
+
+
+def columnar_cache_path(file_hash: str) -> Path:
+    """Path della copia colonnare per un dato hash di contenuto"""
+    return COLUMNAR_CACHE_DIR / f"{file_hash}.parquet"
+
+
+def build_columnar_cache(xlsx_path: Path) -> Optional[Path]:
+    """
+    Crea (se non esiste già) la copia Parquet tipizzata di un orario.
+
+    Args:
+        xlsx_path: Path del file Excel caricato
+
+    Returns:
+        Path del file Parquet, oppure None se la conversione non è possibile
+        (es. pyarrow non installato o colonne con tipi misti)
+    """
+    target = columnar_cache_path(file_content_hash(xlsx_path))
+    if target.exists():
+        return target
+
+    try:
+        df = to_columnar_dtypes(pd.read_excel(xlsx_path, header=0))
+        # Scrittura atomica: un lettore concorrente non vede mai un file parziale
+        tmp_path = target.with_suffix(f".{id(df)}.tmp")
+        df.to_parquet(tmp_path, index=False)
+        tmp_path.replace(target)
+    except Exception as e:
+        print(f"⚠️ Cache colonnare non creata per {xlsx_path}: {e}")
+        return None
+
+    return target
+
+
+def get_columnar_path(xlsx_path: Path) -> Optional[Path]:
+    """Restituisce la copia colonnare dell'orario se esiste, altrimenti None"""
+    target = columnar_cache_path(file_content_hash(xlsx_path))
+    return target if target.exists() else None
+
+
+def load_schedule(xlsx_path: Path) -> pd.DataFrame:
+    """
+    Carica un orario preferendo la copia colonnare, con fallback sull'xlsx.
+
+    Returns:
+        DataFrame con lo stesso contenuto (e dtype object) di `pd.read_excel`
+    """
+    columnar = get_columnar_path(xlsx_path)
+    if columnar is not None:
+        try:
+            return decode_categoricals(pd.read_parquet(columnar))
+        except Exception as e:
+            print(f"⚠️ Lettura cache colonnare fallita, uso l'xlsx: {e}")
+    return pd.read_excel(xlsx_path, header=0)
+
+
+# Colonna con l'identificativo dell'elfo nel template standard
+NAME_COLUMN = "Nome Elfo"
+
+
+@lru_cache(maxsize=32)
+def _overview(file_hash: str, xlsx_path: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    df = load_schedule(Path(xlsx_path))
+    name_column = NAME_COLUMN if NAME_COLUMN in df.columns else df.columns[0]
+    names = tuple(str(v).strip() for v in df[name_column].dropna() if str(v).strip())
+    return names, tuple(str(c) for c in df.columns)
+
+
+def schedule_overview(xlsx_path: Path) -> Tuple[List[str], List[str]]:
+    """
+    Nomi degli elfi e colonne di un orario, memoizzati per hash del contenuto.
+    Senza la colonna 'Nome Elfo' i nomi vengono letti dalla prima colonna.
+    """
+    names, columns = _overview(file_content_hash(xlsx_path), str(xlsx_path))
+    return list(names), list(columns)
+
+
+# ========================================
+# Indice di disponibilità
+# ========================================
+
+def availability_index_path(file_hash: str) -> Path:
+    """Path dell'indice di disponibilità per un dato hash di contenuto"""
+    return COLUMNAR_CACHE_DIR / f"{file_hash}.index.npz"
+
+
+def build_availability_index(xlsx_path: Path) -> Optional[Path]:
+    """
+    Crea (se non esiste già) l'indice di disponibilità di un orario.
+
+    Returns:
+        Path del file .npz, oppure None se l'orario non ha il layout 'GGG_O'
+    """
+    target = availability_index_path(file_content_hash(xlsx_path))
+    if target.exists():
+        return target
+
+    try:
+        index = AvailabilityIndex.from_dataframe(load_schedule(xlsx_path), NAME_COLUMN)
+        tmp_path = target.with_suffix(f".{id(index)}.tmp")
+        index.save(tmp_path)
+        tmp_path.replace(target)
+    except Exception as e:
+        print(f"⚠️ Indice di disponibilità non creato per {xlsx_path}: {e}")
+        return None
+
+    return target
+
+
+def get_availability_index_path(xlsx_path: Path) -> Optional[Path]:
+    """Restituisce il file .npz dell'indice se esiste, altrimenti None"""
+    target = availability_index_path(file_content_hash(xlsx_path))
+    return target if target.exists() else None
+
+
+@lru_cache(maxsize=32)
+def _index(file_hash: str, xlsx_path: str) -> Optional[AvailabilityIndex]:
+    path = availability_index_path(file_hash)
+    if path.exists():
+        try:
+            return AvailabilityIndex.load(path)
+        except Exception as e:
+            print(f"⚠️ Lettura indice di disponibilità fallita, lo ricostruisco: {e}")
+    try:
+        return AvailabilityIndex.from_dataframe(load_schedule(Path(xlsx_path)), NAME_COLUMN)
+    except ValueError:
+        return None
+
+
+def get_availability_index(xlsx_path: Path) -> Optional[AvailabilityIndex]:
+    """
+    Indice di disponibilità di un orario (memoizzato per hash del contenuto).
+    L'istanza è condivisa: per le assenze extra usare `with_absences`, che ne
+    restituisce una copia.
+
+    Returns:
+        AvailabilityIndex, oppure None se l'orario non ha il layout 'GGG_O'
+    """
+    return _index(file_content_hash(xlsx_path), str(xlsx_path))
@@ -0,0 +1,349 @@
+"""
+Registro process-wide delle sessioni Streamlit residenti in memoria.
+
+Ogni sessione tiene in `st.session_state` la chat, la Memory degli agenti e
+lo storico delle sostituzioni; Streamlit non libera nulla finché la scheda
+resta aperta. Il registro stima l'ingombro di ogni sessione e, quando il
+totale supera il budget (o una sessione resta inattiva troppo a lungo),
+scarica su disco le sessioni inattive meno recenti in forma compatta
+(pickle compresso) e rimuove le loro chiavi dallo stato. Una sessione con
+una richiesta in corso (`busy`) non viene mai scaricata. Alla interazione
+successiva la sessione viene ripristinata dal file prima che i manager la
+leggano; senza file, i manager ricaricano comunque dal backend di persistenza.
+"""
+
+import pickle
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from src.config import (
+    DATA_DIR,
+    SESSION_IDLE_SECONDS,
+    SESSION_MEMORY_BUDGET_MB,
+    SESSION_MIN_IDLE_SECONDS,
+    SESSION_OFFLOAD_RETENTION_HOURS,
+)
+from src.memory_manager import ConversationMemoryManager
+
+# Chiavi di st.session_state che fanno da cache dello stato della sessione
+# (SessionManager e ConversationMemoryManager); il resto (session_id, widget) resta
+SESSION_CACHE_KEYS = (
+    "config",
+    "messages",
+    "messages_oldest_seq",
+    ConversationMemoryManager.MEMORY_KEY,
+    ConversationMemoryManager.CONTEXT_KEY,
+)
+
+OFFLOAD_SUFFIX = ".session"
+
+
+def _snapshot(state) -> Dict[str, Any]:
+    """Chiavi di cache presenti nello stato della sessione"""
+    return {key: state[key] for key in SESSION_CACHE_KEYS if key in state}
+
+
+def _serialize(snapshot: Dict[str, Any]) -> bytes:
+    return zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), 3)
+
+
+@dataclass
+class _Resident:
+    """Sessione con lo stato in memoria"""
+    state_ref: "weakref.ref"
+    bytes: int = 0
+    last_seen: float = 0.0
+    measured: bool = False  # False se lo stato è cambiato dall'ultima stima
+    in_flight: int = 0  # richieste in corso (mai scaricata finché > 0)
+
+
+class SessionRegistry:
+    """Budget di memoria globale per lo stato delle sessioni, con offload su disco"""
+
+    def __init__(
+        self,
+        offload_dir: Path,
+        budget_bytes: int = 256 * 1024 * 1024,
+        idle_seconds: float = 900,
+        min_idle_seconds: float = 60,
+        retention_seconds: float = 24 * 3600,
+        gc_interval: float = 600,
+        evict_interval: float = 30
+    ):
+        """
+        Args:
+            offload_dir: Directory dei file delle sessioni scaricate
+            budget_bytes: Ingombro totale (stimato) delle sessioni residenti
+            idle_seconds: Inattività oltre cui una sessione viene scaricata
+                anche sotto budget (0 = solo a budget superato)
+            min_idle_seconds: Inattività minima per essere scaricata (margine
+                tra due rerun ravvicinati della stessa sessione)
+            retention_seconds: Durata dei file di sessioni mai riprese
+            gc_interval: Intervallo minimo tra due pulizie dei file
+            evict_interval: Intervallo minimo tra due passaggi di eviction
+                automatici (le sessioni vengono misurate solo lì)
+        """
+        self.offload_dir = Path(offload_dir)
+        self.budget_bytes = budget_bytes
+        self.idle_seconds = idle_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.retention_seconds = retention_seconds
+        self.gc_interval = gc_interval
+        self.evict_interval = evict_interval
+
+        self._lock = threading.RLock()
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()  # dalla meno recente
+        self._offloaded: Dict[str, int] = {}  # session_id -> byte su disco
+        self._last_gc = 0.0
+        self._last_evict = 0.0
+        self._counters = {"offloads": 0, "restores": 0, "offload_errors": 0}
+
+        self.offload_dir.mkdir(parents=True, exist_ok=True)
+        # File lasciati da un processo precedente: ripristinabili come gli altri
+        for path in self.offload_dir.glob(f"*{OFFLOAD_SUFFIX}"):
+            self._offloaded[path.stem] = path.stat().st_size
+
+    def _path(self, session_id: str) -> Path:
+        """
+        File della sessione scaricata.
+
+        Raises:
+            ValueError: Se l'ID porterebbe fuori da `offload_dir` (es. "../x")
+        """
+        path = (self.offload_dir / f"{session_id}{OFFLOAD_SUFFIX}").resolve()
+        if path.parent != self.offload_dir.resolve():
+            raise ValueError(f"ID di sessione non valido: {session_id!r}")
+        return path
+
+    # ----------------------------------------
+    # API pubblica
+    # ----------------------------------------
+    def enter(self, session_id: str, state, now: Optional[float] = None) -> bool:
+        """
+        Da chiamare all'inizio di ogni esecuzione dello script, prima dei manager:
+        ripristina la sessione se era stata scaricata, aggiorna l'ultimo accesso
+        e scarica le altre sessioni se serve.
+
+        Args:
+            session_id: ID della sessione
+            state: Stato della sessione (SafeSessionState del contesto di esecuzione)
+            now: Timestamp di riferimento (per test)
+
+        Returns:
+            True se la sessione è stata ripristinata da disco
+        """
+        now = now if now is not None else time.time()
+        restored = self._restore(session_id, state)
+
+        with self._lock:
+            resident = self._resident.pop(session_id, None)
+            if resident is None or resident.state_ref() is not state:
+                resident = _Resident(state_ref=weakref.ref(state))
+            resident.last_seen = now
+            # Il rerun può cambiare lo stato: nuova stima al prossimo passaggio di eviction
+            resident.measured = False
+            self._resident[session_id] = resident
+
+        self.evict(now=now, keep=session_id, force=False)
+        self.gc(now=now)
+        return restored
+
+    @contextmanager
+    def busy(self, session_id: str) -> Iterator[None]:
+        """
+        Segna la sessione come occupata per la durata del blocco (una richiesta
+        LLM/sandbox): una sessione con richieste in corso non viene scaricata,
+        qualunque sia la sua inattività. Le chiamate si possono annidare.
+        """
+        with self._lock:
+            resident = self._resident.get(session_id)
+            if resident is not None:
+                resident.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if resident is not None:
+                    resident.in_flight = max(0, resident.in_flight - 1)
+                    resident.last_seen = time.time()
+                    resident.measured = False
+
+    def discard(self, session_id: str) -> None:
+        """Dimentica la sessione e il suo eventuale file (es. reset configurazione)"""
+        with self._lock:
+            self._resident.pop(session_id, None)
+            if self._offloaded.pop(session_id, None) is not None:
+                self._path(session_id).unlink(missing_ok=True)
+
+    def evict(self, now: Optional[float] = None, keep: str = "", force: bool = True) -> int:
+        """
+        Scarica le sessioni inattive da più di `idle_seconds` e, finché il
+        totale supera il budget, quelle meno recenti. Le sessioni cambiate
+        dall'ultimo passaggio vengono misurate qui, non a ogni rerun.
+
+        Args:
+            now: Timestamp di riferimento (per test)
+            keep: Sessione da non scaricare (quella in esecuzione)
+            force: Ignora l'intervallo minimo tra due passaggi
+
+        Returns:
+            Numero di sessioni scaricate
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            if not force and now - self._last_evict < self.evict_interval:
+                return 0
+            self._last_evict = now
+            self._drop_dead()
+            stale = [
+                (session_id, r.state_ref()) for session_id, r in self._resident.items()
+                if not r.measured and not r.in_flight
+            ]
+
+        # Misura fuori dal lock: serializzare una sessione grande non blocca le altre
+        sizes = {session_id: self._measure(session_id, state) for session_id, state in stale if state is not None}
+
+        with self._lock:
+            for session_id, size in sizes.items():
+                resident = self._resident.get(session_id)
+                if resident is not None and size is not None:
+                    resident.bytes = size
+                    resident.measured = True
+            total = sum(r.bytes for r in self._resident.values())
+            victims = []
+            for session_id, resident in self._resident.items():
+                idle = now - resident.last_seen
+                if session_id == keep or resident.in_flight or idle < self.min_idle_seconds:
+                    continue
+                if total > self.budget_bytes or (self.idle_seconds and idle > self.idle_seconds):
+                    victims.append(session_id)
+                    total -= resident.bytes
+            return sum(1 for session_id in victims if self._offload(session_id))
+
+    def gc(self, force: bool = False, now: Optional[float] = None) -> int:
+        """Elimina i file di sessioni non più riprese entro la retention"""
+        now = now if now is not None else time.time()
+        removed = 0
+        with self._lock:
+            if not force and now - self._last_gc < self.gc_interval:
+                return 0
+            self._last_gc = now
+            for session_id in list(self._offloaded):
+                path = self._path(session_id)
+                try:
+                    if now - path.stat().st_mtime > self.retention_seconds:
+                        path.unlink()
+                        del self._offloaded[session_id]
+                        removed += 1
+                except FileNotFoundError:
+                    del self._offloaded[session_id]
+                except OSError as e:
+                    print(f"⚠️ Impossibile eliminare la sessione scaricata {session_id}: {e}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Metriche del registro (per la modalità debug)"""
+        with self._lock:
+            self._drop_dead()
+            return {
+                "resident_sessions": len(self._resident),
+                "busy_sessions": sum(1 for r in self._resident.values() if r.in_flight),
+                "resident_bytes": sum(r.bytes for r in self._resident.values()),
+                "budget_bytes": self.budget_bytes,
+                "offloaded_sessions": len(self._offloaded),
+                "offloaded_bytes": sum(self._offloaded.values()),
+                **self._counters,
+            }
+
+    # ----------------------------------------
+    # Offload / ripristino
+    # ----------------------------------------
+    def _measure(self, session_id: str, state) -> Optional[int]:
+        """Ingombro stimato: dimensione serializzata (non compressa) delle chiavi di cache"""
+        try:
+            return len(pickle.dumps(_snapshot(state), protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            print(f"⚠️ Impossibile stimare la sessione {session_id}: {e}")
+            return None
+
+    def _drop_dead(self) -> None:
+        """Rimuove le sessioni il cui stato è già stato liberato da Streamlit"""
+        for session_id in [s for s, r in self._resident.items() if r.state_ref() is None]:
+            del self._resident[session_id]
+
+    def _offload(self, session_id: str) -> bool:
+        """Salva su disco le chiavi di cache della sessione e le toglie dallo stato"""
+        resident = self._resident.get(session_id)
+        state = resident.state_ref() if resident else None
+        if resident is not None and resident.in_flight:
+            return False
+        if state is None:
+            self._resident.pop(session_id, None)
+            return False
+        try:
+            data = _serialize(_snapshot(state))
+            path = self._path(session_id)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            tmp_path.replace(path)
+        except Exception as e:
+            # Sessione non serializzabile: resta residente
+            self._counters["offload_errors"] += 1
+            print(f"⚠️ Offload della sessione {session_id} fallito: {e}")
+            return False
+
+        for key in SESSION_CACHE_KEYS:
+            if key in state:
+                del state[key]
+        del self._resident[session_id]
+        self._offloaded[session_id] = len(data)
+        self._counters["offloads"] += 1
+        return True
+
+    def _restore(self, session_id: str, state) -> bool:
+        """Rimette nello stato le chiavi scaricate (quelle già presenti hanno la precedenza)"""
+        with self._lock:
+            if session_id not in self._offloaded:
+                return False
+            path = self._path(session_id)
+            del self._offloaded[session_id]
+            try:
+                snapshot = pickle.loads(zlib.decompress(path.read_bytes()))
+            except Exception as e:
+                # Senza file i manager ricaricano dal backend di persistenza
+                print(f"⚠️ Ripristino della sessione {session_id} fallito: {e}")
+                snapshot = {}
+            path.unlink(missing_ok=True)
+            for key, value in snapshot.items():
+                if key not in state:
+                    state[key] = value
+            if snapshot:
+                self._counters["restores"] += 1
+            return bool(snapshot)
+
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry() -> SessionRegistry:
+    """Restituisce il registro process-wide, creandolo al primo utilizzo"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SessionRegistry(
+                DATA_DIR / "sessions",
+                budget_bytes=int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024),
+                idle_seconds=SESSION_IDLE_SECONDS,
+                min_idle_seconds=SESSION_MIN_IDLE_SECONDS,
+                retention_seconds=SESSION_OFFLOAD_RETENTION_HOURS * 3600,
+            )
+        return _registry
@@ -0,0 +1,151 @@
+"""
+Solvers package - Risoluzione nativa (senza LLM) dei template con regole deterministiche
+
+Quando regole e struttura della sessione coincidono con quelle di un template
+registrato qui, il Code Generator risponde direttamente con il solver nativo
+invece di generare ed eseguire codice.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.code_cache import ELF_TOKEN, rules_fingerprint
+from src.schedule_cache import get_availability_index
+from src.utils import file_content_hash
+from .standard import ExtraAbsence, SolverResult, StandardFactorySolver
+
+# Solver nativi per nome del template
+NATIVE_SOLVERS = {
+    StandardFactorySolver.template_name: StandardFactorySolver,
+}
+
+# Parole che identificano una richiesta di calcolo sostituzioni...
+REQUEST_KEYWORDS = ("sostitu", "assen", "malat", "manca", "coprir", "copert")
+# ...e quelle che richiedono di capire il testo (l'LLM resta necessario)
+AMBIGUOUS_KEYWORDS = (" non ", "torna", "rientr", "annulla", "perche", "spiega", "invece", "tranne")
+
+# Elfi citati come assenti senza ambiguità: "<elfo> è malato", "<elfo> e <elfo>
+# sono assenti", "manca <elfo>". Un elfo citato in altro modo ("chi deve
+# coprire <elfo>? <elfo> è in reparto", "<elfo> sostituisce <elfo>") richiede
+# di capire il testo: la richiesta va al Code Generator.
+_ELF_LIST = re.escape(ELF_TOKEN) + r"(?: (?:e |ed )?" + re.escape(ELF_TOKEN) + r")*"
+_ABSENT_ELVES = re.compile(
+    _ELF_LIST + r" (?:e |sono |risulta |risultano |oggi )?(?:malat|assent|manc)\w*"
+    r"|\b(?:manca|mancano|assente|assenti|assenza di|malato|malata|malati|malate)(?: (?:anche|pure|oggi))? " + _ELF_LIST
+)
+
+_instances: "OrderedDict[str, Any]" = OrderedDict()
+_instances_lock = threading.Lock()
+_MAX_INSTANCES = 16
+
+
+def find_native_solver(rules: str, structure: str) -> Optional[str]:
+    """
+    Restituisce il nome del template con solver nativo le cui regole e struttura
+    coincidono (a meno di spazi) con quelle indicate, altrimenti None.
+    """
+    from src.template_manager import TEMPLATES
+
+    fingerprint = rules_fingerprint(rules, structure)
+    for name in NATIVE_SOLVERS:
+        template = TEMPLATES.get(name)
+        if template and rules_fingerprint(template["regole"], template["struttura"]) == fingerprint:
+            return name
+    return None
+
+
+def get_native_solver(template_name: str, file_path: Path):
+    """
+    Solver del template per un orario, costruito una volta per contenuto del file.
+
+    Raises:
+        ValueError: Se l'orario non ha il layout richiesto dal solver
+    """
+    key = f"{template_name}:{file_content_hash(file_path)}"
+    with _instances_lock:
+        solver = _instances.get(key)
+        if solver is not None:
+            _instances.move_to_end(key)
+            return solver
+
+    index = get_availability_index(file_path)
+    if index is None:
+        raise ValueError("Orario senza colonne turno nel formato 'GGG_O'")
+    solver = NATIVE_SOLVERS[template_name](index)
+    with _instances_lock:
+        _instances[key] = solver
+        while len(_instances) > _MAX_INSTANCES:
+            _instances.popitem(last=False)
+    return solver
+
+
+def is_supported_request(normalized_request: str) -> bool:
+    """
+    True se la richiesta (normalizzata) è un calcolo sostituzioni senza
+    sfumature: parole chiave del calcolo, nessuna parola che richieda di
+    capire il testo e ogni elfo citato dichiarato assente (il solver nativo
+    tratta gli elfi citati come assenze aggiuntive).
+    """
+    text = f" {normalized_request} "
+    if not any(k in text for k in REQUEST_KEYWORDS) or any(k in text for k in AMBIGUOUS_KEYWORDS):
+        return False
+    cited = text.count(ELF_TOKEN)
+    absent = sum(match.group(0).count(ELF_TOKEN) for match in _ABSENT_ELVES.finditer(text))
+    return absent == cited
+
+
+def extra_absences_from_params(solver, params: Dict[str, Any]) -> List[ExtraAbsence]:
+    """
+    Assenze aggiuntive degli elfi citati nella richiesta: abbinati per
+    posizione ai giorni/ore se i conteggi coincidono, altrimenti assenti in
+    tutti i giorni/ore citati (senza giorni tutta la settimana, senza ore
+    tutte le ore assegnate).
+    """
+    elves: List[str] = params.get("elfi") or []
+    days: List[str] = params.get("giorni") or []
+    hours: List[int] = params.get("ore") or []
+
+    extras: List[ExtraAbsence] = []
+    for i, elf in enumerate(elves):
+        elf_days = [days[i]] if len(days) == len(elves) else (days or solver.days)
+        elf_hours = [hours[i]] if len(hours) == len(elves) else (hours or [None])
+        for day in elf_days:
+            for hour in elf_hours:
+                extras.append(ExtraAbsence(elfo=elf, giorno=day, ora=hour))
+    return extras
+
+
+def solve_from_params(solver, params: Dict[str, Any]) -> SolverResult:
+    """
+    Traduce i parametri estratti dalla richiesta nella chiamata al solver.
+
+    - Elfi citati: assenti nei giorni/ore citati (`extra_absences_from_params`);
+      vale solo per richieste accettate da `is_supported_request`.
+    - Giorni e ore citati: limitano le assenze da coprire, comprese quelle
+      già segnate nel file.
+    """
+    days: List[str] = params.get("giorni") or []
+    hours: List[int] = params.get("ore") or []
+
+    return solver.solve(
+        extra_absences=extra_absences_from_params(solver, params),
+        days=days or None,
+        hours=hours or None,
+        history=params.get("sostituzioni_precedenti") or []
+    )
+
+
+__all__ = [
+    "ExtraAbsence",
+    "SolverResult",
+    "StandardFactorySolver",
+    "NATIVE_SOLVERS",
+    "extra_absences_from_params",
+    "find_native_solver",
+    "get_native_solver",
+    "is_supported_request",
+    "solve_from_params",
+]
@@ -0,0 +1,220 @@
+"""
+Solver nativo per il template "Fabbrica Giocattoli Standard".
+
+Le tre regole del template sono deterministiche, quindi non serve generare
+codice: il solver lavora sull'indice di disponibilità dell'orario
+(`src/availability_index.py`, griglia NumPy elfi × giorni × ore con le
+maschere Jolly, Pausa pizza e co-assegnazione per reparto già calcolate).
+Restano sequenziali solo le scelte, perché ogni sostituto assegnato non è
+più disponibile nella stessa ora.
+"""
+
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.availability_index import ABS, JOLLY, AvailabilityIndex
+from src.models import Sostituzione
+from src.schedule_cache import NAME_COLUMN
+
+HAT_COLUMN = "Cappello"
+
+RULE_ASSISTANT = "Assistente assegnato a stesso reparto"
+RULE_JOLLY = "Ora Jolly"
+RULE_PIZZA = "Ora Pausa pizza"
+NO_RULE = "Nessuna regola applicabile"
+NO_SUBSTITUTE = "Nessun sostituto disponibile"
+
+DAY_NAMES = {
+    "LUN": "Lunedì", "MAR": "Martedì", "MER": "Mercoledì", "GIO": "Giovedì",
+    "VEN": "Venerdì", "SAB": "Sabato", "DOM": "Domenica",
+}
+
+
+def day_code(value: Any) -> str:
+    """'Martedì', 'martedi', 'MAR' -> 'MAR'"""
+    text = "".join(
+        c for c in unicodedata.normalize("NFKD", str(value))
+        if not unicodedata.combining(c)
+    )
+    return text.strip()[:3].upper()
+
+
+@dataclass
+class ExtraAbsence:
+    """Assenza non segnata nel file (es. comunicata in chat)"""
+    elfo: str
+    giorno: str
+    ora: Optional[int] = None  # None = tutte le ore assegnate del giorno
+
+
+@dataclass
+class SolverResult:
+    """Sostituzioni calcolate e assenze rimaste scoperte"""
+    substitutions: List[Sostituzione] = field(default_factory=list)
+    uncovered: int = 0
+
+
+class StandardFactorySolver:
+    """Applica le regole del template standard su un orario in formato largo"""
+
+    template_name = "Fabbrica Giocattoli Standard"
+
+    def __init__(self, index: AvailabilityIndex):
+        """
+        Args:
+            index: Indice di disponibilità dell'orario (`src/availability_index.py`)
+
+        Raises:
+            ValueError: Se l'orario non ha la colonna 'Cappello' richiesta dalle regole
+        """
+        if not any(index.hats):
+            raise ValueError(f"Colonna '{HAT_COLUMN}' obbligatoria per il template standard")
+        self.index = index
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "StandardFactorySolver":
+        return cls(AvailabilityIndex.from_dataframe(df, NAME_COLUMN, HAT_COLUMN))
+
+    @property
+    def days(self) -> List[str]:
+        return self.index.days
+
+    def with_absences(self, extras: Sequence[ExtraAbsence]) -> "StandardFactorySolver":
+        """Copia del solver con le assenze extra applicate come se fossero segnate nel file"""
+        return StandardFactorySolver(self.index.with_absences([
+            {"elfo": x.elfo, "giorno": day_code(x.giorno), "ora": x.ora} for x in extras
+        ]))
+
+    # ----------------------------------------
+    # Risoluzione
+    # ----------------------------------------
+    def solve(
+        self,
+        extra_absences: Sequence[ExtraAbsence] = (),
+        days: Optional[Sequence[str]] = None,
+        hours: Optional[Sequence[int]] = None,
+        history: Sequence[Dict[str, Any]] = ()
+    ) -> SolverResult:
+        """
+        Calcola le sostituzioni applicando le regole in ordine di priorità.
+
+        Args:
+            extra_absences: Assenze non presenti nel file
+            days: Giorni da considerare (codici 'LUN', ... o nomi); None = tutti
+            hours: Ore da considerare; None = tutte
+            history: Sostituzioni già calcolate (dizionari con giorno, ora,
+                assente, sostituto): i sostituti non vengono riusati nella
+                stessa ora e le assenze già coperte non vengono ricalcolate
+
+        Returns:
+            SolverResult con le sostituzioni validate
+        """
+        if extra_absences:
+            return self.with_absences(extra_absences).solve(days=days, hours=hours, history=history)
+
+        idx = self.index
+        used = np.zeros(idx.state.shape, dtype=bool)
+        covered: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        for record in history:
+            d = idx._day.get(day_code(record.get("giorno", "")))
+            try:
+                h = int(record.get("ora"))
+            except (TypeError, ValueError):
+                continue
+            if d is None or not 0 < h <= idx.max_hour:
+                continue
+            s = idx._elf.get(str(record.get("sostituto", "")).strip())
+            if s is not None:
+                used[s, d, h] = True
+            covered[(str(record.get("assente", "")).strip(), d, h)] = record
+
+        day_filter = np.zeros(len(idx.days), dtype=bool)
+        for day in (days or idx.days):
+            if day_code(day) in idx._day:
+                day_filter[idx._day[day_code(day)]] = True
+        hour_filter = np.zeros(idx.max_hour + 2, dtype=bool)
+        if hours:
+            hour_filter[[h for h in hours if 0 < h <= idx.max_hour]] = True
+        else:
+            hour_filter[1:idx.max_hour + 1] = True
+
+        targets = (idx.state == ABS) & day_filter[None, :, None] & hour_filter[None, None, :]
+        # Ordine: giorno, ora, riga del file
+        order = sorted(zip(*np.nonzero(targets)), key=lambda t: (t[1], t[2], t[0]))
+
+        jolly = idx.state == JOLLY
+        result = SolverResult()
+        for e, d, h in order:
+            name = idx.names[e]
+            previous = covered.get((name, d, h))
+            if previous is not None:
+                result.substitutions.append(self._from_history(previous, e, d, h))
+                continue
+
+            k = int(idx.department[e, d, h])
+            department = idx.departments[k]
+            free = ~used[:, d, h]
+            free[e] = False
+
+            choice, rule = None, NO_RULE
+            if idx.hats[e].lower() == "rosso":
+                same = idx.green & idx.coassigned[k, d, h] & free
+                if same.any():
+                    choice, rule = int(np.argmax(same)), RULE_ASSISTANT
+            if choice is None and (jolly[:, d, h] & free).any():
+                choice, rule = int(np.argmax(jolly[:, d, h] & free)), RULE_JOLLY
+            if choice is None and (idx.pizza[:, d, h] & free).any():
+                choice, rule = int(np.argmax(idx.pizza[:, d, h] & free)), RULE_PIZZA
+
+            if choice is None:
+                result.uncovered += 1
+            else:
+                used[choice, d, h] = True
+            result.substitutions.append(self._build(e, d, h, department, choice, rule))
+
+        return result
+
+    def _build(self, e: int, d: int, h: int, department: str, choice: Optional[int], rule: str) -> Sostituzione:
+        idx = self.index
+        substitute = idx.names[choice] if choice is not None else NO_SUBSTITUTE
+        if rule == RULE_ASSISTANT:
+            reason = (
+                f"{substitute} (Cappello Verde) era già assegnato a '{department}' nella {h}^ ora: "
+                "prende la responsabilità del reparto."
+            )
+        elif rule == RULE_JOLLY:
+            reason = f"{substitute} aveva 'Jolly' nella {h}^ ora, quindi era disponibile senza conflitti."
+        elif rule == RULE_PIZZA:
+            reason = (
+                f"{substitute} era in pausa pizza nella {h}^ ora (ore adiacenti assegnate), "
+                "nessun candidato con priorità superiore."
+            )
+        else:
+            reason = f"Nessun elfo disponibile con le regole attive nella {h}^ ora di {DAY_NAMES.get(idx.days[d], idx.days[d])}."
+        return Sostituzione(
+            giorno=DAY_NAMES.get(idx.days[d], idx.days[d]),
+            ora=h,
+            reparto=department,
+            assente=idx.names[e],
+            cappello_assente=idx.hats[e] or None,
+            sostituto=substitute,
+            regola_applicata=rule,
+            ragionamento=reason
+        )
+
+    def _from_history(self, record: Dict[str, Any], e: int, d: int, h: int) -> Sostituzione:
+        idx = self.index
+        return Sostituzione(
+            giorno=DAY_NAMES.get(idx.days[d], idx.days[d]),
+            ora=h,
+            reparto=str(record.get("reparto") or idx.department_of(idx.names[e], idx.days[d], h)),
+            assente=idx.names[e],
+            cappello_assente=idx.hats[e] or None,
+            sostituto=str(record.get("sostituto")),
+            regola_applicata=str(record.get("regola_applicata") or "Sostituzione precedente"),
+            ragionamento="Sostituzione già calcolata in precedenza, confermata."
+        )
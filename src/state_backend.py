@@ -0,0 +1,436 @@
+"""
+Persistenza dello stato delle sessioni (configurazione, chat, memoria, sostituzioni).
+
+`st.session_state` resta la cache della singola sessione del browser; lo
+stato vero vive in un backend intercambiabile:
+- "memory": dizionari nel processo (sopravvive ai reload, non ai riavvii)
+- "sqlite": file SQLite in modalità WAL, condivisibile tra più repliche
+
+Le scritture SQLite vengono accodate e scritte in batch (una transazione per
+flush, eseguito periodicamente da un thread e prima di ogni lettura).
+"""
+
+import atexit
+import json
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.solvers.standard import day_code
+from src.config import STATE_BACKEND, STATE_DB_PATH, STATE_FLUSH_BATCH, STATE_FLUSH_INTERVAL, STATE_FLUSH_RETRIES
+
+# (seq, messaggio) / (seq, ruolo, testo) / (id, sostituzione)
+StoredMessage = Tuple[int, Dict[str, Any]]
+StoredTurn = Tuple[int, str, str]
+StoredSubstitution = Tuple[int, Dict[str, Any]]
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class StateBackend(ABC):
+    """Interfaccia dei backend di persistenza (tutti i metodi per session_id)"""
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """{"config": ..., "context": ...} della sessione, None se sconosciuta"""
+
+    @abstractmethod
+    def save_config(self, session_id: str, config: Optional[Dict[str, Any]]) -> None:
+        """Configurazione della sessione (None = sessione da riconfigurare)"""
+
+    @abstractmethod
+    def save_context(self, session_id: str, context: Dict[str, Any]) -> None:
+        """Context applicativo serializzabile (ultima richiesta, stato del riassunto, ...)"""
+
+    @abstractmethod
+    def append_message(self, session_id: str, message: Dict[str, Any]) -> None:
+        """Aggiunge un messaggio della chat"""
+
+    @abstractmethod
+    def load_messages(self, session_id: str, limit: Optional[int] = None, before: Optional[int] = None) -> List[StoredMessage]:
+        """Ultimi `limit` messaggi (prima di `before` se indicato), in ordine cronologico"""
+
+    @abstractmethod
+    def append_turn(self, session_id: str, seq: int, role: str, content: str) -> None:
+        """Aggiunge (o sostituisce) un turno della memoria conversazionale"""
+
+    @abstractmethod
+    def load_turns(self, session_id: str, from_seq: int = 0) -> List[StoredTurn]:
+        """Turni della memoria conversazionale con seq >= from_seq"""
+
+    @abstractmethod
+    def save_substitutions(
+        self,
+        session_id: str,
+        entries: List[StoredSubstitution],
+        deactivated: Optional[List[int]] = None
+    ) -> None:
+        """Salva nuove sostituzioni attive e disattiva quelle superate"""
+
+    @abstractmethod
+    def load_substitutions(
+        self,
+        session_id: str,
+        giorno: Optional[str] = None,
+        ora: Optional[int] = None
+    ) -> List[StoredSubstitution]:
+        """Sostituzioni attive della sessione (eventualmente di un giorno/ora), in ordine di id"""
+
+    @abstractmethod
+    def clear_session(self, session_id: str) -> None:
+        """Elimina tutto lo stato della sessione"""
+
+    def flush(self) -> None:
+        """Scrive le modifiche in coda (no-op per i backend sincroni)"""
+
+
+class InMemoryStateBackend(StateBackend):
+    """Backend nel processo: nessun file, lo stato si perde al riavvio"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    def _session(self, session_id: str) -> Dict[str, Any]:
+        return self._sessions.setdefault(session_id, {
+            "config": None, "context": {}, "messages": [], "turns": {}, "substitutions": {}
+        })
+
+    def load_session(self, session_id):
+        with self._lock:
+            data = self._sessions.get(session_id)
+            return None if data is None else {"config": data["config"], "context": dict(data["context"])}
+
+    def save_config(self, session_id, config):
+        with self._lock:
+            self._session(session_id)["config"] = config
+
+    def save_context(self, session_id, context):
+        with self._lock:
+            self._session(session_id)["context"] = json.loads(_dumps(context))
+
+    def append_message(self, session_id, message):
+        with self._lock:
+            self._session(session_id)["messages"].append(dict(message))
+
+    def load_messages(self, session_id, limit=None, before=None):
+        with self._lock:
+            messages = list(enumerate(self._session(session_id)["messages"], 1))
+        if before is not None:
+            messages = [m for m in messages if m[0] < before]
+        return messages[-limit:] if limit else messages
+
+    def append_turn(self, session_id, seq, role, content):
+        with self._lock:
+            self._session(session_id)["turns"][seq] = (role, content)
+
+    def load_turns(self, session_id, from_seq=0):
+        with self._lock:
+            turns = self._session(session_id)["turns"]
+            return [(seq, *turns[seq]) for seq in sorted(turns) if seq >= from_seq]
+
+    def save_substitutions(self, session_id, entries, deactivated=None):
+        with self._lock:
+            store = self._session(session_id)["substitutions"]
+            for entry_id in deactivated or []:
+                store.pop(entry_id, None)
+            for entry_id, record in entries:
+                store[entry_id] = dict(record)
+
+    def load_substitutions(self, session_id, giorno=None, ora=None):
+        with self._lock:
+            store = self._session(session_id)["substitutions"]
+            return [
+                (i, dict(store[i])) for i in sorted(store)
+                if (giorno is None or day_code(store[i].get("giorno")) == day_code(giorno))
+                and (ora is None or str(store[i].get("ora")) == str(ora))
+            ]
+
+    def clear_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    config TEXT,
+    context TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq);
+CREATE TABLE IF NOT EXISTS memory_turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS substitutions (
+    session_id TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    giorno TEXT,  -- codice giorno ('LUN', 'MAR', ...)
+    ora INTEGER,
+    assente TEXT,
+    sostituto TEXT,
+    record TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (session_id, entry_id)
+);
+CREATE INDEX IF NOT EXISTS idx_substitutions_slot ON substitutions (session_id, giorno, ora);
+CREATE INDEX IF NOT EXISTS idx_substitutions_active ON substitutions (session_id, active);
+"""
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Backend SQLite (WAL) con scritture in batch.
+
+    Le scritture finiscono in una coda e vengono applicate in un'unica
+    transazione dal thread di flush (ogni `flush_interval` secondi o quando
+    la coda supera `flush_batch`); ogni lettura esegue prima un flush, così
+    una sessione legge sempre le proprie scritture.
+
+    Un batch che fallisce torna in coda; dopo `max_retries` tentativi le
+    scritture vengono applicate una per una e quelle che falliscono ancora
+    vengono scartate, così una scrittura non valida non blocca le altre.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        flush_interval: float = 0.5,
+        flush_batch: int = 200,
+        max_retries: int = 3
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self.max_retries = max(1, max_retries)
+        self._failures = 0
+
+        self._local = threading.local()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_lock = threading.Lock()
+        # Serializza i flush: l'ordine delle scritture resta quello di accodamento
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+        threading.Thread(target=self._flush_loop, name="state-flush", daemon=True).start()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # ----------------------------------------
+    # Coda di scrittura
+    # ----------------------------------------
+
+    def _enqueue(self, sql: str, args: tuple) -> None:
+        with self._pending_lock:
+            self._pending.append((sql, args))
+            full = len(self._pending) >= self.flush_batch
+        if full:
+            self._wake.set()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Scrittura stato su SQLite fallita: {e}")
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except Exception:
+                # Database occupato (es. "database is locked"): il batch non è
+                # in errore, torna in coda senza contare come tentativo fallito
+                self._requeue(batch)
+                raise
+            try:
+                for sql, args in batch:
+                    conn.execute(sql, args)
+                conn.execute("COMMIT")
+                self._failures = 0
+            except Exception as e:
+                self._requeue(batch)
+                self._rollback(conn)
+                self._failures += 1
+                if self._failures < self.max_retries:
+                    raise
+                self._failures = 0
+                with self._pending_lock:
+                    del self._pending[:len(batch)]
+                self._apply_each(conn, batch, e)
+
+    def _requeue(self, batch: List[Tuple[str, tuple]]) -> None:
+        """Rimette le scritture in testa alla coda per il prossimo tentativo"""
+        with self._pending_lock:
+            self._pending = batch + self._pending
+
+    @staticmethod
+    def _rollback(conn: sqlite3.Connection) -> None:
+        """Annulla la transazione aperta, senza nascondere l'errore originale"""
+        if not conn.in_transaction:
+            return
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            print(f"⚠️ Rollback dello stato su SQLite fallito: {e}")
+
+    def _apply_each(self, conn: sqlite3.Connection, batch: List[Tuple[str, tuple]], error: Exception) -> None:
+        """Ultimo tentativo: una scrittura per volta, scartando quelle che falliscono (chiamare col lock di flush)"""
+        print(f"⚠️ Batch di {len(batch)} scritture fallito {self.max_retries} volte ({error}), lo applico una scrittura per volta")
+        for sql, args in batch:
+            try:
+                conn.execute(sql, args)
+            except Exception as e:
+                print(f"⚠️ Scrittura stato scartata: {e} ({sql.split(' (')[0][:60]})")
+
+    def _query(self, sql: str, args: tuple = ()) -> List[tuple]:
+        try:
+            self.flush()
+        except Exception as e:
+            # La lettura procede: le scritture in coda verranno ritentate
+            print(f"⚠️ Scrittura stato su SQLite fallita prima della lettura: {e}")
+        return self._connection().execute(sql, args).fetchall()
+
+    def _touch(self, session_id: str) -> None:
+        self._enqueue(
+            "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, time.time())
+        )
+
+    # ----------------------------------------
+    # API
+    # ----------------------------------------
+
+    def load_session(self, session_id):
+        rows = self._query("SELECT config, context FROM sessions WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        config, context = rows[0]
+        return {
+            "config": json.loads(config) if config else None,
+            "context": json.loads(context) if context else {},
+        }
+
+    def save_config(self, session_id, config):
+        self._touch(session_id)
+        self._enqueue("UPDATE sessions SET config = ? WHERE session_id = ?", (_dumps(config) if config else None, session_id))
+
+    def save_context(self, session_id, context):
+        self._touch(session_id)
+        self._enqueue("UPDATE sessions SET context = ? WHERE session_id = ?", (_dumps(context), session_id))
+
+    def append_message(self, session_id, message):
+        self._touch(session_id)
+        self._enqueue("INSERT INTO messages (session_id, message) VALUES (?, ?)", (session_id, _dumps(message)))
+
+    def load_messages(self, session_id, limit=None, before=None):
+        sql = "SELECT seq, message FROM messages WHERE session_id = ?"
+        args: List[Any] = [session_id]
+        if before is not None:
+            sql += " AND seq < ?"
+            args.append(before)
+        sql += " ORDER BY seq DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        rows = self._query(sql, tuple(args))
+        return [(seq, json.loads(message)) for seq, message in reversed(rows)]
+
+    def append_turn(self, session_id, seq, role, content):
+        self._enqueue(
+            "INSERT OR REPLACE INTO memory_turns (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+            (session_id, seq, role, content)
+        )
+
+    def load_turns(self, session_id, from_seq=0):
+        return self._query(
+            "SELECT seq, role, content FROM memory_turns WHERE session_id = ? AND seq >= ? ORDER BY seq",
+            (session_id, from_seq)
+        )
+
+    def save_substitutions(self, session_id, entries, deactivated=None):
+        for entry_id in deactivated or []:
+            self._enqueue(
+                "UPDATE substitutions SET active = 0 WHERE session_id = ? AND entry_id = ?",
+                (session_id, entry_id)
+            )
+        for entry_id, record in entries:
+            self._enqueue(
+                "INSERT OR REPLACE INTO substitutions "
+                "(session_id, entry_id, giorno, ora, assente, sostituto, record, active) VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                (session_id, entry_id, day_code(record.get("giorno", "")), record.get("ora"),
+                 str(record.get("assente")), str(record.get("sostituto")), _dumps(record))
+            )
+
+    def load_substitutions(self, session_id, giorno=None, ora=None):
+        sql = "SELECT entry_id, record FROM substitutions WHERE session_id = ? AND active = 1"
+        args: List[Any] = [session_id]
+        if giorno is not None:
+            sql += " AND giorno = ?"
+            args.append(day_code(giorno))
+        if ora is not None:
+            sql += " AND ora = ?"
+            args.append(int(ora))
+        rows = self._query(sql + " ORDER BY entry_id", tuple(args))
+        return [(entry_id, json.loads(record)) for entry_id, record in rows]
+
+    def clear_session(self, session_id):
+        for table in ("messages", "memory_turns", "substitutions", "sessions"):
+            self._enqueue(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    """Restituisce il backend di stato process-wide (STATE_BACKEND), creandolo al primo utilizzo"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STATE_BACKEND == "sqlite":
+                _backend = SQLiteStateBackend(
+                    STATE_DB_PATH,
+                    flush_interval=STATE_FLUSH_INTERVAL,
+                    flush_batch=STATE_FLUSH_BATCH,
+                    max_retries=STATE_FLUSH_RETRIES
+                )
+                # Le scritture ancora in coda non vanno perse all'uscita
+                atexit.register(_backend.flush)
+            else:
+                _backend = InMemoryStateBackend()
+        return _backend
@@ -0,0 +1,307 @@
+"""
+Storico strutturato delle sostituzioni della sessione.
+
+Le sostituzioni sono indicizzate per (giorno, ora), (sostituto, giorno, ora)
+e (assente, giorno, ora): verificare se un sostituto è già occupato o se
+un'assenza è già coperta costa una lookup. Un nuovo calcolo per la stessa
+assenza sostituisce (supersede) quello vecchio, le ripetizioni identiche
+vengono scartate e i conflitti (stesso sostituto su due assenze nella
+stessa ora) vengono segnalati.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from src.models import Sostituzione
+from src.solvers.standard import day_code
+
+Slot = Tuple[str, int]  # (codice giorno, ora)
+
+
+def _name(value: Any) -> str:
+    return str(value or "").strip()
+
+
+def is_uncovered(record: Dict[str, Any]) -> bool:
+    """True se la sostituzione non ha un sostituto (es. 'Nessun sostituto disponibile')"""
+    value = _name(record.get("sostituto")).lower()
+    return not value or value.startswith("nessun") or value in ("n/a", "-")
+
+
+def slot_of(record: Dict[str, Any]) -> Optional[Slot]:
+    """(giorno, ora) normalizzati di una sostituzione; None se non leggibili"""
+    try:
+        return day_code(record.get("giorno", "")), int(record.get("ora"))
+    except (TypeError, ValueError):
+        return None
+
+
+def summary_line(entry_id: int, record: Dict[str, Any]) -> str:
+    """Riga del riepilogo per gli agenti"""
+    line = (
+        f"{entry_id}. {record.get('assente')} ({record.get('reparto')}, {record.get('giorno')} ora {record.get('ora')}) "
+        f"→ {record.get('sostituto')} [{record.get('regola_applicata')}]"
+    )
+    if record.get("reasoning"):
+        line += f"\n   Reasoning: {record['reasoning']}"
+    return line
+
+
+def slot_key(slot: Slot) -> str:
+    """Chiave JSON di uno slot, es. 'MAR-4'"""
+    return f"{slot[0]}-{slot[1]}"
+
+
+@dataclass
+class Conflict:
+    """Sostituto già impegnato in un'altra assenza nella stessa ora"""
+    sostituto: str
+    giorno: str
+    ora: int
+    assenti: List[str]
+
+    def __str__(self) -> str:
+        return f"{self.sostituto} copre più assenze {self.giorno} ora {self.ora}: {', '.join(self.assenti)}"
+
+
+@dataclass
+class UpsertReport:
+    """Esito dell'inserimento di un blocco di sostituzioni"""
+    ids: List[int] = field(default_factory=list)  # id delle voci del blocco (nuove o già presenti)
+    added_ids: List[int] = field(default_factory=list)
+    superseded_ids: List[int] = field(default_factory=list)
+    added: int = 0
+    duplicates: int = 0
+    superseded: int = 0
+    conflicts: List[Conflict] = field(default_factory=list)
+
+
+class SubstitutionStore:
+    """
+    Storico in memoria delle sostituzioni attive, con indici per slot.
+
+    Le voci superate restano consultabili in `superseded` ma non
+    partecipano più a indici, riepiloghi e conflitti.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 1
+        self.superseded: List[Dict[str, Any]] = []
+        # Righe del riepilogo, calcolate una volta all'inserimento
+        self._lines: Dict[int, str] = {}
+        # Indici
+        self._by_slot: Dict[Slot, Set[int]] = {}
+        self._by_elf: Dict[str, Set[int]] = {}  # elfo come assente o sostituto
+        self._by_absent: Dict[Tuple[str, str, int], int] = {}
+        self._by_substitute: Dict[Tuple[str, str, int], Set[int]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "SubstitutionStore":
+        """Costruisce lo store da una lista di dizionari (es. storico passato agli agenti)"""
+        store = cls()
+        store.upsert_many(records)
+        return store
+
+    @classmethod
+    def restore(cls, items: Iterable[Tuple[int, Dict[str, Any]]]) -> "SubstitutionStore":
+        """Ricostruisce lo store da voci attive salvate, mantenendo gli id"""
+        store = cls()
+        for entry_id, record in items:
+            slot = slot_of(record)
+            if slot is None:
+                continue
+            store._entries[entry_id] = dict(record)
+            store._index(entry_id, store._entries[entry_id], slot)
+            store._next_id = max(store._next_id, entry_id + 1)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ----------------------------------------
+    # Scrittura
+    # ----------------------------------------
+
+    def _index(self, entry_id: int, record: Dict[str, Any], slot: Slot) -> None:
+        day, hour = slot
+        self._by_slot.setdefault(slot, set()).add(entry_id)
+        self._by_absent[(_name(record.get("assente")), day, hour)] = entry_id
+        self._by_elf.setdefault(_name(record.get("assente")), set()).add(entry_id)
+        if not is_uncovered(record):
+            self._by_substitute.setdefault((_name(record.get("sostituto")), day, hour), set()).add(entry_id)
+            self._by_elf.setdefault(_name(record.get("sostituto")), set()).add(entry_id)
+        self._lines[entry_id] = summary_line(entry_id, record)
+
+    def _unindex(self, entry_id: int, record: Dict[str, Any], slot: Slot) -> None:
+        day, hour = slot
+        self._by_slot.get(slot, set()).discard(entry_id)
+        self._by_absent.pop((_name(record.get("assente")), day, hour), None)
+        self._by_substitute.get((_name(record.get("sostituto")), day, hour), set()).discard(entry_id)
+        for name in (_name(record.get("assente")), _name(record.get("sostituto"))):
+            self._by_elf.get(name, set()).discard(entry_id)
+        self._lines.pop(entry_id, None)
+
+    def upsert(self, substitution: Union[Sostituzione, Dict[str, Any]], report: Optional[UpsertReport] = None) -> UpsertReport:
+        """
+        Inserisce una sostituzione.
+
+        - stessa assenza e stesso sostituto nello stesso slot: duplicato, ignorato
+        - stessa assenza con sostituto diverso: la voce vecchia viene superata
+        - sostituto già impegnato su un'altra assenza nello slot: inserita, con conflitto
+
+        Returns:
+            Report aggiornato (quello passato o uno nuovo)
+        """
+        report = report or UpsertReport()
+        record = substitution.model_dump() if isinstance(substitution, Sostituzione) else dict(substitution)
+        slot = slot_of(record)
+        if slot is None:
+            print(f"⚠️ Sostituzione senza giorno/ora validi ignorata: {record}")
+            return report
+        day, hour = slot
+
+        previous_id = self._by_absent.get((_name(record.get("assente")), day, hour))
+        if previous_id is not None:
+            previous = self._entries[previous_id]
+            if _name(previous.get("sostituto")) == _name(record.get("sostituto")):
+                report.duplicates += 1
+                report.ids.append(previous_id)
+                return report
+            self._unindex(previous_id, previous, slot)
+            self.superseded.append(self._entries.pop(previous_id))
+            report.superseded += 1
+            report.superseded_ids.append(previous_id)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = record
+        self._index(entry_id, record, slot)
+        report.added += 1
+        report.ids.append(entry_id)
+        report.added_ids.append(entry_id)
+
+        if not is_uncovered(record):
+            busy = self._by_substitute[(_name(record.get("sostituto")), day, hour)]
+            if len(busy) > 1:
+                report.conflicts.append(Conflict(
+                    sostituto=_name(record.get("sostituto")),
+                    giorno=str(record.get("giorno")),
+                    ora=hour,
+                    assenti=[_name(self._entries[i].get("assente")) for i in sorted(busy)]
+                ))
+        return report
+
+    def upsert_many(self, substitutions: Iterable[Union[Sostituzione, Dict[str, Any]]]) -> UpsertReport:
+        """Inserisce un blocco di sostituzioni (es. il risultato di un calcolo)"""
+        report = UpsertReport()
+        for s in substitutions:
+            self.upsert(s, report)
+        return report
+
+    def clear(self) -> None:
+        self.__init__()
+
+    # ----------------------------------------
+    # Lettura
+    # ----------------------------------------
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Sostituzioni attive in ordine di inserimento"""
+        return list(self._entries.values())
+
+    def items(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """(id, sostituzione) attive in ordine di inserimento"""
+        return list(self._entries.items())
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        return self._entries.get(entry_id)
+
+    def names(self) -> List[str]:
+        """Elfi presenti nello storico (assenti e sostituti)"""
+        return [name for name, ids in self._by_elf.items() if ids]
+
+    def select(
+        self,
+        elfi: Iterable[str] = (),
+        giorni: Iterable[str] = (),
+        ore: Iterable[int] = ()
+    ) -> List[int]:
+        """
+        Id delle sostituzioni pertinenti, in ordine di inserimento: quelle
+        negli slot con i giorni e le ore citati più quelle che coinvolgono gli
+        elfi citati (come assenti o sostituti, in qualunque slot). Senza
+        nessun riferimento tutte; con riferimenti ma senza corrispondenze
+        nessuna.
+        """
+        days = {day_code(d) for d in giorni}
+        hours = {int(h) for h in ore}
+        names = [_name(e) for e in elfi]
+        if not (days or hours or names):
+            return list(self._entries)
+
+        selected: Set[int] = set()
+        if days or hours:
+            for (day, hour), ids in self._by_slot.items():
+                if (not days or day in days) and (not hours or hour in hours):
+                    selected |= ids
+        for name in names:
+            selected |= self._by_elf.get(name, set())
+        return [i for i in self._entries if i in selected]
+
+    def summary_lines(self, ids: Iterable[int]) -> List[str]:
+        """Righe del riepilogo (già pronte) per gli id indicati"""
+        return [self._lines[i] for i in ids if i in self._lines]
+
+    def is_busy(self, sostituto: str, giorno: str, ora: int) -> bool:
+        """True se l'elfo è già sostituto in quello slot"""
+        return bool(self._by_substitute.get((_name(sostituto), day_code(giorno), int(ora))))
+
+    def covering(self, assente: str, giorno: str, ora: int) -> Optional[Dict[str, Any]]:
+        """Sostituzione attiva per quell'assenza, se già calcolata"""
+        entry_id = self._by_absent.get((_name(assente), day_code(giorno), int(ora)))
+        return self._entries.get(entry_id) if entry_id is not None else None
+
+    def in_slot(self, giorno: str, ora: int) -> List[Dict[str, Any]]:
+        """Sostituzioni attive in quello slot"""
+        ids = self._by_slot.get((day_code(giorno), int(ora)), set())
+        return [self._entries[i] for i in sorted(ids)]
+
+    def busy_substitutes(self, giorno: str, ora: int) -> List[str]:
+        """Sostituti già impegnati in quello slot"""
+        return sorted({
+            _name(r.get("sostituto")) for r in self.in_slot(giorno, ora) if not is_uncovered(r)
+        })
+
+    def conflicts(self) -> List[Conflict]:
+        """Tutti i sostituti impegnati su più assenze nella stessa ora"""
+        result = []
+        for (name, day, hour), ids in self._by_substitute.items():
+            if len(ids) > 1:
+                first = self._entries[min(ids)]
+                result.append(Conflict(
+                    sostituto=name,
+                    giorno=str(first.get("giorno")),
+                    ora=hour,
+                    assenti=[_name(self._entries[i].get("assente")) for i in sorted(ids)]
+                ))
+        return result
+
+    def executor_params(self) -> Dict[str, Any]:
+        """
+        Indici serializzabili per il codice generato (chiavi 'GGG-O', es. 'MAR-4'):
+        sostituti_occupati -> nomi dei sostituti già impegnati nello slot,
+        assenze_coperte -> {assente: sostituto} già calcolati nello slot.
+        """
+        busy: Dict[str, List[str]] = {}
+        covered: Dict[str, Dict[str, str]] = {}
+        for slot, ids in self._by_slot.items():
+            if not ids:
+                continue
+            records = [self._entries[i] for i in sorted(ids)]
+            names = sorted({_name(r.get("sostituto")) for r in records if not is_uncovered(r)})
+            if names:
+                busy[slot_key(slot)] = names
+            covered[slot_key(slot)] = {_name(r.get("assente")): _name(r.get("sostituto")) for r in records}
+        return {"sostituti_occupati": busy, "assenze_coperte": covered}
@@ -1,17 +1,82 @@
 """
-Tool custom per l'esecuzione di codice Python in sandbox E2B.
+Tool custom per l'esecuzione di codice Python in sandbox.
+Il backend (E2B o sottoprocesso locale) si sceglie in `src/config.py`.
 """
 
 from datapizza.tools import tool
-from e2b_code_interpreter import Sandbox
 import json
-import os
 import traceback
 from pathlib import Path
-import streamlit as st
+from typing import Any, Dict, Optional
 
 # Import assoluto invece di relativo
-from src.config import E2B_API_KEY, DATA_DIR
+from src.config import SANDBOX_SLOW_CALL_SECONDS
+from src.executors import get_executor, result_cache
+from src.run_context import current_run
+from src.run_events import STATUS, emit
+from src.tracing import span
+from src.utils import file_content_hash
+
+
+def run_generated_code(
+    code: str,
+    file_path: Path,
+    params: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Esegue un programma sul file indicato passando dalla cache dei risultati.
+
+    Returns:
+        Stringa JSON con il contratto success/output/error/traceback
+    """
+    # Stesso codice e parametri sullo stesso contenuto: il risultato è già noto
+    executor = get_executor()
+    with span("sandbox.execute", kind="sandbox", executor=executor.name) as execute_span:
+        file_hash = file_content_hash(file_path)
+        cached = result_cache.get(file_hash, code, params)
+        execute_span.set_attribute("cached", cached is not None)
+        if cached is not None:
+            return cached
+
+        result = executor.execute(code, file_path, params)
+        for key, value in timing_attributes(_payload(result).get("timings")).items():
+            execute_span.set_attribute(key, value)
+        result_cache.put(file_hash, code, result, params)
+        return result
+
+
+def timing_attributes(timings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Tempi per fase riportati dal wrapper come attributi piatti per lo span"""
+    if not isinstance(timings, dict):
+        return {}
+    attributes: Dict[str, Any] = {}
+    for phase, values in (timings.get("phases") or {}).items():
+        attributes[f"timing.{phase}.wall_ms"] = values.get("wall_ms")
+        attributes[f"timing.{phase}.cpu_ms"] = values.get("cpu_ms")
+    if timings.get("peak_rss_mb") is not None:
+        attributes["peak_rss_mb"] = timings["peak_rss_mb"]
+    if timings.get("profile"):
+        attributes["profile"] = json.dumps(timings["profile"], ensure_ascii=False)
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+def slow_call_warning(timings: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Avviso se calcola_sostituzioni ha superato SANDBOX_SLOW_CALL_SECONDS (None altrimenti)"""
+    if not isinstance(timings, dict):
+        return None
+    call = (timings.get("phases") or {}).get("calcola_sostituzioni") or {}
+    seconds = (call.get("wall_ms") or 0) / 1000
+    if seconds <= SANDBOX_SLOW_CALL_SECONDS:
+        return None
+    warning = (
+        f"calcola_sostituzioni ha impiegato {seconds:.1f}s: probabile costo quadratico "
+        "(es. iterrows dentro iterrows); usa 'indice' o filtri vettoriali pandas."
+    )
+    top = (timings.get("profile") or [])[:3]
+    if top:
+        warning += " Più costose: " + ", ".join(f"{row['function']} {row['cumtime_ms']}ms" for row in top)
+    return warning
+
 
 @tool
 def execute_code_in_sandbox(
@@ -19,7 +84,7 @@ def execute_code_in_sandbox(
     file_excel_path: str
 ) -> str:
     """
-    Esegue codice Python generato dall'LLM in una sandbox E2B sicura.
+    Esegue codice Python generato dall'LLM in una sandbox sicura.
     """
     real_file_path = None
     
@@ -36,80 +101,54 @@ def execute_code_in_sandbox(
                 "error": "Impossibile trovare il file Excel. Il path non è stato passato correttamente dal prompt."
             })
         
-        remote_filename = "orario_input.xlsx"
-
-        os.environ["E2B_API_KEY"] = E2B_API_KEY
-        
-        with Sandbox(api_key=E2B_API_KEY) as sandbox:
-            with open(real_file_path, 'rb') as f:
-                sandbox.files.write(remote_filename, f.read())
-
-            if not isinstance(codice_python, str):
-                codice_python = str(codice_python)
-            codice_python = codice_python.replace('\x00', '')
+        if not isinstance(codice_python, str):
+            codice_python = str(codice_python)
+        codice_python = codice_python.replace('\x00', '')
 
-            sandbox.files.write("user_logic.py", codice_python)
+        run = current_run()
+        attempt = 1
+        if run is not None:
+            run.attempts += 1
+            attempt = run.attempts
+        emit(STATUS, "code_generator", f"Codice generato, esecuzione in sandbox (tentativo {attempt})", attempt=attempt)
 
-            # Wrapper con struttura sicura
-            codice_wrapper = f"""
-import pandas as pd
-import json
-import traceback
-import sys
-import os
+        with span("sandbox.attempt", kind="sandbox", attempt=attempt) as attempt_span:
+            result = run_generated_code(codice_python, real_file_path, run.params if run else None)
+            payload = _payload(result)
+            error = None
+            if not payload.get("success"):
+                error = str(payload.get("error") or "errore sconosciuto").splitlines()[0][:200]
+                attempt_span.set_attribute("error", error)
+            attempt_span.set_attribute("success", error is None)
+        # Funzione utente lenta: segnalata all'interfaccia e all'LLM nel risultato del tool
+        warning = slow_call_warning(payload.get("timings"))
+        if warning:
+            emit(STATUS, "code_generator", f"⚠️ {warning}", attempt=attempt)
+            payload["avviso_prestazioni"] = warning
+            result = json.dumps(payload, ensure_ascii=False)
+        if error is None:
+            emit(STATUS, "code_generator", f"Tentativo {attempt} riuscito", attempt=attempt, success=True)
+        else:
+            emit(STATUS, "code_generator", f"Tentativo {attempt} fallito: {error}", attempt=attempt, success=False)
 
-sys.path.append(os.getcwd())
-
-# LOGICA DI ESECUZIONE CONTROLLATA
-try:
-    # Import dinamico del codice utente
-    import user_logic
-
-    # Setup dati
-    remote_filename = '{remote_filename}'
-    df = pd.read_excel(remote_filename, header=0)
-    
-    # Verifica esistenza funzione nel modulo importato
-    if not hasattr(user_logic, 'calcola_sostituzioni'):
-        raise NameError("La funzione 'calcola_sostituzioni(df)' non è stata definita nel codice generato.")
-    
-    # Esecuzione
-    risultati = user_logic.calcola_sostituzioni(df)
-    
-    # Output
-    print(json.dumps({{"success": True, "output": risultati}}, ensure_ascii=False))
-
-except Exception as e:
-    print(json.dumps({{
-        "success": False,
-        "error": str(e),
-        "traceback": traceback.format_exc()
-    }}, ensure_ascii=False))
-"""
-            
-            execution = sandbox.run_code(codice_wrapper)
-            
-            if execution.error:
-                return json.dumps({
-                    "success": False,
-                    "error": f"Errore Runtime Sandbox: {execution.error.name}: {execution.error.value}",
-                    "traceback": execution.error.traceback
-                })
-            
-            output_text = execution.text or ""
-            if not output_text and execution.logs.stdout:
-                output_text = "\n".join(execution.logs.stdout)
-            if execution.logs.stderr:
-                output_text += "\nERR: " + "\n".join(execution.logs.stderr)
-            
-            if not output_text:
-                return json.dumps({"success": False, "error": "Nessun output ricevuto dalla sandbox."})
-            
-            return output_text
+        # Il Code Generator salva in cache l'ultimo programma riuscito
+        if run is not None and payload.get("success"):
+            run.last_success_code = codice_python
+            run.last_success_result = result
+        return result
     
     except Exception as e:
         return json.dumps({
             "success": False,
             "error": f"Errore interno tool: {str(e)}",
             "traceback": traceback.format_exc()
-        })
\ No newline at end of file
+        })
+
+
+def _payload(result: str) -> Dict[str, Any]:
+    """Risultato JSON dell'esecuzione come dizionario ({} se illeggibile)"""
+    try:
+        payload = json.loads(result)
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
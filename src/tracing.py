@@ -0,0 +1,343 @@
+"""
+Tracing end-to-end delle richieste (OpenTelemetry).
+
+datapizza-ai crea già gli span di agenti (`Agent <nome>`), tool (comprese le
+deleghe `can_call`, che sono tool) e chiamate LLM (`client.*`, con modello e
+token). Questo modulo configura il provider e gli exporter (JSON lines e/o
+OTLP verso un collector locale), aggiunge gli span applicativi (passi degli
+agenti, tentativi in sandbox, validazione) e tiene in memoria gli span delle
+richieste recenti per la waterfall della modalità debug.
+
+Con `ENABLE_TRACING=false` non viene installato alcun provider e gli span
+sono no-op.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import ProxyTracerProvider, Status, StatusCode
+
+from src.config import (
+    ENABLE_TRACING,
+    TRACE_EXPORTERS,
+    TRACE_FILE,
+    TRACE_FILE_MAX_MB,
+    TRACE_KEEP_REQUESTS,
+    TRACE_OTLP_ENDPOINT,
+)
+
+SERVICE_NAME = "fabbrica-elfi-ai"
+# Lunghezza massima degli attributi testuali esportati (output dei tool, prompt)
+MAX_ATTRIBUTE_CHARS = 2000
+
+tracer = trace.get_tracer("fabbrica_elfi")
+
+
+def _attributes(span: ReadableSpan) -> Dict[str, Any]:
+    result = {}
+    for key, value in (span.attributes or {}).items():
+        if isinstance(value, str) and len(value) > MAX_ATTRIBUTE_CHARS:
+            value = value[:MAX_ATTRIBUTE_CHARS] + "…"
+        elif isinstance(value, tuple):
+            value = list(value)
+        result[key] = value
+    return result
+
+
+def span_to_dict(span: ReadableSpan) -> Dict[str, Any]:
+    """Span come dizionario JSON (una riga del file di trace)"""
+    context = span.get_span_context()
+    return {
+        "trace_id": f"{context.trace_id:032x}",
+        "span_id": f"{context.span_id:016x}",
+        "parent_id": f"{span.parent.span_id:016x}" if span.parent else None,
+        "name": span.name,
+        "start_ns": span.start_time,
+        "end_ns": span.end_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 2) if span.end_time else None,
+        "status": span.status.status_code.name,
+        "attributes": _attributes(span),
+    }
+
+
+# ========================================
+# EXPORTER E RACCOLTA PER RICHIESTA
+# ========================================
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Scrive uno span per riga in un file JSON lines, con rotazione per dimensione"""
+
+    def __init__(self, path: Path, max_bytes: int = 50 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(json.dumps(span_to_dict(s), ensure_ascii=False, default=str) + "\n" for s in spans)
+        with self._lock:
+            try:
+                if self.path.exists() and self.path.stat().st_size > self.max_bytes:
+                    self.path.replace(self.path.with_suffix(self.path.suffix + ".1"))
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError as e:
+                print(f"⚠️ Scrittura trace fallita: {e}")
+                return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class RequestSpanCollector(SpanProcessor):
+    """Tiene in memoria gli span delle richieste recenti (per trace id)"""
+
+    def __init__(self, max_requests: int = 50):
+        self.max_requests = max_requests
+        self._spans: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, trace_id: int) -> None:
+        with self._lock:
+            self._spans[trace_id] = []
+            while len(self._spans) > self.max_requests:
+                self._spans.popitem(last=False)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        with self._lock:
+            spans = self._spans.get(span.get_span_context().trace_id)
+            if spans is not None:
+                spans.append(span)
+
+    def spans(self, trace_id: int) -> List[ReadableSpan]:
+        with self._lock:
+            return list(self._spans.get(trace_id, []))
+
+
+_collector: Optional[RequestSpanCollector] = None
+_setup_lock = threading.Lock()
+
+
+def setup_tracing() -> bool:
+    """
+    Installa provider ed exporter (una volta per processo).
+
+    Returns:
+        True se il tracing è attivo
+    """
+    global _collector
+    if not ENABLE_TRACING:
+        return False
+    with _setup_lock:
+        if _collector is not None:
+            return True
+        provider = trace.get_tracer_provider()
+        if isinstance(provider, ProxyTracerProvider):
+            provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+            trace.set_tracer_provider(provider)
+        if not isinstance(provider, TracerProvider):
+            print("⚠️ Tracer provider non configurabile, tracing disattivato")
+            return False
+
+        _collector = RequestSpanCollector(TRACE_KEEP_REQUESTS)
+        provider.add_span_processor(_collector)
+        if "jsonl" in TRACE_EXPORTERS:
+            provider.add_span_processor(BatchSpanProcessor(
+                JsonLinesSpanExporter(TRACE_FILE, max_bytes=int(TRACE_FILE_MAX_MB * 1024 * 1024))
+            ))
+        if "otlp" in TRACE_EXPORTERS:
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)))
+            except ImportError:
+                print("⚠️ Export OTLP richiesto ma opentelemetry-exporter-otlp-proto-http non è installato")
+        return True
+
+
+# ========================================
+# SPAN APPLICATIVI
+# ========================================
+
+def _set_attributes(target, attributes: Dict[str, Any]) -> None:
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if not isinstance(value, (str, bool, int, float)):
+            value = str(value)
+        target.set_attribute(key, value)
+
+
+@contextmanager
+def span(name: str, kind: str = "", **attributes: Any) -> Iterator[trace.Span]:
+    """
+    Span figlio di quello corrente; le eccezioni vengono registrate sullo span.
+
+    Args:
+        name: Nome dello span (es. 'sandbox.run')
+        kind: Categoria mostrata nella waterfall (attributo 'type')
+        **attributes: Attributi iniziali (i None sono ignorati)
+    """
+    with tracer.start_as_current_span(name) as current:
+        _set_attributes(current, dict(attributes, type=kind or None))
+        yield current
+
+
+def record_error(error: BaseException) -> None:
+    """Segna lo span corrente come fallito (errori gestiti senza rilanciarli)"""
+    current = trace.get_current_span()
+    current.record_exception(error)
+    current.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+class StepSpans:
+    """
+    Span dei passi di un agente, aperti e chiusi dagli hook before/after_step.
+    Lo span del passo diventa quello corrente: chiamata LLM e tool del passo
+    ne sono figli. datapizza chiama after_step solo se il passo riesce: chi
+    esegue l'agente deve chiamare `abort` quando il run solleva un'eccezione,
+    altrimenti il contesto resta attaccato e gli span successivi del thread
+    avrebbero il padre sbagliato.
+    """
+
+    def __init__(self):
+        self._open: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def start(self, step_context, agent_name: str, step_index: int) -> None:
+        current = tracer.start_span(f"step {agent_name}#{step_index}")
+        _set_attributes(current, {"type": "step", "agent": agent_name, "step": step_index})
+        token = otel_context.attach(trace.set_span_in_context(current))
+        with self._lock:
+            self._open[id(step_context)] = (current, token, threading.get_ident())
+
+    def end(self, step_context, **attributes: Any) -> None:
+        with self._lock:
+            opened = self._open.pop(id(step_context), None)
+        if opened is None:
+            return
+        current, token, _ = opened
+        _set_attributes(current, attributes)
+        self._close(current, token)
+
+    def abort(self, error: Optional[BaseException] = None) -> None:
+        """Chiude, dal più interno, i passi aperti da questo thread e mai conclusi (passo fallito)"""
+        thread = threading.get_ident()
+        with self._lock:
+            keys = [key for key, opened in self._open.items() if opened[2] == thread]
+            leaked = [self._open.pop(key) for key in reversed(keys)]
+        for current, token, _ in leaked:
+            if error is not None:
+                current.record_exception(error)
+                current.set_status(Status(StatusCode.ERROR, str(error)))
+            # Se uno span esterno (es. quello dell'agente) ha già ripristinato il
+            # contesto, staccare il token lo riporterebbe al passo: si chiude soltanto
+            if trace.get_current_span() is current:
+                self._close(current, token)
+            else:
+                current.end()
+
+    @staticmethod
+    def _close(current: trace.Span, token) -> None:
+        current.end()
+        try:
+            otel_context.detach(token)
+        except Exception:
+            pass
+
+
+# ========================================
+# TRACE DI UNA RICHIESTA
+# ========================================
+
+class RequestTrace:
+    """Trace di una richiesta utente (span radice e discendenti)"""
+
+    def __init__(self, trace_id: int = 0):
+        self.trace_id = trace_id
+
+    @property
+    def id(self) -> str:
+        return f"{self.trace_id:032x}" if self.trace_id else ""
+
+    def spans(self) -> List[ReadableSpan]:
+        return request_spans(self.trace_id)
+
+
+@contextmanager
+def request_trace(name: str = "request", **attributes: Any) -> Iterator[RequestTrace]:
+    """Span radice di una richiesta; gli span conclusi restano consultabili per trace id"""
+    if not setup_tracing():
+        yield RequestTrace()
+        return
+    with span(name, kind="request", **attributes) as root:
+        trace_id = root.get_span_context().trace_id
+        _collector.start(trace_id)
+        yield RequestTrace(trace_id)
+
+
+def request_spans(trace_id: int) -> List[ReadableSpan]:
+    """Span conclusi di una richiesta recente (vuoto se sconosciuta o tracing spento)"""
+    if _collector is None or not trace_id:
+        return []
+    return _collector.spans(trace_id)
+
+
+def _details(attributes: Dict[str, Any]) -> str:
+    """Attributi più utili di uno span, su una riga"""
+    parts = []
+    if attributes.get("model_name"):
+        parts.append(str(attributes["model_name"]))
+    if "prompt_tokens_used" in attributes:
+        parts.append(f"{attributes.get('prompt_tokens_used', 0)}→{attributes.get('completion_tokens_used', 0)} token")
+    for key in ("llm_cache", "attempt", "executor", "cached", "success", "count", "error"):
+        if key in attributes:
+            parts.append(f"{key}={attributes[key]}")
+    # Fasi del wrapper in sandbox (timing.<fase>.wall_ms)
+    for key, value in attributes.items():
+        if key.startswith("timing.") and key.endswith(".wall_ms"):
+            parts.append(f"{key[len('timing.'):-len('.wall_ms')]}={value}ms")
+    if "peak_rss_mb" in attributes:
+        parts.append(f"rss={attributes['peak_rss_mb']}MB")
+    return ", ".join(parts)
+
+
+def waterfall(trace_id: int) -> List[Dict[str, Any]]:
+    """
+    Righe della waterfall di una richiesta, in ordine di inizio, con
+    indentazione per profondità e tempi relativi all'inizio della richiesta.
+    """
+    spans = sorted(request_spans(trace_id), key=lambda s: s.start_time)
+    if not spans:
+        return []
+    origin = spans[0].start_time
+    parents = {s.get_span_context().span_id: (s.parent.span_id if s.parent else None) for s in spans}
+
+    def depth(span_id: int) -> int:
+        level = 0
+        while parents.get(span_id) in parents:
+            span_id = parents[span_id]
+            level += 1
+        return level
+
+    rows = []
+    for s in spans:
+        attributes = dict(s.attributes or {})
+        rows.append({
+            "span": "  " * depth(s.get_span_context().span_id) + s.name,
+            "tipo": attributes.get("type", ""),
+            "inizio_ms": round((s.start_time - origin) / 1e6, 1),
+            "durata_ms": round((s.end_time - s.start_time) / 1e6, 1),
+            "stato": s.status.status_code.name,
+            "dettagli": _details(attributes),
+        })
+    return rows
@@ -0,0 +1,297 @@
+"""
+Archivio content-addressed dei file caricati.
+
+Ogni file è salvato una volta sola con il suo SHA-256 come nome
+(`blobs/ab/abcd...xlsx`); le sessioni tengono solo un riferimento all'hash.
+Un garbage collector con reference counting elimina i file non più
+referenziati da nessuna sessione dopo una finestra di retention, insieme
+alle loro copie derivate (es. la cache colonnare).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import DATA_DIR, UPLOAD_RETENTION_HOURS
+
+INDEX_FILENAME = "upload_index.json"
+
+
+class UploadStore:
+    """Archivio content-addressed con riferimenti per sessione e GC"""
+
+    def __init__(
+        self,
+        root: Path,
+        retention_seconds: float = 24 * 3600,
+        gc_interval: float = 600
+    ):
+        """
+        Args:
+            root: Directory base dell'archivio
+            retention_seconds: Tempo per cui un file senza riferimenti (o un
+                riferimento di sessione non più usato) viene conservato
+            gc_interval: Intervallo minimo tra due GC automatici
+        """
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.index_path = self.root / INDEX_FILENAME
+        self.retention_seconds = retention_seconds
+        self.gc_interval = gc_interval
+
+        self._lock = threading.RLock()
+        self._last_gc = 0.0
+        # Callback invocati con l'hash di ogni blob eliminato (cache derivate)
+        self._on_delete: List[Callable[[str], None]] = []
+        # Predicati che tengono in vita il riferimento di una sessione (es. configurazione persistita)
+        self._keep_session: List[Callable[[str], bool]] = []
+
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()
+
+    # ----------------------------------------
+    # Indice persistente
+    # ----------------------------------------
+    def _load_index(self) -> Dict[str, Any]:
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                data.setdefault("blobs", {})
+                data.setdefault("sessions", {})
+                return data
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ Indice upload illeggibile, lo ricostruisco: {e}")
+        return {"blobs": {}, "sessions": {}}
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        tmp_path.replace(self.index_path)
+
+    def blob_path(self, file_hash: str, extension: str = "") -> Path:
+        """Path del blob per un dato hash"""
+        return self.blobs_dir / file_hash[:2] / f"{file_hash}{extension}"
+
+    # ----------------------------------------
+    # API pubblica
+    # ----------------------------------------
+    def put(self, data: bytes, extension: str, session_id: str) -> Path:
+        """
+        Salva un contenuto (se non già presente) e lo associa alla sessione.
+        Un eventuale file referenziato in precedenza dalla sessione viene rilasciato.
+
+        Args:
+            data: Contenuto del file
+            extension: Estensione originale (es. '.xlsx')
+            session_id: ID della sessione che referenzia il file
+
+        Returns:
+            Path del blob content-addressed
+        """
+        file_hash = hashlib.sha256(data).hexdigest()
+        extension = extension.lower()
+        path = self.blob_path(file_hash, extension)
+
+        with self._lock:
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(path.suffix + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                tmp_path.replace(path)
+
+            now = time.time()
+            blob = self._index["blobs"].setdefault(file_hash, {
+                "extension": extension,
+                "size": len(data),
+                "created_at": now,
+            })
+            blob["last_released"] = None
+
+            previous = self._index["sessions"].get(session_id)
+            self._index["sessions"][session_id] = {"hash": file_hash, "touched_at": now}
+            if previous and previous["hash"] != file_hash:
+                self._mark_released(previous["hash"], now)
+
+            self._save_index()
+
+        return path
+
+    def touch(self, session_id: str) -> None:
+        """Segnala che la sessione è ancora attiva (rinnova la retention del riferimento)"""
+        with self._lock:
+            ref = self._index["sessions"].get(session_id)
+            if not ref:
+                return
+            now = time.time()
+            # Scrittura su disco al massimo una volta ogni decimo di retention
+            if now - ref["touched_at"] > self.retention_seconds / 10:
+                ref["touched_at"] = now
+                self._save_index()
+
+    def attach(self, session_id: str, path: Path) -> bool:
+        """
+        Garantisce che la sessione referenzi il blob in `path` e ne rinnova la
+        retention. Da chiamare a ogni rerun: ripristina il riferimento di una
+        sessione ripresa (o scaduta mentre era inattiva) finché il blob esiste.
+
+        Returns:
+            True se il blob è ancora nell'archivio
+        """
+        file_hash = Path(path).stem
+        with self._lock:
+            if file_hash not in self._index["blobs"]:
+                return False
+            ref = self._index["sessions"].get(session_id)
+            if ref and ref["hash"] == file_hash:
+                self.touch(session_id)
+                return True
+            now = time.time()
+            self._index["sessions"][session_id] = {"hash": file_hash, "touched_at": now}
+            self._index["blobs"][file_hash]["last_released"] = None
+            if ref:
+                self._mark_released(ref["hash"], now)
+            self._save_index()
+            return True
+
+    def release(self, session_id: str) -> None:
+        """Rimuove il riferimento della sessione (es. reset configurazione)"""
+        with self._lock:
+            ref = self._index["sessions"].pop(session_id, None)
+            if ref:
+                self._mark_released(ref["hash"], time.time())
+                self._save_index()
+
+    def refcount(self, file_hash: str) -> int:
+        """Numero di sessioni che referenziano un hash"""
+        with self._lock:
+            return sum(1 for ref in self._index["sessions"].values() if ref["hash"] == file_hash)
+
+    def on_delete(self, callback: Callable[[str], None]) -> None:
+        """Registra un callback chiamato con l'hash di ogni blob eliminato dal GC"""
+        self._on_delete.append(callback)
+
+    def keep_session_if(self, predicate: Callable[[str], bool]) -> None:
+        """
+        Registra un predicato consultato dal GC prima di far scadere il
+        riferimento di una sessione inattiva: se restituisce True il
+        riferimento (e quindi il blob) viene conservato.
+        """
+        self._keep_session.append(predicate)
+
+    def _session_kept(self, session_id: str) -> bool:
+        for predicate in self._keep_session:
+            try:
+                if predicate(session_id):
+                    return True
+            except Exception as e:
+                # Nel dubbio il file resta: meglio un blob in più che una sessione rotta
+                print(f"⚠️ Verifica della sessione {session_id} fallita: {e}")
+                return True
+        return False
+
+    def _mark_released(self, file_hash: str, now: float) -> None:
+        blob = self._index["blobs"].get(file_hash)
+        if blob is not None and self.refcount(file_hash) == 0:
+            blob["last_released"] = now
+
+    # ----------------------------------------
+    # Garbage collection
+    # ----------------------------------------
+    def gc(self, force: bool = False, now: Optional[float] = None) -> int:
+        """
+        Elimina i riferimenti di sessione scaduti e i blob senza riferimenti
+        rilasciati da più della retention.
+
+        Args:
+            force: Ignora l'intervallo minimo tra due GC
+            now: Timestamp di riferimento (per test)
+
+        Returns:
+            Numero di blob eliminati
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            if not force and now - self._last_gc < self.gc_interval:
+                return 0
+            self._last_gc = now
+
+            # Sessioni abbandonate (browser chiuso senza reset), salvo quelle
+            # ancora riprendibili: il loro file deve restare disponibile
+            for session_id, ref in list(self._index["sessions"].items()):
+                if now - ref["touched_at"] > self.retention_seconds:
+                    if self._session_kept(session_id):
+                        ref["touched_at"] = now
+                        continue
+                    del self._index["sessions"][session_id]
+                    self._mark_released(ref["hash"], ref["touched_at"])
+
+            referenced = {ref["hash"] for ref in self._index["sessions"].values()}
+            removed = []
+            for file_hash, blob in list(self._index["blobs"].items()):
+                if file_hash in referenced:
+                    continue
+                released = blob.get("last_released") or blob.get("created_at", now)
+                if now - released <= self.retention_seconds:
+                    continue
+                try:
+                    self.blob_path(file_hash, blob.get("extension", "")).unlink(missing_ok=True)
+                except OSError as e:
+                    print(f"⚠️ Impossibile eliminare il blob {file_hash}: {e}")
+                    continue
+                del self._index["blobs"][file_hash]
+                removed.append(file_hash)
+
+            self._save_index()
+
+        for file_hash in removed:
+            for callback in self._on_delete:
+                try:
+                    callback(file_hash)
+                except Exception as e:
+                    print(f"⚠️ Pulizia cache derivata fallita per {file_hash}: {e}")
+
+        return len(removed)
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche dell'archivio (per la modalità debug)"""
+        with self._lock:
+            return {
+                "blobs": len(self._index["blobs"]),
+                "sessions": len(self._index["sessions"]),
+                "bytes": sum(b.get("size", 0) for b in self._index["blobs"].values()),
+            }
+
+
+_stores: Dict[Path, UploadStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_upload_store(root: Optional[Path] = None) -> UploadStore:
+    """
+    Restituisce l'archivio process-wide per una directory, creandolo al primo utilizzo
+    
+    Args:
+        root: Directory base (default: DATA_DIR)
+    """
+    root = Path(root or DATA_DIR).resolve()
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = UploadStore(root, retention_seconds=UPLOAD_RETENTION_HOURS * 3600)
+
+            # Copia colonnare e indice seguono il ciclo di vita del blob da cui derivano
+            from src.schedule_cache import columnar_cache_path, availability_index_path
+            store.on_delete(lambda h: columnar_cache_path(h).unlink(missing_ok=True))
+            store.on_delete(lambda h: availability_index_path(h).unlink(missing_ok=True))
+
+            # Una sessione con configurazione persistita può essere ripresa (?sid=...)
+            from src.state_backend import get_state_backend
+            store.keep_session_if(lambda sid: bool((get_state_backend().load_session(sid) or {}).get("config")))
+            _stores[root] = store
+        return store
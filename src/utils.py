@@ -2,35 +2,73 @@
 Funzioni di utilità generiche
 """
 
+import hashlib
+import os
+import threading
 from pathlib import Path
-from datetime import datetime
+from typing import Dict, Tuple
+
+# Memo degli hash già calcolati: chiave (path, mtime, dimensione)
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_hash_memo_lock = threading.Lock()
+
+
+def file_content_hash(file_path: Path) -> str:
+    """
+    Calcola lo SHA-256 del contenuto di un file.
+    Il risultato è memoizzato finché path, mtime e dimensione non cambiano.
+    
+    Args:
+        file_path: Path del file
+    
+    Returns:
+        Digest esadecimale SHA-256
+    """
+    stat = os.stat(file_path)
+    key = (str(file_path), stat.st_mtime_ns, stat.st_size)
+    with _hash_memo_lock:
+        cached = _hash_memo.get(key)
+    if cached:
+        return cached
+    
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    
+    with _hash_memo_lock:
+        _hash_memo[key] = digest.hexdigest()
+    return _hash_memo[key]
+
 
 def save_uploaded_file(uploaded_file, target_dir: Path, session_id: str) -> Path:
     """
-    Salva un file caricato da Streamlit in una sottocartella dedicata alla sessione.
+    Salva un file caricato da Streamlit nell'archivio content-addressed.
+    File identici (anche da sessioni diverse) vengono salvati una volta sola;
+    la sessione mantiene un riferimento al contenuto.
+    Per gli Excel crea anche la copia colonnare usata dagli esecutori.
     
     Args:
         uploaded_file: File da st.file_uploader
-        target_dir: Directory base (es. app/data)
+        target_dir: Directory base dell'archivio (es. app/data)
         session_id: ID univoco della sessione corrente
     
     Returns:
-        Path completo del file salvato
+        Path completo del file salvato (nome = hash SHA-256 del contenuto)
     """
-    # Creo la directory specifica per la sessione: app/data/{session_id}/
-    session_dir = target_dir / session_id
-    session_dir.mkdir(parents=True, exist_ok=True)
+    from src.upload_store import get_upload_store
     
-    # Genero nome file univoco con timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     file_extension = Path(uploaded_file.name).suffix
-    unique_name = f"orario_{timestamp}{file_extension}"
+    store = get_upload_store(target_dir)
+    file_path = store.put(bytes(uploaded_file.getbuffer()), file_extension, session_id)
     
-    # Costruisco path finale all'interno della cartella di sessione
-    file_path = session_dir / unique_name
+    # Conversione una tantum in Parquet: evita di rileggere l'xlsx a ogni esecuzione
+    if file_extension.lower() == ".xlsx":
+        from src.schedule_cache import build_columnar_cache, build_availability_index
+        build_columnar_cache(file_path)
+        build_availability_index(file_path)
     
-    # Scrivo il file
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # Pulizia opportunistica dei file non più referenziati
+    store.gc()
     
-    return file_path
\ No newline at end of file
+    return file_path